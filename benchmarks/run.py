@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""Time and memory-profile the evaluation on synthetic corpora
+
+For each scale, a synthetic gold and class file are generated (see
+benchmarks/synthetic.py), and the stages of the evaluation are run as in
+tde.eval, each recorded by tde.results.Stages (wall time and peak resident
+memory):
+
+    gold: parse the gold alignments from text, and build the word index
+    gold_cached: load the same gold from its cache
+    disc: read the class file in streaming and feed the measures
+    boundary, grouping, token/type, coverage, ned: compute each measure
+
+Each scale is run in its own process, so that its peak memory and the caches
+of the measures don't depend on the previous scales. With --repeat, the
+fastest of the runs is kept.
+
+The results are printed as a table, and written in JSON with --output. A
+previous output can be given with --baseline: the stages slower than
+`tolerance` times their time in the baseline are reported, and the exit
+status is 1 if there is any.
+
+Example
+-------
+    $ python benchmarks/run.py --scales small medium --output new.json \\
+          --baseline old.json
+
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+
+# so that the benchmarks run on the source tree without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import generate
+
+
+# options of benchmarks/synthetic.py for each scale
+SCALES = OrderedDict([
+    ('small', {
+        'gold': {'n_files': 10, 'n_words': 500, 'n_word_types': 1000},
+        'classes': {'n_fragments': 5000}}),
+    ('medium', {
+        'gold': {'n_files': 50, 'n_words': 2000, 'n_word_types': 5000},
+        'classes': {'n_fragments': 50000}}),
+    ('large', {
+        'gold': {'n_files': 200, 'n_words': 5000, 'n_word_types': 20000},
+        'classes': {'n_fragments': 500000, 'max_cluster_size': 5000}}),
+    # few large clusters of random fragments: the worst case of grouping
+    # and ned, whose numbers of pairs grow with the square of the sizes
+    ('entropy', {
+        'gold': {'n_files': 50, 'n_words': 2000, 'n_word_types': 5000},
+        'classes': {'n_fragments': 50000, 'cluster_size_exponent': 1.3,
+                    'max_cluster_size': 2000, 'purity': 0.1}})])
+
+# the stages whose time is below this, in seconds, are too noisy to be
+# compared with the baseline
+MIN_TIME = 0.05
+
+
+def run_scale(folder, measures=None):
+    """ Evaluate the synthetic corpus generated in `folder`, return the
+    stages and the counts of the evaluation"""
+    from tde.readers.gold_reader import Gold
+    from tde.readers.disc_reader import Disc
+    from tde.evaluation import Evaluation, select_measures, get_counts
+    from tde.results import Stages
+
+    wrd_path, phn_path, disc_path = (
+        os.path.join(folder, 'synthetic.' + extension)
+        for extension in ('wrd', 'phn', 'class'))
+    cache_dir = os.path.join(folder, 'cache')
+
+    # the peak memory of each stage, rather than since the start
+    stages = Stages(reset_memory=True)
+    with stages.stage('gold'):
+        gold = Gold(wrd_path=wrd_path, phn_path=phn_path,
+                    cache_dir=cache_dir)
+        gold.word_index
+    del gold
+    with stages.stage('gold_cached'):
+        gold = Gold(wrd_path=wrd_path, phn_path=phn_path,
+                    cache_dir=cache_dir)
+        gold.word_index
+
+    disc = Disc(disc_path, gold, stream=True, encoded=True)
+    selected = select_measures(gold, disc, measures)
+    with stages.stage('disc'):
+        evaluation = Evaluation(gold, selected.values())
+        evaluation.run(disc.iter_clusters())
+
+    computes = {'boundary': 'compute_boundary',
+                'grouping': 'compute_grouping',
+                'token/type': 'compute_token_type',
+                'coverage': 'compute_coverage',
+                'ned': 'compute_ned'}
+    for name, measure in selected.items():
+        with stages.stage(name):
+            getattr(measure, computes[name])()
+
+    return stages.stages, get_counts(
+        selected, evaluation.n_clusters, evaluation.n_intervals)
+
+
+def _run_scale_process(folder, measures, queue):
+    queue.put(run_scale(folder, measures))
+
+
+def benchmark(scale, measures=None, repeat=1, seed=0):
+    """ Generate the corpus of a scale and benchmark its evaluation
+
+        Input
+        :param scale: name of the scale in SCALES
+        :param measures: list of the measures to compute, all if None
+        :param repeat: number of runs, the fastest run of each stage is kept
+        :param seed: seed of the synthetic corpus
+        Output
+        :return: OrderedDict with the options of the scale, the sizes of
+                 the files, the counts of the evaluation and its stages
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = generate(folder, seed=seed,
+                         gold_options=SCALES[scale]['gold'],
+                         class_options=SCALES[scale]['classes'])
+        result = OrderedDict([
+            ('scale', scale),
+            ('options', SCALES[scale]),
+            ('sizes', OrderedDict(
+                (os.path.basename(path), os.path.getsize(path))
+                for path in paths)),
+            ('counts', None),
+            ('stages', None)])
+
+        for _ in range(repeat):
+            # the cache of the gold is rebuilt at each run
+            shutil.rmtree(os.path.join(folder, 'cache'), ignore_errors=True)
+
+            queue = context.Queue()
+            process = context.Process(
+                target=_run_scale_process, args=(folder, measures, queue))
+            process.start()
+            stages, counts = queue.get()
+            process.join()
+
+            result['counts'] = counts
+            if result['stages'] is None:
+                result['stages'] = stages
+            else:
+                for name, stage in stages.items():
+                    if stage['wall_time'] < \
+                       result['stages'][name]['wall_time']:
+                        result['stages'][name] = stage
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """ Return the list of (scale, stage, time, baseline time) of the
+    stages slower than `tolerance` times their time in the baseline"""
+    baseline = {result['scale']: result for result in baseline}
+    regressions = []
+    for result in results:
+        if result['scale'] not in baseline:
+            continue
+        reference = baseline[result['scale']]['stages']
+        for name, stage in result['stages'].items():
+            if name not in reference:
+                continue
+            time, ref_time = stage['wall_time'], reference[name]['wall_time']
+            if time > MIN_TIME and time > tolerance * ref_time:
+                regressions.append((result['scale'], name, time, ref_time))
+    return regressions
+
+
+def print_table(results, fout=sys.stdout):
+    """ Print the wall time and peak memory of each stage of each scale"""
+    fout.write('{:<8} {:<12} {:>10} {:>12}\n'.format(
+        'scale', 'stage', 'time (s)', 'memory (MB)'))
+    for result in results:
+        for name, stage in result['stages'].items():
+            memory = stage['peak_memory']
+            fout.write('{:<8} {:<12} {:>10.3f} {:>12}\n'.format(
+                result['scale'], name, stage['wall_time'],
+                '-' if memory is None else '{:.1f}'.format(memory / 2**20)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the evaluation on synthetic corpora')
+    parser.add_argument('--scales', '-s', nargs='+', default=['small'],
+                        choices=list(SCALES),
+                        help='scales to benchmark (default: small)')
+    parser.add_argument('--measures', '-m', nargs='*', default=None,
+                        help='measures to compute (default: all)')
+    parser.add_argument('--repeat', '-r', default=1, type=int,
+                        help='number of runs of each scale, the fastest is'
+                        ' kept (default: 1)')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--output', '-o', default=None, type=str,
+                        help='JSON file in which to write the results')
+    parser.add_argument('--baseline', '-b', default=None, type=str,
+                        help='JSON output of a previous run to compare with')
+    parser.add_argument('--tolerance', '-t', default=1.2, type=float,
+                        help='a stage slower than tolerance times its time'
+                        ' in the baseline is a regression (default: 1.2)')
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        print('Benchmarking {}...'.format(scale), file=sys.stderr)
+        results.append(benchmark(scale, args.measures, args.repeat,
+                                 args.seed))
+    print_table(results)
+
+    if args.output is not None:
+        with open(args.output, 'w') as fout:
+            json.dump(results, fout, indent=2)
+            fout.write('\n')
+
+    if args.baseline is not None:
+        with open(args.baseline) as fin:
+            regressions = compare(results, json.load(fin), args.tolerance)
+        for scale, name, time, ref_time in regressions:
+            print('regression: {} {} {:.3f}s, was {:.3f}s'.format(
+                scale, name, time, ref_time), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""Generate synthetic gold alignments and class files
+
+The gold is a sequence of words in each file, separated by silences, drawn
+from a lexicon of word types whose frequencies follow a Zipf law. Each word
+type is a random sequence of phones. The alignments are written in the
+format of tde/share (see docs/source/usage/format.rst), with timestamps
+rounded to the centisecond.
+
+The discovered clusters are built from the gold words: each cluster has a
+word type, and each of its fragments is, with probability `purity`, a token
+of this type, and otherwise a random span of phones. The lower the purity,
+the higher the entropy of the ngrams in the clusters. The sizes of the
+clusters follow a Zipf law of exponent `cluster_size_exponent`, the lower
+the exponent, the more large clusters. The boundaries of the fragments are
+moved by up to `jitter` seconds.
+
+Example
+-------
+    $ python benchmarks/synthetic.py out/ --n-files 20 --n-words 2000 \\
+          --n-fragments 50000
+
+writes out/synthetic.wrd, out/synthetic.phn and out/synthetic.class.
+
+"""
+
+import os
+import argparse
+import numpy as np
+
+
+def generate_gold(n_files=10, n_words=1000, n_phone_types=40,
+                  n_word_types=2000, word_type_exponent=1.1,
+                  silence_rate=0.2, seed=0):
+    """ Generate the gold words and phones
+
+        Input
+        :param n_files: number of files
+        :param n_words: number of words in each file
+        :param n_phone_types: number of distinct phones, without SIL
+        :param n_word_types: number of word types in the lexicon
+        :param word_type_exponent: exponent of the Zipf law of the word
+                                   types frequencies
+        :param silence_rate: probability of a silence after each word
+        :param seed: seed of the random generator
+        Output
+        :return: words, phones, two lists of (fname, onset, offset,
+                 symbol), and the word type of each word
+    """
+    rng = np.random.RandomState(seed)
+    phone_types = ['p{}'.format(ix) for ix in range(n_phone_types)]
+    lexicon = [tuple(rng.randint(0, n_phone_types, size=length).tolist())
+               for length in rng.randint(2, 9, size=n_word_types)]
+    weights = 1.0 / np.arange(1, n_word_types + 1) ** word_type_exponent
+    weights /= weights.sum()
+
+    words, phones, word_types = [], [], []
+    for file_ix in range(n_files):
+        fname = 'f{:04d}'.format(file_ix)
+        time = 0
+        for word_type in rng.choice(n_word_types, size=n_words, p=weights):
+            # durations in centiseconds, so that the timestamps are exact
+            if rng.random_sample() < silence_rate:
+                duration = rng.randint(10, 50)
+                phones.append((fname, time / 100, (time + duration) / 100,
+                               'SIL'))
+                time += duration
+            onset = time
+            for phone in lexicon[word_type]:
+                duration = rng.randint(4, 16)
+                phones.append((fname, time / 100, (time + duration) / 100,
+                               phone_types[phone]))
+                time += duration
+            words.append((fname, onset / 100, time / 100,
+                           'w{}'.format(word_type)))
+            word_types.append(word_type)
+    return words, phones, word_types
+
+
+def generate_classes(words, phones, word_types, n_fragments=10000,
+                     cluster_size_exponent=2.0, max_cluster_size=1000,
+                     purity=0.5, jitter=0.02, seed=0):
+    """ Generate discovered clusters from the gold
+
+        Input
+        :param words, phones, word_types: the gold, see `generate_gold`
+        :param n_fragments: number of discovered fragments
+        :param cluster_size_exponent: exponent of the Zipf law of the
+                                      cluster sizes, larger than 1
+        :param max_cluster_size: maximal size of a cluster
+        :param purity: probability that a fragment is a token of the word
+                       type of its cluster
+        :param jitter: maximal shift of the boundaries, in seconds
+        :param seed: seed of the random generator
+        Output
+        :return: list of clusters, each a list of (fname, onset, offset)
+    """
+    rng = np.random.RandomState(seed)
+    word_types = np.asarray(word_types)
+    tokens = {}
+    for word_ix, word_type in enumerate(word_types.tolist()):
+        tokens.setdefault(word_type, []).append(word_ix)
+    types = list(tokens)
+
+    clusters, n_generated = [], 0
+    while n_generated < n_fragments:
+        size = min(int(rng.zipf(cluster_size_exponent)) + 1,
+                   max_cluster_size, n_fragments - n_generated + 1)
+        cluster_type = types[rng.randint(len(types))]
+        cluster = []
+        for _ in range(size):
+            if rng.random_sample() < purity:
+                fname, onset, offset, _ = words[
+                    tokens[cluster_type][rng.randint(
+                        len(tokens[cluster_type]))]]
+            else:
+                # a random span of 1 to 8 phones
+                start = rng.randint(len(phones))
+                stop = min(start + rng.randint(1, 9), len(phones))
+                while phones[stop - 1][0] != phones[start][0]:
+                    stop -= 1
+                fname, onset = phones[start][:2]
+                offset = phones[stop - 1][2]
+            shift = rng.uniform(-jitter, jitter, size=2)
+            onset = max(0.0, round(onset + float(shift[0]), 2))
+            offset = max(round(onset + 0.01, 2),
+                         round(offset + float(shift[1]), 2))
+            cluster.append((fname, onset, offset))
+        clusters.append(cluster)
+        n_generated += size
+    return clusters
+
+
+def write_alignment(intervals, path):
+    """ Write (fname, onset, offset, symbol) intervals in an alignment"""
+    with open(path, 'w') as fout:
+        for fname, onset, offset, symbol in intervals:
+            fout.write('{} {!r} {!r} {}\n'.format(
+                fname, onset, offset, symbol))
+
+
+def write_classes(clusters, path):
+    """ Write clusters of (fname, onset, offset) in a class file"""
+    with open(path, 'w') as fout:
+        for class_number, cluster in enumerate(clusters):
+            fout.write('Class {}\n'.format(class_number))
+            for fname, onset, offset in cluster:
+                fout.write('{} {!r} {!r}\n'.format(fname, onset, offset))
+            fout.write('\n')
+
+
+def generate(output, name='synthetic', seed=0, gold_options=None,
+             class_options=None):
+    """ Generate and write a synthetic gold and class file
+
+        Input
+        :param output: folder in which the files are written
+        :param name: the files are <name>.wrd, <name>.phn and <name>.class
+        :param gold_options: dict of the options of `generate_gold`
+        :param class_options: dict of the options of `generate_classes`
+        Output
+        :return: the paths (wrd_path, phn_path, class_path)
+    """
+    words, phones, word_types = generate_gold(
+        seed=seed, **(gold_options or {}))
+    clusters = generate_classes(
+        words, phones, word_types, seed=seed, **(class_options or {}))
+
+    paths = tuple(os.path.join(output, '{}.{}'.format(name, extension))
+                  for extension in ('wrd', 'phn', 'class'))
+    write_alignment(words, paths[0])
+    write_alignment(phones, paths[1])
+    write_classes(clusters, paths[2])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic gold and class file')
+    parser.add_argument('output', type=str,
+                        help='folder in which the files are written')
+    parser.add_argument('--name', default='synthetic', type=str)
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--n-files', default=10, type=int)
+    parser.add_argument('--n-words', default=1000, type=int,
+                        help='number of words in each file')
+    parser.add_argument('--n-phone-types', default=40, type=int)
+    parser.add_argument('--n-word-types', default=2000, type=int)
+    parser.add_argument('--n-fragments', default=10000, type=int)
+    parser.add_argument('--cluster-size-exponent', default=2.0, type=float,
+                        help='the lower, the more large clusters')
+    parser.add_argument('--max-cluster-size', default=1000, type=int)
+    parser.add_argument('--purity', default=0.5, type=float,
+                        help='the lower, the higher the ngram entropy of'
+                        ' the clusters')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for path in generate(
+            args.output, args.name, args.seed,
+            {'n_files': args.n_files, 'n_words': args.n_words,
+             'n_phone_types': args.n_phone_types,
+             'n_word_types': args.n_word_types},
+            {'n_fragments': args.n_fragments,
+             'cluster_size_exponent': args.cluster_size_exponent,
+             'max_cluster_size': args.max_cluster_size,
+             'purity': args.purity}):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,9 @@ setuptools.setup(
     # packages for code and data
     packages=setuptools.find_packages(),
     package_data={'tde': ['share/*']},
+    entry_points={'console_scripts': ['tde = tde.eval:main',
+                                      'tde-batch = tde.batch:main',
+                                      'tde-server = tde.server:main']},
 
     # metadata for upload to PyPI
     author='Julien Karadayi, INRIA',
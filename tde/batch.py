@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""Evaluate many class files against one gold
+
+`tde.eval` reads the gold of the corpus for each class file it evaluates.
+When many class files are evaluated on the same corpus (for instance the
+checkpoints of a training), :func:`evaluate_many` reads the gold once, and
+evaluates each class file with it, optionally in several processes. The
+processes are forked after the gold is read, so that they share its memory
+(copy on write) instead of reading it again.
+
+The results of all the class files are gathered in a single table, with one
+row per class file, and the columns of tde.results.Results.to_row (scores,
+counts, timings), written by :func:`write_table` in csv.
+
+Example
+-------
+    $ tde-batch mandarin checkpoints/*.class --output scores.csv
+
+    gold = Gold(wrd_path=wrd_path, phn_path=phn_path)
+    rows = evaluate_many(gold, ['epoch1.class', 'epoch2.class'], njobs=2)
+    write_table(rows, 'scores.csv')
+
+"""
+
+import os
+import sys
+import csv
+import glob
+import argparse
+import multiprocessing
+from collections import OrderedDict
+
+from tde.corpora import CORPORA, corpus_paths
+from tde.readers.gold_reader import Gold
+from tde.readers.disc_reader import Disc
+from tde.measures import MEASURES
+from tde.evaluation import Evaluation, select_measures, compute_measures
+from tde.results import Results, Stages
+
+
+# the gold used by the processes of evaluate_many
+_gold = None
+
+
+def evaluate(gold, disc_path, measures=None, njobs=1):
+    """ Evaluate one class file
+
+        Input
+        :param gold: Gold object, contains the gold words and phones
+        :param disc_path: path to the class file
+        :param measures: list of names of the measures to compute (see
+                         tde.evaluation.MEASURES), all of them if None
+        :param njobs: number of cpus used in grouping and ned
+        Output
+        :return: OrderedDict of the scores, see tde.evaluation.get_scores
+    """
+    return evaluate_results(gold, disc_path, measures, njobs).scores
+
+
+def evaluate_results(gold, disc_path, measures=None, njobs=1, corpus=None,
+                     progress=None):
+    """ Evaluate one class file, and return all its results
+
+        The class file is read in streaming, with integer coded phones, and
+        all the measures are fed in a single pass, as in tde.eval.
+
+        Input
+        :param gold, disc_path, measures, njobs: see `evaluate`
+        :param corpus: name of the corpus of the gold, for the results
+        :param progress: tde.progress.Progress reporting the progress of the
+                         evaluation to its callbacks, nothing is reported if
+                         None
+        Output
+        :return: tde.results.Results of the class file, with the stages
+                 disc and each measure
+    """
+    stages = progress if progress is not None else Stages()
+    disc = Disc(disc_path, gold, stream=True, encoded=True)
+    selected = select_measures(gold, disc, measures, njobs=njobs)
+    with stages.stage('disc'):
+        evaluation = Evaluation(gold, selected.values())
+        evaluation.run(disc.iter_clusters())
+    for name in selected:
+        with stages.stage(name):
+            compute_measures({name: selected[name]})
+    return Results.from_measures(
+        selected, corpus, disc_path, evaluation.n_clusters,
+        evaluation.n_intervals, stages)
+
+
+def _init_worker(gold):
+    global _gold
+    _gold = gold
+
+
+def _evaluate_row(args):
+    """ Evaluate a class file with the gold of the process, and return its
+    row of the table. A class file that can't be evaluated gives a row with
+    the error instead of the scores."""
+    disc_path, measures, corpus = args
+    row = OrderedDict([('class_file', disc_path), ('error', '')])
+    try:
+        row.update(evaluate_results(
+            _gold, disc_path, measures, corpus=corpus).to_row())
+    except (OSError, KeyError, ValueError, AssertionError) as err:
+        row['error'] = '{}: {}'.format(type(err).__name__, err)
+    return row
+
+
+def evaluate_many(gold, disc_paths, measures=None, njobs=1, corpus=None):
+    """ Evaluate several class files with the same gold
+
+        Input
+        :param gold: Gold object, contains the gold words and phones
+        :param disc_paths: list of paths to the class files
+        :param measures: list of names of the measures to compute (see
+                         tde.evaluation.MEASURES), all of them if None
+        :param njobs: number of processes evaluating class files at the
+                      same time. The processes are forked when possible, so
+                      that they share the gold.
+        :param corpus: name of the corpus of the gold, for the results
+        Output
+        :return: list of OrderedDict, the row of each class file, in the
+                 order of disc_paths, with the columns class_file, error
+                 (empty if the class file was evaluated) and the columns of
+                 its results (see tde.results.Results.to_row)
+    """
+    tasks = [(disc_path, measures, corpus) for disc_path in disc_paths]
+    if njobs == 1 or len(tasks) < 2:
+        _init_worker(gold)
+        return [_evaluate_row(task) for task in tasks]
+
+    # the word index is built before forking, so that it is shared too
+    assert gold.word_index is not None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    with context.Pool(min(njobs, len(tasks)), initializer=_init_worker,
+                      initargs=(gold,)) as pool:
+        return pool.map(_evaluate_row, tasks, chunksize=1)
+
+
+def write_table(rows, output):
+    """ Write the rows returned by `evaluate_many` in csv, with one row
+    per class file. The columns are those of the first row with scores.
+
+        Input
+        :param rows: list of OrderedDict, the rows of the table
+        :param output: path of the csv file, or '-' for the standard output
+    """
+    columns = ['class_file', 'error']
+    for row in rows:
+        if len(row) > len(columns):
+            columns = list(row)
+            break
+
+    fout = sys.stdout if output == '-' else open(output, 'w', newline='')
+    try:
+        writer = csv.DictWriter(fout, columns, restval='nan')
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if fout is not sys.stdout:
+            fout.close()
+
+
+def list_class_files(paths):
+    """ Expand the given paths: a directory gives all the files it contains,
+    and a glob pattern the files it matches"""
+    disc_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            disc_paths.extend(sorted(
+                os.path.join(path, fname) for fname in os.listdir(path)
+                if os.path.isfile(os.path.join(path, fname))))
+        elif not os.path.exists(path) and glob.has_magic(path):
+            disc_paths.extend(sorted(glob.glob(path)))
+        else:
+            disc_paths.append(path)
+    return disc_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='tde-batch',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='Evaluate many spoken term discovery outputs on the'
+        ' same corpus',
+        epilog="""Example usage:
+
+    $ tde-batch mandarin checkpoints/ --njobs 4 --output scores.csv
+
+    reads the mandarin gold once, evaluates all the class files in
+    `checkpoints/` with 4 processes, and writes the scores of all the class
+    files in `scores.csv`, one row per class file.
+    """)
+    parser.add_argument('corpus', metavar='language', type=str,
+                        choices=CORPORA,
+                        help='Choose the corpus you want to evaluate')
+    parser.add_argument('disc_clsfiles', metavar='discovered', type=str,
+                        nargs='+',
+                        help="class files, directories of class files or"
+                        " glob patterns")
+    parser.add_argument('--measures', '-m',
+                        nargs='*',
+                        default=[],
+                        choices=MEASURES)
+    parser.add_argument('--njobs', '-n',
+                        default=1,
+                        type=int,
+                        help="number of class files evaluated at the same"
+                        " time")
+    parser.add_argument('--cache-dir', type=str,
+                        default=os.environ.get(
+                            'TDE_CACHE_DIR', os.path.join(
+                                os.path.expanduser('~'), '.cache', 'tde')),
+                        help="directory in which the parsed gold alignments"
+                        " are cached (default: $TDE_CACHE_DIR or"
+                        " ~/.cache/tde)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always parse the gold alignments from text")
+    parser.add_argument('--output', '-o', type=str, default='-',
+                        help="csv file in which to write the scores"
+                        " (default: standard output)")
+    args = parser.parse_args()
+
+    disc_paths = list_class_files(args.disc_clsfiles)
+    if len(disc_paths) == 0:
+        parser.error('no class file found')
+
+    wrd_path, phn_path = corpus_paths(args.corpus)
+    gold = Gold(wrd_path=wrd_path, phn_path=phn_path,
+                cache_dir=None if args.no_cache else args.cache_dir)
+
+    rows = evaluate_many(gold, disc_paths, args.measures, args.njobs,
+                         args.corpus)
+    write_table(rows, args.output)
+
+    n_errors = sum(1 for row in rows if row['error'])
+    if n_errors > 0:
+        print('{} class files could not be evaluated'.format(n_errors),
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
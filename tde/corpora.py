@@ -0,0 +1,35 @@
+"""The corpora whose gold alignments are shipped with tde
+
+The gold alignments of each corpus are in `tde/share`, as `<corpus>.wrd`
+and `<corpus>.phn`. They are found with importlib.resources, which is much
+faster to import than pkg_resources, and only imported when a path is
+needed, so that this module can be imported by the command line tools
+before their arguments are parsed.
+
+"""
+
+import os
+
+
+# the corpora whose gold alignments are shipped in tde/share
+CORPORA = ('buckeye', 'english', 'french', 'mandarin')
+
+
+def share_path(name):
+    """ Return the path of the file `name` in tde/share"""
+    try:
+        from importlib.resources import files
+    except ImportError:  # python < 3.9
+        return os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'share', name)
+    return str(files('tde') / 'share' / name)
+
+
+def corpus_paths(corpus):
+    """ Return the paths (wrd_path, phn_path) of the gold word and phone
+    alignments of one of the CORPORA"""
+    if corpus not in CORPORA:
+        raise ValueError('{}: unknown corpus, choose one of {}'.format(
+            corpus, ', '.join(CORPORA)))
+    return (share_path('{}.wrd'.format(corpus)),
+            share_path('{}.phn'.format(corpus)))
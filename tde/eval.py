@@ -1,15 +1,13 @@
 #!/usr/bin/env python
-import time
+import os
 import argparse
-import pkg_resources 
 
-from tde.measures.ned import *
-from tde.measures.boundary import *
-from tde.measures.grouping import *
-from tde.measures.coverage import *
-from tde.measures.token_type import *
-from tde.readers.gold_reader import *
-from tde.readers.disc_reader import *
+# the readers and the measures are imported once the arguments are parsed,
+# and only the selected measures are, so that the dependencies of the other
+# ones are not imported (see test/test_imports.py)
+from tde.corpora import CORPORA, corpus_paths
+from tde.measures import MEASURES
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -20,8 +18,8 @@ def main():
     
     $ ./english_eval2 my_sample.classes resultsdir/
     
-    evaluates STD output `my_sample.classes` on the english dataset and stores the
-    output in `resultsdir/`.
+    evaluates STD output `my_sample.classes` on the english dataset and
+    stores the output in `resultsdir/`.
     
     Classfiles must be formatted like this:
     
@@ -36,70 +34,171 @@ def main():
     """)
     parser.add_argument('disc_clsfile', metavar='discovered', type=str)
     parser.add_argument('corpus', metavar='language', type=str, 
-                        choices=['buckeye', 'english', 'french',
-                                 'mandarin'],
+                        choices=CORPORA,
                         help='Choose the corpus you want to evaluate')
     parser.add_argument('--measures', '-m',
                         nargs='*',
                         default=[],
-                        choices=['boundary', 'grouping', 
-                                 'token/type', 'coverage',
-                                 'ned'])
+                        choices=MEASURES)
     parser.add_argument('--njobs', '-n',
                         default=1,
                         type=int,
-                        help="number of cpus to be used in grouping")
+                        help="number of cpus to be used in grouping and ned")
+    parser.add_argument('--cache-dir', type=str,
+                        default=os.environ.get(
+                            'TDE_CACHE_DIR', os.path.join(
+                                os.path.expanduser('~'), '.cache', 'tde')),
+                        help="directory in which the parsed gold alignments"
+                        " are cached (default: $TDE_CACHE_DIR or"
+                        " ~/.cache/tde)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always parse the gold alignments from text")
+    parser.add_argument('--mmap', action='store_true',
+                        help="memory map the cached gold alignments instead"
+                        " of loading them, to share them between concurrent"
+                        " evaluations")
+    parser.add_argument('--state', type=str, default=None,
+                        help="state file of a previous evaluation: only the"
+                        " clusters that changed since are evaluated, and the"
+                        " state is updated")
+    parser.add_argument('--format', '-f', nargs='+',
+                        default=['text', 'json'],
+                        choices=['text', 'json', 'csv', 'parquet'],
+                        help="formats of the output: a text file per"
+                        " measure, and/or all the scores, counts and"
+                        " timings in results.json, results.csv or"
+                        " results.parquet (default: text json)")
+    parser.add_argument('--approximate', type=int, default=None,
+                        metavar='BUDGET',
+                        help="estimate the ned from BUDGET sampled pairs,"
+                        " with a 95%% confidence interval, instead of"
+                        " computing it exactly. For quick checks during"
+                        " development, not for published results")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the sampling of --approximate"
+                        " (default: 0)")
+    parser.add_argument('--boundary-tolerance', type=float, default=0,
+                        metavar='SECONDS',
+                        help="count a discovered boundary as correct if it"
+                        " is at most SECONDS from a gold boundary, for"
+                        " instance 0.02 (default: 0, it must be on a gold"
+                        " boundary)")
+    parser.add_argument('--quiet', '-q', action='store_true',
+                        help="don't report the progress of the evaluation")
+    parser.add_argument('--stage-memory', action='store_true',
+                        help="reset the peak memory of the process at each"
+                        " stage, so that the peak memory of each stage is"
+                        " reported instead of the peak since the start"
+                        " (Linux only, implied by --profile)")
+    parser.add_argument('--profile', type=str, default=None,
+                        choices=('gold', 'disc', 'incremental') + MEASURES,
+                        help="profile one stage of the evaluation")
+    parser.add_argument('--profiler', default='cprofile',
+                        choices=['cprofile', 'pyinstrument'],
+                        help="profiler used by --profile (default: cprofile)")
+    parser.add_argument('--profile-output', type=str, default=None,
+                        help="file in which the profile is written (default:"
+                        " <stage>.prof, or <stage>.txt with pyinstrument,"
+                        " in the output folder)")
     parser.add_argument('output', type=str,
                         help="path in which to write the output")
 
     args = parser.parse_args()
+    if args.approximate is not None and args.state is not None:
+        parser.error('--approximate can not be used with --state')
+    if args.approximate is not None and args.approximate < 1:
+        parser.error('the budget of --approximate should be positive')
+    if args.boundary_tolerance < 0:
+        parser.error('--boundary-tolerance should not be negative')
+
+    from tde.readers.gold_reader import Gold
+    from tde.readers.disc_reader import Disc
+    from tde.evaluation import Evaluation, select_measures
+    from tde.results import Results
+    from tde.progress import Progress
+
+    # the wall time and peak memory of each stage of the evaluation, and
+    # the reports of their progress
+    profile_output = args.profile_output
+    if args.profile is not None and profile_output is None:
+        profile_output = os.path.join(args.output, '{}.{}'.format(
+            args.profile.replace('/', '_'),
+            'prof' if args.profiler == 'cprofile' else 'txt'))
+    progress = Progress(silent=args.quiet, profile=args.profile,
+                        profile_output=profile_output, profiler=args.profiler,
+                        reset_memory=(args.stage_memory
+                                      or args.profile is not None))
+    log = print if not args.quiet else (lambda *_: None)
 
     # load the corpus alignments
-    wrd_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/{}.wrd'.format(args.corpus))
-    phn_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/{}.phn'.format(args.corpus))
- 
-    print('Reading gold')
-    gold = Gold(wrd_path=wrd_path, 
-                phn_path=phn_path)
-
-    print('Reading discovered classes')
-    disc = Disc(args.disc_clsfile, gold) 
+    wrd_path, phn_path = corpus_paths(args.corpus)
+
+    log('Reading gold')
+    with progress.stage('gold'):
+        gold = Gold(wrd_path=wrd_path,
+                    phn_path=phn_path,
+                    cache_dir=None if args.no_cache else args.cache_dir,
+                    mmap=args.mmap and not args.no_cache)
+        # built here so that it is counted in the time of the gold
+        gold.word_index
 
     measures = args.measures
     output = args.output
 
-    # Launch evaluation of each metric and write it 
-    # in the output
-    if len(measures) == 0 or "boundary" in measures:
-        print('Computing Boundary...')
-        boundary = Boundary(gold, disc, output)
-        boundary.compute_boundary()
-        boundary.write_score()
-    if len(measures) == 0 or "grouping" in measures:
-        print('Computing Grouping...')
-        grouping = Grouping(disc, output, args.njobs)
-        grouping.compute_grouping()
-        grouping.write_score()
-    if len(measures) == 0 or "token/type" in measures:
-        print('Computing Token and Type...')
-        token_type = TokenType(gold, disc, output)
-        token_type.compute_token_type()
-        token_type.write_score()
-    if len(measures) == 0 or "coverage" in measures:
-        print('Computing Coverage...')
-        coverage = Coverage(gold, disc, output)
-        coverage.compute_coverage()
-        coverage.write_score()
-    if len(measures) == 0 or "ned" in measures:
-        print('Computing NED...')
-        ned = Ned(disc, output)
-        ned.compute_ned()
-        ned.write_score()
+    # the class file is read in streaming, with integer coded phones, and
+    # all the measures are fed in a single pass
+    log('Reading discovered classes')
+    disc = Disc(args.disc_clsfile, gold, stream=True, encoded=True)
 
-    
-if __name__ == "__main__": 
+    # Create each requested measure
+    selected = select_measures(gold, disc, measures, output, args.njobs,
+                               args.approximate, args.seed,
+                               args.boundary_tolerance)
+
+    if args.state is not None:
+        # the measures are computed from the statistics of the state
+        from tde.incremental import IncrementalEvaluation
+        with progress.stage('incremental'):
+            evaluation = IncrementalEvaluation(gold, selected, args.state)
+            evaluation.run(args.disc_clsfile)
+        log("Discovered Class file read\n")
+        log("{} clusters evaluated, {} removed".format(
+            evaluation.n_evaluated, evaluation.n_removed))
+        n_clusters = sum(count for count, cluster
+                         in evaluation.state['clusters'].values()
+                         if len(cluster['intervals']) > 0)
+        n_intervals = len(evaluation.state['intervals'])
+    else:
+        with progress.stage('disc'):
+            evaluation = Evaluation(gold, selected.values())
+            evaluation.run(disc.iter_clusters())
+        log("Discovered Class file read\n")
+        log("{} unique intervals found".format(evaluation.n_intervals))
+        for class_number, size, share in evaluation.dominating_clusters():
+            log("Warning: class {} has {} intervals, {:.0%} of the pairs"
+                " of all the classes".format(class_number, size, share))
+        n_clusters, n_intervals = evaluation.n_clusters, evaluation.n_intervals
+
+        # Launch evaluation of each metric
+        computes = [("boundary", 'Boundary', 'compute_boundary'),
+                    ("grouping", 'Grouping', 'compute_grouping'),
+                    ("token/type", 'Token and Type', 'compute_token_type'),
+                    ("coverage", 'Coverage', 'compute_coverage'),
+                    ("ned", 'NED', 'compute_ned')]
+        for name, title, compute in computes:
+            if name in selected:
+                log('Computing {}...'.format(title))
+                with progress.stage(name):
+                    getattr(selected[name], compute)()
+
+    # and write them in the output
+    if 'text' in args.format:
+        for measure in selected.values():
+            measure.write_score()
+    Results.from_measures(
+        selected, args.corpus, args.disc_clsfile, n_clusters, n_intervals,
+        progress).write(output, [fmt for fmt in args.format if fmt != 'text'])
+
+
+if __name__ == "__main__":
     main()
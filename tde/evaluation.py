@@ -0,0 +1,269 @@
+"""Compute several measures in a single pass over the discovered clusters
+
+:class:`Evaluation` reads the discovered clusters once, in batches, and
+gives each batch to all the selected measures through their accumulator
+interface (`Measure.update_batch`). The facts about the intervals of a
+batch that several measures need (the new distinct intervals, their
+boundaries, their gold word and its transcription) are computed once per
+batch in an :class:`IntervalFacts`, and shared by all the measures.
+
+Example
+-------
+    gold = Gold(wrd_path=wrd_path, phn_path=phn_path)
+    disc = Disc(disc_path, gold, stream=True)
+    ned, coverage = Ned(disc), Coverage(gold, disc)
+    evaluation = Evaluation(gold, [ned, coverage])
+    evaluation.run(disc.iter_clusters())
+    ned.compute_ned()
+    coverage.compute_coverage()
+
+The measures selected by name, as in tde.eval, are created with
+`select_measures`, computed with `compute_measures` and their scores read
+with `get_scores`.
+
+"""
+
+import math
+import heapq
+from collections import OrderedDict
+
+from tde.measures import MEASURES
+from tde.measures.facts import IntervalFacts
+
+
+class Evaluation():
+    """ Feed the discovered clusters to several measures in one pass
+
+    Attributes
+    ----------
+    :param gold: Gold object, contains the gold words and phones
+    :param measures: list of Measure, the measures to feed. They must be
+                     created with a Disc read in streaming, so that they
+                     don't already contain the discovered intervals.
+    :param batch_size: int, minimal number of intervals in each batch
+    :param seen: set of the (fname, disc_on, disc_off) of the intervals
+                 already given to the measures
+    :param n_clusters: number of clusters given to the measures
+    :param n_pairs: number of pairs of intervals of the clusters
+    :param largest: the n_largest clusters with the most pairs, as a heap
+                    of (n_pairs, index, class_number, size)
+    """
+
+    def __init__(self, gold, measures, batch_size=10000, n_largest=10):
+        self.measures = list(measures)
+        self.batch_size = batch_size
+        self.word_index = gold.word_index
+        self.seen = set()
+        self.n_clusters = 0
+        self.n_pairs = 0
+        self.n_largest = n_largest
+        self.largest = []
+
+    @property
+    def n_intervals(self):
+        """Number of distinct intervals given to the measures"""
+        return len(self.seen)
+
+    def update_batch(self, clusters):
+        """ Give a batch of clusters to all the measures
+
+            Input
+            :param clusters: list of the intervals of each cluster
+        """
+        intervals = [interval for cluster in clusters
+                     for interval in cluster]
+        facts = IntervalFacts(intervals, self.word_index, self.seen)
+        for measure in self.measures:
+            measure.update_batch(clusters, facts)
+
+    def run(self, clusters):
+        """ Give all the clusters to the measures, by batches of about
+            `batch_size` intervals
+
+            Input
+            :param clusters: iterable of (class_number, intervals), as
+                             returned by Disc.iter_clusters
+        """
+        batch, n_intervals = [], 0
+        for class_number, intervals in clusters:
+            self.n_clusters += 1
+            n_pairs = len(intervals) * (len(intervals) - 1) // 2
+            self.n_pairs += n_pairs
+            cluster = (n_pairs, self.n_clusters, class_number, len(intervals))
+            if len(self.largest) < self.n_largest:
+                heapq.heappush(self.largest, cluster)
+            elif cluster > self.largest[0]:
+                heapq.heapreplace(self.largest, cluster)
+            batch.append(intervals)
+            n_intervals += len(intervals)
+            if n_intervals >= self.batch_size:
+                self.update_batch(batch)
+                batch, n_intervals = [], 0
+        if len(batch) > 0:
+            self.update_batch(batch)
+
+    def dominating_clusters(self, share=0.1):
+        """ Return the clusters whose pairs are at least `share` of all the
+            pairs, among the `n_largest` largest clusters. The time and
+            memory of the measures computed on pairs (ned) mostly depend on
+            those clusters.
+
+            Output
+            :return: list of (class_number, size, share), largest first
+        """
+        return [(class_number, size, n_pairs / self.n_pairs)
+                for n_pairs, _, class_number, size
+                in sorted(self.largest, reverse=True)
+                if self.n_pairs > 0 and n_pairs >= share * self.n_pairs]
+
+
+def select_measures(gold, disc, measures=None, output=None, njobs=1,
+                    ned_budget=None, seed=0, boundary_tolerance=0):
+    """ Create the measures selected by name
+
+        Input
+        :param gold: Gold object, contains the gold words and phones
+        :param disc: Disc object, the discovered classes
+        :param measures: list of names in MEASURES, all the measures if
+                         None or empty
+        :param output: path of the folder in which the scores are written
+        :param njobs: number of cpus used in grouping and ned
+        :param ned_budget: if given, the ned is estimated from this number
+                           of sampled pairs, see Ned.sample_ned
+        :param seed: seed of the sampling of the ned
+        :param boundary_tolerance: distance in seconds below which a
+                                   discovered boundary is counted as a
+                                   gold boundary
+        Output
+        :return: OrderedDict {name: Measure}, in the order of MEASURES
+
+        Only the modules of the selected measures are imported, so that
+        the dependencies of the other measures are not.
+    """
+    if not measures:
+        measures = MEASURES
+    for name in measures:
+        if name not in MEASURES:
+            raise ValueError('{}: unknown measure, choose in {}'.format(
+                name, ', '.join(MEASURES)))
+
+    selected = OrderedDict()
+    if "boundary" in measures:
+        from tde.measures.boundary import Boundary
+        selected["boundary"] = Boundary(gold, disc, output,
+                                        tolerance=boundary_tolerance)
+    if "grouping" in measures:
+        from tde.measures.grouping import Grouping
+        selected["grouping"] = Grouping(disc, output, njobs)
+    if "token/type" in measures:
+        from tde.measures.token_type import TokenType
+        selected["token/type"] = TokenType(gold, disc, output)
+    if "coverage" in measures:
+        from tde.measures.coverage import Coverage
+        selected["coverage"] = Coverage(gold, disc, output)
+    if "ned" in measures:
+        from tde.measures.ned import Ned
+        selected["ned"] = Ned(disc, output, njobs, budget=ned_budget,
+                              seed=seed)
+    return selected
+
+
+def compute_measures(selected):
+    """ Compute the measures returned by `select_measures`"""
+    if "boundary" in selected:
+        selected["boundary"].compute_boundary()
+    if "grouping" in selected:
+        selected["grouping"].compute_grouping()
+    if "token/type" in selected:
+        selected["token/type"].compute_token_type()
+    if "coverage" in selected:
+        selected["coverage"].compute_coverage()
+    if "ned" in selected:
+        selected["ned"].compute_ned()
+
+
+def _fscore(precision, recall):
+    """ Harmonic mean of precision and recall, nan if not defined"""
+    if (precision is None or recall is None or math.isnan(precision)
+            or math.isnan(recall) or precision + recall == 0):
+        return float('nan')
+    return 2 * precision * recall / (precision + recall)
+
+
+def get_scores(selected):
+    """ Return the scores of computed measures as an OrderedDict
+        {column: float}, with the columns precision, recall and fscore of
+        boundary, grouping, token and type, and coverage and ned, and the
+        confidence interval ned_low, ned_high of an estimated ned"""
+    scores = OrderedDict()
+    for name, measure in selected.items():
+        if name == "token/type":
+            for kind, precision, recall in zip(
+                    ('token', 'type'), measure.precision, measure.recall):
+                scores[kind + '_precision'] = float(precision)
+                scores[kind + '_recall'] = float(recall)
+                scores[kind + '_fscore'] = _fscore(precision, recall)
+        elif name == "coverage":
+            scores['coverage'] = float(measure.coverage)
+        elif name == "ned":
+            scores['ned'] = float(measure.ned)
+            if measure.ned_interval is not None:
+                # the ned was estimated
+                scores['ned_low'], scores['ned_high'] = measure.ned_interval
+        else:
+            precision, recall = measure.precision, measure.recall
+            scores[name + '_precision'] = float(precision)
+            scores[name + '_recall'] = float(recall)
+            scores[name + '_fscore'] = _fscore(precision, recall)
+    return scores
+
+
+def get_counts(selected, n_clusters=None, n_intervals=None):
+    """ Return the counts the scores of computed measures are computed from,
+        as an OrderedDict {column: int}
+
+        Input
+        :param selected: dict {name: Measure} of the computed measures
+        :param n_clusters: number of clusters read, not counted if None
+        :param n_intervals: number of distinct intervals read, not counted
+                            if None
+    """
+    counts = OrderedDict()
+    if n_clusters is not None:
+        counts['n_clusters'] = n_clusters
+    if n_intervals is not None:
+        counts['n_intervals'] = n_intervals
+
+    if "boundary" in selected:
+        boundary = selected["boundary"]
+        counts['boundary_n_gold'] = boundary.n_gold_boundary
+        counts['boundary_n_discovered'] = boundary.n_all_disc_boundary
+        counts['boundary_n_correct'] = boundary.n_discovered_boundary
+        if boundary.tolerance > 0:
+            # the gold boundaries found differ from the correct ones
+            counts['boundary_n_gold_found'] = boundary.n_gold_found
+    if "grouping" in selected:
+        grouping = selected["grouping"]
+        counts['grouping_n_gold_tokens'] = sum(
+            grouping.gold_counter.values())
+        counts['grouping_n_found_tokens'] = sum(
+            grouping.found_counter.values())
+        counts['grouping_n_found_gold_tokens'] = sum(
+            grouping.found_gold_counter.values())
+        counts['grouping_n_gold_types'] = len(grouping.gold_types)
+        counts['grouping_n_found_types'] = len(grouping.found_types)
+    if "token/type" in selected:
+        token_type = selected["token/type"]
+        counts['token_n_gold'] = token_type.n_token
+        counts['token_n_discovered'] = token_type.n_discovered_words
+        counts['token_n_correct'] = token_type.token_hit
+        counts['type_n_gold'] = token_type.n_type
+        counts['type_n_discovered'] = len(token_type.type_seen)
+        counts['type_n_correct'] = len(token_type.type_hit)
+    if "coverage" in selected:
+        coverage = selected["coverage"]
+        counts['coverage_n_phones'] = coverage.n_phones
+        counts['coverage_n_covered'] = len(coverage.covered_phn)
+    if "ned" in selected:
+        counts['ned_n_pairs'] = selected["ned"].n_pairs
+    return counts
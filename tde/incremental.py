@@ -0,0 +1,426 @@
+"""Incremental evaluation of class files that differ by a few clusters
+
+Between two runs of a hyperparameter sweep, most of the discovered clusters
+are the same. :class:`IncrementalEvaluation` keeps, in a state file, the
+statistics that the measures are made of, for each cluster and for each
+distinct interval:
+
+    ned: the sum of the ned of the pairs of each cluster, and their number
+    grouping: the tokens of each type in each cluster of at least two
+        intervals, and those that are also in a gold pair of the cluster,
+        and the type of each distinct interval
+    token/type: the type of each distinct interval, and the gold word token
+        it finds
+    coverage: the gold phones covered by each distinct interval
+    boundary: the boundaries of each distinct interval
+
+When a class file is evaluated, its clusters are compared with the clusters
+of the state by a hash of their content (their intervals, before
+transcription), so only the new clusters are transcribed and evaluated. The
+statistics of the clusters that are not in the class file anymore are
+removed, and those of the new ones added. The intervals are shared between
+clusters, so the statistics of a distinct interval are counted once, as
+long as one cluster contains it.
+
+The state file is only used with the gold it was computed with, otherwise
+all the clusters are evaluated again.
+
+Example
+-------
+    gold = Gold(wrd_path=wrd_path, phn_path=phn_path)
+    disc = Disc(disc_path, gold, stream=True)
+    ned, coverage = Ned(disc), Coverage(gold, disc)
+    evaluation = IncrementalEvaluation(
+        gold, {'ned': ned, 'coverage': coverage}, 'sweep.state')
+    evaluation.run(disc_path)
+    print(ned.ned, coverage.coverage)
+
+"""
+
+import os
+import math
+import pickle
+import hashlib
+import tempfile
+from collections import Counter, defaultdict
+
+from tde.readers.disc_reader import Disc
+from tde.measures.facts import IntervalFacts
+from tde.measures.grouping import Grouping
+from tde.measures.ned import Ned
+
+
+# version of the state format, to change when the statistics change
+STATE_VERSION = 1
+
+
+class IncrementalEvaluation():
+    """ Evaluate a class file from the statistics of a previous evaluation
+
+    Attributes
+    ----------
+    :param gold: Gold object, contains the gold words and phones
+    :param measures: dict {name: Measure} of the measures to compute, with
+                     the names used by tde.eval ('boundary', 'grouping',
+                     'token/type', 'coverage', 'ned'). They must be created
+                     with a Disc read in streaming.
+    :param state_path: path of the state file. The statistics of the
+                       previous evaluation are read from it if it exists,
+                       and the updated statistics are written to it.
+    :param n_evaluated: number of clusters evaluated by the last `run`
+    :param n_removed: number of clusters removed by the last `run`
+    """
+
+    def __init__(self, gold, measures, state_path):
+        self.gold = gold
+        self.measures = dict(measures)
+        self.state_path = state_path
+        self.n_evaluated = 0
+        self.n_removed = 0
+
+        # the types whose distinct intervals changed since the gold counter
+        # was updated, and the statistics of the intervals of the new
+        # clusters
+        self.changed_types = set()
+        self.new_intervals = dict()
+        self.ignored_phn = {"SIL", "SPN"}
+        self.state = self.load_state()
+
+    def gold_signature(self):
+        """ Identify the gold by the path, size and modification time of
+        its alignments"""
+        return tuple(
+            (os.path.abspath(path), os.path.getsize(path),
+             os.path.getmtime(path))
+            for path in (self.gold.wrd_path, self.gold.phn_path))
+
+    def new_state(self):
+        """ Return the state of an evaluation without cluster"""
+        return {
+            'version': STATE_VERSION,
+            'gold': self.gold_signature(),
+            # {hash: (count, statistics)} of the clusters
+            'clusters': dict(),
+            # {(fname, disc_on, disc_off): (count, statistics)} of the
+            # distinct intervals, counted once per cluster containing them
+            'intervals': dict(),
+            # the number of distinct intervals with each covered phone,
+            # boundary, type, gold token found and type found
+            'phones': Counter(),
+            'down': Counter(),
+            'up': Counter(),
+            'types': Counter(),
+            'token_hits': Counter(),
+            'type_hits': Counter(),
+            # the number of clusters with each (ngram, token) in a found
+            # pair, and in a found pair that is also a gold pair
+            'found': Counter(),
+            'found_gold': Counter(),
+            # the distinct intervals of each type, and the number of their
+            # tokens in a gold pair
+            'groups': defaultdict(set),
+            'gold_counter': Counter()}
+
+    def load_state(self):
+        """ Read the state file, or start a new state if it doesn't exist
+        or was computed with another gold"""
+        if self.state_path is not None and os.path.isfile(self.state_path):
+            try:
+                with open(self.state_path, 'rb') as fin:
+                    state = pickle.load(fin)
+                if (state['version'] == STATE_VERSION
+                        and state['gold'] == self.gold_signature()):
+                    return state
+            except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+                # unreadable state, evaluate all the clusters again
+                pass
+        return self.new_state()
+
+    def save_state(self):
+        """ Write the state file. It is written to a temporary file first,
+        so that an interrupted evaluation never leaves a partial state."""
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as fout:
+            pickle.dump(self.state, fout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def cluster_hash(fnames, disc_ons, disc_offs):
+        """ Hash of the content of a cluster, which doesn't depend on the
+        order of its intervals"""
+        sha1 = hashlib.sha1()
+        for fname, disc_on, disc_off in sorted(
+                zip(fnames, disc_ons, disc_offs)):
+            sha1.update('{} {!r} {!r}\n'.format(
+                fname, disc_on, disc_off).encode('utf-8'))
+        return sha1.hexdigest()
+
+    def run(self, disc_path):
+        """ Evaluate a class file, and compute the selected measures
+
+        The clusters are read without transcription, and compared with the
+        clusters of the state. Only the new ones are transcribed.
+
+            Input
+            :param disc_path: path to the class file
+        """
+        # the content and hash of each cluster, as in Disc.iter_clusters
+        hashes, new_clusters, class_numbers = [], dict(), []
+        for fnames, disc_ons, disc_offs, pending in Disc.read_class_file(
+                disc_path):
+            for class_number, start, stop, line_number in zip(*pending):
+                cluster_hash = self.cluster_hash(
+                    fnames[start:stop], disc_ons[start:stop],
+                    disc_offs[start:stop])
+                hashes.append(cluster_hash)
+                class_numbers.append((class_number, line_number))
+                if (cluster_hash not in self.state['clusters']
+                        and cluster_hash not in new_clusters):
+                    new_clusters[cluster_hash] = (
+                        fnames[start:stop], disc_ons[start:stop],
+                        disc_offs[start:stop])
+
+        statistics = self.evaluate_clusters(new_clusters)
+        self.n_evaluated = len(statistics)
+
+        # if entry already exists, exit with an error. The empty clusters
+        # (after transcription) are not kept, see Disc.iter_clusters
+        seen_classes = set()
+        for cluster_hash, (class_number, line_number) in zip(
+                hashes, class_numbers):
+            assert class_number not in seen_classes, (
+                "Two Classes have the same number {}"
+                " in discovered classes, line {}".format(
+                    class_number, line_number))
+            if cluster_hash in statistics:
+                n_intervals = len(statistics[cluster_hash]['intervals'])
+            else:
+                n_intervals = len(
+                    self.state['clusters'][cluster_hash][1]['intervals'])
+            if n_intervals > 0:
+                seen_classes.add(class_number)
+
+        # update the counts of the clusters, removed clusters first so that
+        # the statistics of their intervals are kept if they are still in
+        # another cluster
+        counts = Counter(hashes)
+        self.n_removed, n_added = 0, 0
+        for cluster_hash in list(self.state['clusters']):
+            count = self.state['clusters'][cluster_hash][0]
+            for _ in range(count - counts[cluster_hash]):
+                self.remove_cluster(cluster_hash)
+                self.n_removed += 1
+        for cluster_hash, count in counts.items():
+            if cluster_hash in statistics:
+                self.state['clusters'][cluster_hash] = (
+                    0, statistics[cluster_hash])
+            current = self.state['clusters'][cluster_hash][0]
+            for _ in range(count - current):
+                self.add_cluster(cluster_hash)
+                n_added += 1
+
+        self.update_gold_counter()
+        self.compute_measures()
+        if self.state_path is not None and (
+                n_added > 0 or self.n_removed > 0
+                or not os.path.isfile(self.state_path)):
+            self.save_state()
+
+    def evaluate_clusters(self, clusters):
+        """ Transcribe new clusters, and compute their statistics
+
+            Input
+            :param clusters: dict {hash: (fnames, disc_ons, disc_offs)}
+            Output
+            :return: dict {hash: statistics} of the clusters. The
+                     statistics of their distinct intervals are kept in
+                     `new_intervals`
+        """
+        fnames, disc_ons, disc_offs = [], [], []
+        for cluster_fnames, cluster_ons, cluster_offs in clusters.values():
+            fnames.extend(cluster_fnames)
+            disc_ons.extend(cluster_ons)
+            disc_offs.extend(cluster_offs)
+        transcriptions = iter(Disc.get_transcriptions(
+            fnames, disc_ons, disc_offs, self.gold.phones))
+
+        statistics = dict()
+        new_intervals = []
+        for cluster_hash, (cluster_fnames, cluster_ons, cluster_offs) \
+                in clusters.items():
+            # throw away interval if outside of transcription
+            intervals = []
+            for fname, disc_on, disc_off in zip(
+                    cluster_fnames, cluster_ons, cluster_offs):
+                token_ngram, ngram = next(transcriptions)
+                if len(token_ngram) > 0:
+                    intervals.append(
+                        (fname, disc_on, disc_off, token_ngram, ngram))
+            statistics[cluster_hash] = self.cluster_statistics(intervals)
+            new_intervals.extend(intervals)
+
+        # statistics of the distinct intervals of the new clusters, those
+        # already in the state may be removed with the old clusters first
+        facts = IntervalFacts(new_intervals, self.gold.word_index)
+        self.new_intervals = self.interval_statistics(facts)
+        return statistics
+
+    @staticmethod
+    def cluster_statistics(intervals):
+        """ Statistics of a cluster, see `Ned.cluster_ned` and
+        `Grouping.get_groups`"""
+        found, found_gold = set(), set()
+        if len(intervals) >= 2:
+            same = defaultdict(set)
+            for fname, disc_on, disc_off, token_ngram, ngram in intervals:
+                found.add((ngram, token_ngram))
+                same[ngram].add((fname, disc_on, disc_off, token_ngram))
+            for ngram, group in same.items():
+                if len(group) > 1:
+                    found_gold.update(
+                        (ngram, interval[3])
+                        for interval in Grouping.get_paired(list(group)))
+
+        return {'intervals': [interval[:3] for interval in intervals],
+                'ned': Ned.cluster_ned(Ned.count_ngrams(intervals)),
+                'found': found,
+                'found_gold': found_gold}
+
+    def interval_statistics(self, facts):
+        """ Statistics of each new distinct interval, see
+        `Coverage.update_batch`, `Boundary.update_batch` and
+        `TokenType.update_batch`"""
+        gold_wrd = self.gold.words
+        statistics = dict()
+        for (fname, disc_on, disc_off, token_ngram, ngram), wrd_ix, \
+                wrd_type, ngram_type in zip(facts.intervals,
+                                            facts.words.tolist(),
+                                            facts.words_types.tolist(),
+                                            facts.ngrams_types.tolist()):
+            token_hit = None
+            if wrd_ix >= 0 and wrd_type == ngram_type:
+                token_hit = (fname,
+                             float(gold_wrd.onset[wrd_ix]),
+                             float(gold_wrd.offset[wrd_ix]),
+                             gold_wrd.ix2symbol[int(gold_wrd.symbol[wrd_ix])])
+            statistics[(fname, disc_on, disc_off)] = (
+                tuple(ngram), token_ngram, token_hit)
+        return statistics
+
+    def add_cluster(self, cluster_hash):
+        """ Add one occurrence of a cluster of the state to the totals"""
+        state = self.state
+        count, cluster = state['clusters'][cluster_hash]
+        state['clusters'][cluster_hash] = (count + 1, cluster)
+        state['found'].update(cluster['found'])
+        state['found_gold'].update(cluster['found_gold'])
+
+        for key in cluster['intervals']:
+            if key in state['intervals']:
+                count, interval = state['intervals'][key]
+                state['intervals'][key] = (count + 1, interval)
+            else:
+                # first cluster with this interval
+                interval = self.new_intervals[key]
+                state['intervals'][key] = (1, interval)
+                self.count_interval(key, interval, 1)
+
+    def remove_cluster(self, cluster_hash):
+        """ Remove one occurrence of a cluster of the state from the
+        totals"""
+        state = self.state
+        count, cluster = state['clusters'][cluster_hash]
+        if count > 1:
+            state['clusters'][cluster_hash] = (count - 1, cluster)
+        else:
+            del state['clusters'][cluster_hash]
+        state['found'].subtract(cluster['found'])
+        state['found_gold'].subtract(cluster['found_gold'])
+
+        for key in cluster['intervals']:
+            count, interval = state['intervals'][key]
+            if count > 1:
+                state['intervals'][key] = (count - 1, interval)
+            else:
+                # last cluster with this interval
+                del state['intervals'][key]
+                self.count_interval(key, interval, -1)
+
+    def count_interval(self, key, interval, increment):
+        """ Add (increment=1) or remove (increment=-1) the statistics of a
+        distinct interval to the totals"""
+        state = self.state
+        fname = key[0]
+        ngram, token_ngram, token_hit = interval
+        for phn_on, phn_off, phn in token_ngram:
+            if phn not in self.ignored_phn:
+                state['phones'][(fname, phn_on, phn_off, phn)] += increment
+        state['down'][(fname, token_ngram[0][0])] += increment
+        state['up'][(fname, token_ngram[-1][1])] += increment
+        state['types'][ngram] += increment
+        if token_hit is not None:
+            state['token_hits'][token_hit] += increment
+            state['type_hits'][ngram] += increment
+        if increment > 0:
+            state['groups'][ngram].add(key)
+        else:
+            state['groups'][ngram].discard(key)
+        self.changed_types.add(ngram)
+
+    def update_gold_counter(self):
+        """ Count the tokens of the gold pairs of the types that changed,
+        and remove the statistics that are not counted anymore"""
+        state = self.state
+        for ngram in self.changed_types:
+            group = [key + (state['intervals'][key][1][1],)
+                     for key in state['groups'][ngram]]
+            paired = {interval[3] for interval in Grouping.get_paired(group)}
+            state['gold_counter'][ngram] = len(paired)
+            if len(group) == 0:
+                del state['groups'][ngram]
+        self.changed_types.clear()
+
+        for name in ('phones', 'down', 'up', 'types', 'token_hits',
+                     'type_hits', 'found', 'found_gold', 'gold_counter'):
+            state[name] = +state[name]
+
+    def compute_measures(self):
+        """ Compute the selected measures from the totals of the state"""
+        state = self.state
+        if 'ned' in self.measures:
+            ned = self.measures['ned']
+            ned.disc = None
+            ned.ned_sum = math.fsum(
+                count * cluster['ned'][0]
+                for count, cluster in state['clusters'].values())
+            ned.n_pairs = sum(
+                count * cluster['ned'][1]
+                for count, cluster in state['clusters'].values())
+            ned.compute_ned()
+
+        if 'grouping' in self.measures:
+            self.measures['grouping'].set_counters(
+                Counter(state['gold_counter']),
+                Counter(ngram for ngram, token in state['found_gold']),
+                Counter(ngram for ngram, token in state['found']))
+
+        if 'token/type' in self.measures:
+            token_type = self.measures['token/type']
+            token_type.disc = None
+            token_type.n_discovered_words = len(state['intervals'])
+            token_type.type_seen = set(state['types'])
+            token_type.token_seen = set(state['token_hits'])
+            token_type.token_hit = len(state['token_hits'])
+            token_type.type_hit = set(state['type_hits'])
+            token_type.compute_token_type()
+
+        if 'coverage' in self.measures:
+            coverage = self.measures['coverage']
+            coverage.covered_phn = set(state['phones'])
+            coverage.compute_coverage()
+
+        if 'boundary' in self.measures:
+            boundary = self.measures['boundary']
+            boundary.set_boundaries(state['down'], state['up'])
+            boundary.compute_boundary()
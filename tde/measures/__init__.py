@@ -0,0 +1,2 @@
+# names of the measures, in the order they are computed
+MEASURES = ('boundary', 'grouping', 'token/type', 'coverage', 'ned')
@@ -1,5 +1,9 @@
+import os
 import numpy as np
+from collections import defaultdict
 from .measures import Measure
+from .facts import IntervalFacts
+from tde.readers.alignment import Alignment
 
 
 class Boundary(Measure):
@@ -9,54 +13,79 @@ class Boundary(Measure):
     See https://docs.cognitive-ml.fr/tde/measures/index.html for
     a summary of all measures.
 
+    The discovered boundaries are kept per file, and compared with the gold
+    boundaries of the file as sorted arrays. The distance of each
+    discovered boundary to the closest gold boundary, and of each gold
+    boundary to the closest discovered boundary, is computed once, so that
+    the measure can then be computed with any tolerance without going
+    through the boundaries again.
+
     Input
     :param disc: Discovered Object, contains the discovered boundaries
     :param gold: Gold object, contains all the gold boundaries
     :param output_folder: string, path to the output folder
+    :param tolerance: a discovered boundary is correct if it is at most
+                      `tolerance` seconds from a gold boundary of the same
+                      direction. By default, it must be exactly on it.
 
     Output
     :param precision: Boundary Precision
     :param recall: Boundary Recall
     """
 
-    def __init__(self, gold, disc, output_folder=None):
+    def __init__(self, gold, disc, output_folder=None, tolerance=0):
         self.metric_name = "boundary"
         self.output_folder = output_folder
+        self.tolerance = tolerance
 
-        # get gold as interval trees
-        self.gold_boundaries_up = gold.boundaries[0]
-        self.gold_boundaries_down = gold.boundaries[1]
+        # get gold boundaries, {fname: sorted array}
+        self.gold_boundaries_up = gold.boundary_arrays[0]
+        self.gold_boundaries_down = gold.boundary_arrays[1]
         self.gold_wrd = gold.words
-        assert type(self.gold_wrd) == dict, (
-            "gold_phn should be a dict "
+        assert isinstance(self.gold_wrd, (dict, Alignment)), (
+            "gold_wrd should be an Alignment or a dict "
             "of intervaltree objects but is {} ".format(type(self.gold_wrd)))
 
-        # get all discovered boundaries
-        bounds_down = [(fname, ngram[0][0])
-                       for fname, _, _, ngram, _ in disc.intervals
-                       if len(ngram) > 0]
-        bounds_up = [(fname, ngram[-1][1])
-                     for fname, _, _, ngram, _ in disc.intervals
-                     if len(ngram) > 0]
-        self.disc_down = set(bounds_down)
-        self.disc_up = set(bounds_up)
+        # get all discovered boundaries, {fname: list of times}
+        self.disc_down = defaultdict(list)
+        self.disc_up = defaultdict(list)
+        self._distances = None
+        if disc.intervals is not None:
+            self.update(disc.intervals)
 
         # measures
-        self.boundaries = dict()
-        self.boundaries_seen = set()
         self.n_correct_disc_boundary = 0
-
-        # if boundary is discovered as up and down, only count it once
-        self.n_all_disc_boundary = len(self.disc_up.difference(
-            self.disc_up.intersection(self.disc_down))) + len(self.disc_down)
+        self.n_all_disc_boundary = 0
         self.n_gold_boundary = 0
         self.n_discovered_boundary = 0
+        self.n_gold_found = 0
+        # a boundary that is both up and down is only counted once
         for fname in self.gold_boundaries_up:
-            self.n_gold_boundary += len(
-               self.gold_boundaries_up[fname].difference(
-                self.gold_boundaries_up[fname].intersection(
-                 self.gold_boundaries_down[fname])))
-            self.n_gold_boundary += len(self.gold_boundaries_down[fname])
+            self.n_gold_boundary += len(np.union1d(
+                self.gold_boundaries_up[fname],
+                self.gold_boundaries_down[fname]))
+
+    def update(self, intervals):
+        """ Add the boundaries of the given discovered intervals"""
+        self.update_batch([intervals], IntervalFacts(intervals))
+
+    def update_batch(self, clusters, facts):
+        """ Add the boundaries of the new intervals of a batch"""
+        self.add_boundaries(facts.boundaries_down, facts.boundaries_up)
+
+    def add_boundaries(self, down, up):
+        """ Add discovered boundaries, given as iterables of (fname, time)"""
+        for fname, time in down:
+            self.disc_down[fname].append(time)
+        for fname, time in up:
+            self.disc_up[fname].append(time)
+        self._distances = None
+
+    def set_boundaries(self, down, up):
+        """ Replace the discovered boundaries by the given (fname, time)"""
+        self.disc_down = defaultdict(list)
+        self.disc_up = defaultdict(list)
+        self.add_boundaries(down, up)
 
     @property
     def precision(self):
@@ -76,46 +105,106 @@ class Boundary(Measure):
         if self.n_gold_boundary == 0:
             boundary_rec = np.nan
         else:
-            boundary_rec = self.n_discovered_boundary / self.n_gold_boundary
+            boundary_rec = self.n_gold_found / self.n_gold_boundary
 
         return boundary_rec
 
-    def compute_boundary(self):
-        """ Create intervaltree containing only boundary phones.
+    @staticmethod
+    def nearest_distance(times, reference):
+        """ Return the distance of each of the sorted `times` to the closest
+            time of the sorted array `reference`, inf if it is empty"""
+        if len(reference) == 0:
+            return np.full(len(times), np.inf)
+        index = np.searchsorted(reference, times)
+        before = reference[np.maximum(index - 1, 0)]
+        after = reference[np.minimum(index, len(reference) - 1)]
+        return np.minimum(np.abs(times - before), np.abs(times - after))
+
+    @classmethod
+    def merged_distances(cls, times_down, times_up, reference_down,
+                         reference_up):
+        """ Return the union of the sorted arrays `times_down` and
+            `times_up`, and the distance of each of its times to the closest
+            reference time of the same direction (the smallest of the two
+            when the time is both a down and an up boundary)"""
+        times = np.union1d(times_down, times_up)
+        distances = np.full(len(times), np.inf)
+        distances[np.searchsorted(times, times_down)] = cls.nearest_distance(
+            times_down, reference_down)
+        up = np.searchsorted(times, times_up)
+        distances[up] = np.minimum(distances[up], cls.nearest_distance(
+            times_up, reference_up))
+        return times, distances
+
+    def boundary_distances(self):
+        """ Return the distances of the distinct discovered boundaries to the
+            closest gold boundaries, and of the gold boundaries to the
+            closest discovered boundaries, as two arrays. They are kept until
+            boundaries are added.
+
+            Raises
+            ------
+            ValueError
+                - if the file of a discovered boundary is not in the gold
+        """
+        if self._distances is not None:
+            return self._distances
+
+        empty = np.zeros(0)
+        disc_distances, gold_distances = [empty], [empty]
+        for fname in set(self.disc_down).union(self.disc_up):
+            if fname not in self.gold_boundaries_down:
+                raise ValueError('{}: file not found in gold'.format(fname))
+            disc_down = np.unique(np.asarray(self.disc_down[fname],
+                                             dtype=np.float64))
+            disc_up = np.unique(np.asarray(self.disc_up[fname],
+                                           dtype=np.float64))
+            gold_down = self.gold_boundaries_down[fname]
+            gold_up = self.gold_boundaries_up[fname]
+
+            disc_distances.append(self.merged_distances(
+                disc_down, disc_up, gold_down, gold_up)[1])
+            gold_distances.append(self.merged_distances(
+                gold_down, gold_up, disc_down, disc_up)[1])
+
+        self._distances = (np.concatenate(disc_distances),
+                           np.concatenate(gold_distances))
+        return self._distances
+
+    def compute_boundary(self, tolerance=None):
+        """ Count the discovered boundaries that are gold boundaries.
             Here we discriminate upward and downward boundaries,
             because if a word is followed by a silence, the upward
             boundary should be counted if discovered as upward, but not
             if discovered as downward.
 
             Input
-            :param disc_down:  a list of all the downward boundaries of
-                               discovered segments
-            :param disc_up:    a list of all the upward boundaries of
-                               discovered segments
-            :gold_boundaries_down: a set of all the downward gold boundaries
-            :gold_boundaries_up:   a set of all the upward gold boundaries
+            :param tolerance: a discovered boundary is correct if it is at
+                              most `tolerance` seconds from a gold boundary
+                              of the same direction, and replaces
+                              self.tolerance if given
+
+            With a tolerance, several discovered boundaries can be close to
+            the same gold boundary: the precision counts the correct
+            discovered boundaries, and the recall the gold boundaries close
+            to a discovered one. Without tolerance, both are the number of
+            discovered boundaries that are gold boundaries.
         """
-        # downward boundaries
-        for fname, disc_time in self.disc_down:
-            if fname not in self.gold_boundaries_down:
-                raise ValueError('{}: file not found in gold'.format(fname))
-
-            if (
-                    disc_time in self.gold_boundaries_down[fname]
-                    and not (fname, disc_time) in self.boundaries_seen
-            ):
-
-                self.n_discovered_boundary += 1
-                self.boundaries_seen.add((fname, disc_time))
+        if tolerance is not None:
+            self.tolerance = tolerance
+        # the times are read from text, allow for their rounding errors
+        limit = self.tolerance + 1e-9 if self.tolerance > 0 else 0
 
-        # upward boundaries
-        for fname, disc_time in self.disc_up:
-            if fname not in self.gold_boundaries_up:
-                raise ValueError('{}: file not found in gold'.format(fname))
-
-            if (
-                    disc_time in self.gold_boundaries_up[fname]
-                    and not (fname, disc_time) in self.boundaries_seen
-            ):
-                self.n_discovered_boundary += 1
-                self.boundaries_seen.add((fname, disc_time))
+        disc_distances, gold_distances = self.boundary_distances()
+        # if boundary is discovered as up and down, only count it once
+        self.n_all_disc_boundary = len(disc_distances)
+        self.n_discovered_boundary = int(np.count_nonzero(
+            disc_distances <= limit))
+        self.n_gold_found = int(np.count_nonzero(gold_distances <= limit))
+
+    def write_score(self):
+        super().write_score()
+        if self.tolerance > 0:
+            with open(os.path.join(self.output_folder, self.metric_name),
+                      'a') as fout:
+                fout.write("tolerance: {}\n".format(self.tolerance))
@@ -1,6 +1,9 @@
 import os
+import numpy as np
 
 from .measures import Measure
+from .facts import IntervalFacts
+from tde.readers.alignment import to_alignment
 
 
 class Coverage(Measure):
@@ -24,22 +27,36 @@ class Coverage(Measure):
         self.output_folder = output_folder
 
         # self.all_intervals = set()
-        self.n_phones = 0
+        # count all the gold phones, except silences and noises
+        # TODO remove SIL here ?
+        gold_phn = to_alignment(gold.phones)
+        ignored = [gold_phn.symbol2ix[ph] for ph in ("SIL", "SPN")
+                   if ph in gold_phn.symbol2ix]
+        self.n_phones = int(np.count_nonzero(
+            ~np.isin(gold_phn.symbol, ignored)))
 
-        for fname in gold.phones:
-            # TODO remove SIL here ?
-            self.n_phones += len([
-                ph for on, off, ph in gold.phones[fname]
-                if (ph != "SIL" and ph != "SPN")])
+        # the phones of the discovered intervals are ignored by symbol, or
+        # by code when they are encoded
+        self.ignored_phn = {"SIL", "SPN"}.union(ignored)
 
-        self.covered_phn = set(
+        self.covered_phn = set()
+        if disc.intervals is not None:
+            self.update(disc.intervals)
+
+        self.coverage = 0
+
+    def update(self, intervals):
+        """ Add the phones covered by the given discovered intervals"""
+        self.update_batch([intervals], IntervalFacts(intervals))
+
+    def update_batch(self, clusters, facts):
+        """ Add the phones covered by the new intervals of a batch"""
+        self.covered_phn.update(
             (fname, phn_on, phn_off, phn)
             for fname, disc_on, disc_off, token_ngram, ngram
-            in disc.intervals
+            in facts.intervals
             for phn_on, phn_off, phn in token_ngram
-            if (phn != "SIL" and phn != "SPN"))
-
-        self.coverage = 0
+            if phn not in self.ignored_phn)
 
     def compute_coverage(self):
         """ For coverage, simply compute the ratio of discovered phones over all phone
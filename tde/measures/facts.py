@@ -0,0 +1,169 @@
+"""Facts about the discovered intervals shared by several measures
+
+:class:`IntervalFacts` gathers, for a batch of discovered intervals, the
+information that several measures need, so that it is computed only once
+when the measures are evaluated together (see tde.evaluation):
+
+    intervals: the distinct intervals of the batch that were not seen in a
+        previous batch
+    boundaries_down, boundaries_up: the discovered boundaries of each
+        interval, i.e. the onset of its first phone and the offset of its
+        last phone
+    words: the gold word that overlaps the most with each interval
+    words_types, ngrams_types: the type ids (see tde.readers.alignment.
+        WordIndex) of the transcription of those gold words, and of the
+        ngram of each interval
+
+The gold words are searched for all the intervals of the batch at once in
+the columnar gold alignment, and are only computed if a measure uses them.
+
+"""
+
+import numpy as np
+
+from tde.readers.alignment import to_alignment
+
+
+class IntervalFacts():
+    """ Shared facts about a batch of discovered intervals
+
+    Attributes
+    ----------
+    :param intervals: list of the distinct discovered intervals of the batch
+                      not in `seen`, as (fname, disc_on, disc_off,
+                      token_ngram, ngram)
+    :param word_index: WordIndex of the gold words and phones
+    :param seen: set of the (fname, disc_on, disc_off) already seen in
+                 previous batches, updated with the intervals of this batch.
+                 If None, all the distinct intervals of the batch are kept.
+
+    Raises
+    ------
+    ValueError
+        - if the file of an interval is not in the gold words
+    """
+
+    def __init__(self, intervals, word_index=None, seen=None):
+        if seen is None:
+            seen = set()
+        self.intervals = []
+        for interval in intervals:
+            key = interval[:3]
+            if key not in seen:
+                seen.add(key)
+                self.intervals.append(interval)
+
+        self.word_index = word_index
+        self._words = None
+
+    @property
+    def boundaries_down(self):
+        """ (fname, onset of first phone) of each transcribed interval"""
+        return [(fname, token_ngram[0][0])
+                for fname, _, _, token_ngram, _ in self.intervals
+                if len(token_ngram) > 0]
+
+    @property
+    def boundaries_up(self):
+        """ (fname, offset of last phone) of each transcribed interval"""
+        return [(fname, token_ngram[-1][1])
+                for fname, _, _, token_ngram, _ in self.intervals
+                if len(token_ngram) > 0]
+
+    @property
+    def words(self):
+        """ Index in gold_wrd of the word overlapping the most with each
+        interval, -1 if no word overlaps the interval"""
+        if self._words is None:
+            self._words = self.find_words(
+                self.word_index.words,
+                [interval[0] for interval in self.intervals],
+                [interval[1] for interval in self.intervals],
+                [interval[2] for interval in self.intervals])
+        return self._words
+
+    @property
+    def words_types(self):
+        """ Type id of the transcription of the word of each interval, -1 if
+        no word overlaps the interval"""
+        words_types = np.full(len(self.intervals), -1, dtype=np.int64)
+        found = self.words >= 0
+        words_types[found] = self.word_index.word_type[self.words[found]]
+        return words_types
+
+    @property
+    def ngrams_types(self):
+        """ Type id of the ngram of each interval, -1 if no gold word has
+        this transcription"""
+        return np.array([self.word_index.get_type(interval[4])
+                         for interval in self.intervals], dtype=np.int64)
+
+    @staticmethod
+    def find_words(gold_wrd, fnames, disc_ons, disc_offs):
+        """ For each interval, find the gold word that overlaps it the most
+
+        When several words overlap an interval, the chosen word is the first
+        one (in the gold order) with the highest overlap w.r. to the word
+        duration.
+
+        Parameters
+        ----------
+        gold_wrd: Alignment or dict of intervaltree, the gold words
+        fnames: list of str, file of each interval
+        disc_ons: list of float, onset of each interval
+        disc_offs: list of float, offset of each interval
+
+        Returns
+        -------
+        words: int array, the index of the chosen word in gold_wrd, or -1
+               if no word overlaps the interval
+        """
+        gold_wrd = to_alignment(gold_wrd)
+        for fname in fnames:
+            if fname not in gold_wrd:
+                raise ValueError('{}: file not found in gold'.format(fname))
+
+        file_ids = np.array([gold_wrd.file2ix[fname] for fname in fnames],
+                            dtype=np.int64)
+        disc_ons = np.asarray(disc_ons, dtype=np.float64)
+        disc_offs = np.asarray(disc_offs, dtype=np.float64)
+        words = np.full(len(fnames), -1, dtype=np.int64)
+        if len(fnames) == 0:
+            return words
+
+        if not gold_wrd.disjoint:
+            # the overlapped words are not a contiguous range of the gold
+            candidates = [gold_wrd.overlap(fname, disc_on, disc_off)
+                          for fname, disc_on, disc_off in zip(
+                              fnames, disc_ons.tolist(), disc_offs.tolist())]
+            n_candidates = np.array([len(c) for c in candidates],
+                                    dtype=np.int64)
+            candidates = np.concatenate(
+                candidates + [np.zeros(0, dtype=np.int64)])
+        else:
+            starts, stops = gold_wrd.overlap_ranges(
+                file_ids, disc_ons, disc_offs)
+            n_candidates = stops - starts
+            segments = np.cumsum(n_candidates) - n_candidates
+            candidates = (np.repeat(starts - segments, n_candidates)
+                          + np.arange(n_candidates.sum()))
+
+        found = n_candidates > 0
+        if not np.any(found):
+            return words
+
+        # overlap of each candidate w.r. to its duration
+        owner = np.repeat(np.arange(len(fnames)), n_candidates)
+        wrd_on = gold_wrd.onset[candidates]
+        wrd_off = gold_wrd.offset[candidates]
+        ov = ((np.minimum(disc_offs[owner], wrd_off)
+               - np.maximum(disc_ons[owner], wrd_on))
+              / (wrd_off - wrd_on))
+
+        # first candidate with the highest overlap in each segment
+        segments = (np.cumsum(n_candidates) - n_candidates)[found]
+        best = np.maximum.reduceat(ov, segments)
+        position = np.where(ov == np.repeat(best, n_candidates[found]),
+                            np.arange(len(ov)), len(ov))
+        words[found] = candidates[np.minimum.reduceat(position, segments)]
+        return words
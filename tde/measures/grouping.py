@@ -1,10 +1,12 @@
+import math
+import bisect
 import numpy as np
 
-from joblib import Parallel, delayed
 from .measures import Measure
-from itertools import combinations
+from .facts import IntervalFacts
 from collections import defaultdict, Counter
-from tde.utils import overlap
+from tde import progress
+from tde.utils import split_by_cost
 
 
 class Grouping(Measure):
@@ -18,12 +20,26 @@ class Grouping(Measure):
     Input
     :param disc: Discovered Object, contains the discovered elements
     :param output_folder: string, path to the output folder
-    :param njobs: Number of cpus to be used.
+    :param njobs: Number of cpus to be used (same convention as joblib,
+                  -1 to use all the cpus).
 
     Output
     :param precision: Grouping Precision
     :param recall: Grouping Recall
 
+    The precision and recall only depend on the number of tokens of each
+    type that appear in at least one pair of the gold pairs, the found pairs
+    and their intersection. Those counts are computed directly for each
+    (cluster, ngram, file) group, in O(n log(n)), without building the
+    pairs (see `get_groups` and `count_paired_tokens`).
+
+    The clusters can also be given one at a time with `update`, in which
+    case they are stored until `compute_grouping`.
+
+    With njobs > 1, the groups are split by type between njobs processes,
+    and the counters of each process are merged, so the scores are exactly
+    the same as with one process.
+
     """
     def __init__(self, disc, output_folder=None, njobs=1):
         self.metric_name = "grouping"
@@ -31,18 +47,18 @@ class Grouping(Measure):
         self.clusters = disc.clusters
         self.intervals = disc.intervals
         self.njobs = njobs
-        self.found_pairs = set()
-        self.gold_pairs = set()
         self.found_types = set()
         self.gold_types = set()
+        self.disc_seen = set()
 
     @property
     def precision(self):
         if len(self.found_types) == 0:
             prec = np.nan
         else:
-            prec = sum(self.found_weights[t] * self.found_gold_counter[t]
-                       / self.found_counter[t] for t in self.found_types)
+            prec = math.fsum(
+                self.found_weights[t] * self.found_gold_counter[t]
+                / self.found_counter[t] for t in self.found_types)
         return prec
 
     @property
@@ -50,172 +66,24 @@ class Grouping(Measure):
         if len(self.gold_types) == 0:
             rec = np.nan
         else:
-            rec = sum(self.gold_weights[t] * self.found_gold_counter[t]
-                      / self.gold_counter[t] for t in self.gold_types)
+            rec = math.fsum(
+                self.gold_weights[t] * self.found_gold_counter[t]
+                / self.gold_counter[t] for t in self.gold_types)
         return rec
 
-    #def get_gold_pairs(self):
-    #    """ Get all the gold pairs that can be created using the
-    #        discovered intervals.
-    #        The pairs are ordered by filename and onset.
-
-    #        Input
-    #        :param intervals: a list of all the discovered intervals, with
-    #                          their transcription
-    #        Output
-    #        :param gold_pairs: a set of all the gold pairs created from the
-    #                           discovered intervals
-    #        :param gold_types: all the types (n-gram) that occur in gold_pairs
-    #    """
-    #    counter = Counter()
-    #    gold_found_pairs = set()
-
-    #    def _ngram_pairs(pair):
-    #        # check if a pair should be kept as gold
-    #        # and if it intersects with discovered pairs
-    #        f1, f2 = pair
-
-    #        # check if should be kept
-    #        if (f1[0] == f2[0] and overlap((f1[1], f1[2]),
-    #                                       (f2[1], f2[2]))[0] > 0):
-    #            return (None, False)
-
-    #        # check if discovered
-    #        if (f1, f2) in self.found_pairs:
-    #            intersection = True
-    #        else:
-    #            intersection = False
-
-    #        return ((f1, f2), intersection)
-
-    #    # get all discovered intervals
-    #    same = defaultdict(set)
-    #    for fname, disc_on, disc_off, token_ngram, ngram in self.intervals:
-    #        # ngram = tuple(ph for on, off, ph in token_ngram)
-    #        same[ngram].add((fname, disc_on, disc_off, token_ngram, ngram))
-    #    # get all gold pairs
-    #    seen_token = set()
-
-    #    # parallelize over all possible pairs
-    #    for ngram in same:
-    #        _gold_pairs_found = Parallel(n_jobs=self.njobs, backend="threading")(
-    #            delayed(_ngram_pairs)(sorted((f1, f2),
-    #                                key=lambda f: (f[0], f[1])))
-    #                               for f1, f2 in combinations(same[ngram], 2))
-
-    #        _gold_pairs = {pair for pair, found in _gold_pairs_found if pair is not None}
-    #        if len(_gold_pairs) > 0:
-    #            self.gold_types.add(ngram)
-    #        _intersection = {pair for pair, found in _gold_pairs_found if found == True}
-    #        gold_found_pairs = gold_found_pairs.union(_intersection)
-
-    #        # update counters
-    #        for f1, f2 in _gold_pairs:
-    #            if f1[3] not in seen_token:
-    #                counter.update((f1[4],))
-    #                # count token as seen
-    #                seen_token.add(f1[3])
-    #            if f2[3] not in seen_token:
-    #                counter.update((f2[4],))
-    #                seen_token.add(f2[3])
-
-    #    # compute weights for each n gram
-    #    weights = {ngram: counter[ngram]/len(seen_token) for ngram in counter}
-    #
-    #    return gold_found_pairs, counter, weights
-
-    #def get_gold_pairs_buggy(self):
-    #    """ Get all the gold pairs that can be created using the
-    #        discovered intervals.
-    #        The pairs are ordered by filename and onset.
-
-    #        Input
-    #        :param intervals: a list of all the discovered intervals, with
-    #                          their transcription
-    #        Output
-    #        :param gold_pairs: a set of all the gold pairs created from the
-    #                           discovered intervals
-    #        :param gold_types: all the types (n-gram) that occur in gold_pairs
-    #    """
-    #    def _ngram_pairs(ngram_list):
-    #        ngram_pairs = [tuple(sorted((f1, f2), key= lambda f:(f[0], f[1])))
-    #                       for f1, f2 in combinations(ngram_list, 2)
-    #                       if not (f1[0] == f2[0]
-    #                               and overlap((f1[1], f1[2]),
-    #                                           (f2[1], f2[2]))[0] > 0)]
-    #        return ngram_pairs
-
-    #    same = defaultdict(set)
-    #    for fname, disc_on, disc_off, token_ngram, ngram in self.intervals:
-    #        # ngram = tuple(ph for on, off, ph in token_ngram)
-    #        same[ngram].add((fname, disc_on, disc_off, token_ngram, ngram))
-
-    #    # add gold pair as tuple if both elements don't overlap
-    #    gold_pairs = {
-    #        tuple(sorted((f1, f2), key=lambda f: (f[0], f[1])))
-    #        for ngram in same
-    #        for f1, f2 in combinations(same[ngram], 2)
-    #        if not (f1[0] == f2[0]
-    #                and overlap((f1[1], f1[2]),
-    #                            (f2[1], f2[2]))[0] > 0)}
-    #    #gold_pairs = Parallel(n_jobs=15)(delayed(_ngram_pairs)(same[ngram]) for ngram in same)
-    #    gold_types = {f1[4] for f1, f2 in self.gold_pairs}
-    #    return gold_pairs, gold_types
-
-    def get_gold_pairs(self):
-        """ Get all the gold pairs that can be created using the
-            discovered intervals.
-            The pairs are ordered by filename and onset.
-
-            Input
-            :param intervals: a list of all the discovered intervals, with
-                              their transcription
-            Output
-            :param gold_pairs: a set of all the gold pairs created from the
-                               discovered intervals
-            :param gold_types: all the types (n-gram) that occur in gold_pairs
-        """
-        same = defaultdict(set)
-        for fname, disc_on, disc_off, token_ngram, ngram in self.intervals:
-            # ngram = tuple(ph for on, off, ph in token_ngram)
-            same[ngram].add((fname, disc_on, disc_off, token_ngram, ngram))
-
-        # add gold pair as tuple if both elements don't overlap
-        self.gold_pairs = {
-            tuple(sorted((f1, f2), key=lambda f: (f[0], f[1])))
-            for ngram in same
-            for f1, f2 in combinations(same[ngram], 2)
-            if not (f1[0] == f2[0]
-                    and overlap((f1[1], f1[2]),
-                                (f2[1], f2[2]))[0] > 0)}
-
-        self.gold_types = {f1[4] for f1, f2 in self.gold_pairs}
-
-    def get_found_pairs(self):
-        """ Get all the pairs that were found.
-            The pairs are ordered by filename and onset.
-
-            Input
-            :param clusters: a dict of all the clusters found. the keys
-                             are the clusters names, the values are
-                             a list of the intervals in this cluster
-            Output
-            :param found_pairs: a set of all the discovered pairs
-        """
-        for class_nb in self.clusters:
-            self.found_pairs = self.found_pairs.union(
-                set(combinations(self.clusters[class_nb], 2)))
-
-            # count type only if clusters has two elements
-            if len(self.clusters[class_nb]) > 1 :
-                self.found_types = self.found_types.union(
-                    {ngram for _, _, _, token_ngram, ngram
-                    in self.clusters[class_nb]})
+    def update(self, intervals):
+        """ Add one discovered cluster. The grouping needs all the clusters,
+            so they are only stored until `compute_grouping`."""
+        self.update_batch([intervals], IntervalFacts(
+            intervals, seen=self.disc_seen))
 
-        # order found pairs
-        self.found_pairs = {
-            tuple(sorted((f1, f2), key=lambda f: (f[0], f[1])))
-            for f1, f2 in self.found_pairs}
+    def update_batch(self, clusters, facts):
+        """ Add a batch of discovered clusters, and their new intervals"""
+        if self.clusters is None:
+            self.clusters, self.intervals = dict(), []
+        for intervals in clusters:
+            self.clusters[len(self.clusters)] = intervals
+        self.intervals.extend(facts.intervals)
 
     @staticmethod
     def get_weights(pairs):
@@ -250,25 +118,231 @@ class Grouping(Measure):
         weights = {ngram: counter[ngram]/len(seen_token) for ngram in counter}
         return weights, counter
 
+    @staticmethod
+    def get_paired(group):
+        """ Get the intervals of a group that appear in at least one gold pair
+
+            Two intervals of the group form a gold pair unless they are in
+            the same file and overlap. So if the group spans several files,
+            all its intervals are paired, otherwise an interval is paired if
+            it doesn't overlap all the other intervals. The number of
+            intervals overlapping each interval is counted with a binary
+            search in the sorted onsets and offsets.
+
+            Input
+            :param group:   a list of distinct intervals with the same ngram,
+                            starting with (filename, onset, offset, ...)
+            Output
+            :return:        the list of the intervals of group that form at
+                            least one gold pair with another interval of
+                            the group.
+        """
+        if len(group) < 2:
+            return []
+        if len({interval[0] for interval in group}) > 1:
+            return group
+
+        # intervals y overlapping x are those with on_y < off_x, except those
+        # with off_y <= on_x. x overlaps itself, so x is paired if it
+        # overlaps less than len(group) intervals.
+        onsets = sorted(interval[1] for interval in group)
+        offsets = sorted(interval[2] for interval in group)
+        return [interval for interval in group
+                if bisect.bisect_left(onsets, interval[2])
+                - bisect.bisect_right(offsets, interval[1]) < len(group)]
+
+    def get_groups(self):
+        """ Group the discovered intervals by ngram, to count the tokens of
+            the gold pairs and of the found pairs that are gold pairs,
+            without building the pairs.
+
+            All the intervals of a cluster with at least two elements are in
+            a found pair. A gold pair is a pair of distinct intervals with
+            the same ngram that are not in the same file and overlapping, so
+            its tokens are the paired intervals (see `get_paired`) of each
+            ngram group. A found pair is also a gold pair if it is a gold
+            pair of the group of its ngram in its cluster.
+
+            The tokens are represented by an integer id, so the groups are
+            lists of (filename, onset, offset, token_id).
+
+            Input
+            :param intervals: a list of all the discovered intervals, with
+                              their transcription
+            :param clusters: a dict of all the clusters found. the keys
+                             are the clusters names, the values are
+                             a list of the intervals in this cluster
+            Output
+            :return:        gold_groups, a dict {ngram: group} of all the
+                            discovered intervals grouped by ngram
+                            cluster_groups, a dict {ngram: [group]} of the
+                            intervals of each cluster grouped by ngram
+                            found_tokens, a dict {ngram: set of token ids}
+                            of the tokens in the found pairs
+        """
+        token_ids = dict()
+
+        def _compact(interval):
+            fname, disc_on, disc_off, token_ngram, ngram = interval
+            token_id = token_ids.setdefault(token_ngram, len(token_ids))
+            return (fname, disc_on, disc_off, token_id)
+
+        gold_groups = defaultdict(set)
+        for interval in self.intervals:
+            gold_groups[interval[4]].add(_compact(interval))
+
+        found_tokens = defaultdict(set)
+        cluster_groups = defaultdict(list)
+        with progress.task('clusters', total=len(self.clusters),
+                           unit='clusters') as task:
+            for class_nb in self.clusters:
+                task.advance()
+                # count type only if clusters has two elements
+                if len(self.clusters[class_nb]) < 2:
+                    continue
+
+                same = defaultdict(set)
+                for interval in self.clusters[class_nb]:
+                    compact = _compact(interval)
+                    found_tokens[interval[4]].add(compact[3])
+                    same[interval[4]].add(compact)
+
+                for ngram in same:
+                    if len(same[ngram]) > 1:
+                        cluster_groups[ngram].append(list(same[ngram]))
+
+        gold_groups = {ngram: list(gold_groups[ngram])
+                       for ngram in gold_groups}
+        return gold_groups, cluster_groups, found_tokens
+
+    @staticmethod
+    def count_paired_tokens(gold_groups, cluster_groups):
+        """ Count the tokens of each type in the gold pairs and in the
+            found pairs that are also gold pairs.
+
+            The tokens of a type only depend on the groups of that type, so
+            the groups can be split by type between several processes and
+            their counters merged.
+
+            Input
+            :param gold_groups:     a dict {ngram: group}, see `get_groups`
+            :param cluster_groups:  a dict {ngram: [group]}, see `get_groups`
+            Output
+            :return:        gold_counter, found_gold_counter, two Counters
+                            that give for each type the number of its tokens
+                            in the gold pairs, and in the intersection of
+                            the found and gold pairs.
+        """
+        gold_counter = Counter()
+        for ngram in gold_groups:
+            paired = {interval[3] for interval
+                      in Grouping.get_paired(gold_groups[ngram])}
+            if len(paired) > 0:
+                gold_counter[ngram] = len(paired)
+            progress.advance()
+
+        found_gold_counter = Counter()
+        for ngram in cluster_groups:
+            paired = {interval[3] for group in cluster_groups[ngram]
+                      for interval in Grouping.get_paired(group)}
+            if len(paired) > 0:
+                found_gold_counter[ngram] = len(paired)
+            progress.advance()
+
+        return gold_counter, found_gold_counter
+
+    def split_groups(self, gold_groups, cluster_groups):
+        """ Split the groups by type in `njobs` shards of about the same
+            size, the largest types being assigned first to the least loaded
+            shard.
+        """
+        ngrams = list(set(gold_groups) | set(cluster_groups))
+        sizes = [len(gold_groups.get(ngram, []))
+                 + sum(len(group) for group in cluster_groups.get(ngram, []))
+                 for ngram in ngrams]
+
+        from joblib import effective_n_jobs
+        shards = []
+        for shard in split_by_cost(sizes, effective_n_jobs(self.njobs)):
+            shard = [ngrams[ix] for ix in shard]
+            shards.append((
+                {ngram: gold_groups[ngram] for ngram in shard
+                 if ngram in gold_groups},
+                {ngram: cluster_groups[ngram] for ngram in shard
+                 if ngram in cluster_groups}))
+        return shards
+
+    @staticmethod
+    def get_counter_weights(counter):
+        """ For each type get its weight, from the number of tokens of each
+            type that appear in a set of pairs
+
+            Input
+            :param counter: a Counter that gives for each type (ngram) the
+                            number of its tokens in the pairs
+            Output
+            :return:        weights, the same weights as `get_weights`
+                            returns for this set of pairs
+        """
+        n_tokens = sum(counter.values())
+        return {ngram: counter[ngram]/n_tokens for ngram in counter}
+
     def compute_grouping(self):
         """ Compute the grouping by essentially counting the number of tokens
             of each type in three sets: the set of gold pairs, the set of
             found pairs, and the intersection of gold pairs and found pairs
+
+            If njobs is not 1, the types are split between njobs processes,
+            which gives exactly the same counts.
+        """
+        if self.clusters is None:
+            # read in streaming but no cluster given
+            self.clusters, self.intervals = dict(), []
+        gold_groups, cluster_groups, found_tokens = self.get_groups()
+
+        # the progress of the processes of joblib is not reported, the
+        # types are only counted once they are all done
+        n_groups = len(gold_groups) + len(cluster_groups)
+        with progress.task('types', total=n_groups, unit='types') as task:
+            if self.njobs == 1:
+                self.gold_counter, self.found_gold_counter = (
+                    self.count_paired_tokens(gold_groups, cluster_groups))
+            else:
+                # joblib is only imported when several cpus are used
+                from joblib import Parallel, delayed
+                counters = Parallel(n_jobs=self.njobs)(
+                    delayed(self.count_paired_tokens)(
+                        shard_gold, shard_cluster)
+                    for shard_gold, shard_cluster
+                    in self.split_groups(gold_groups, cluster_groups))
+                self.gold_counter = Counter()
+                self.found_gold_counter = Counter()
+                for gold_counter, found_gold_counter in counters:
+                    self.gold_counter.update(gold_counter)
+                    self.found_gold_counter.update(found_gold_counter)
+                task.advance(n_groups)
+
+        self.set_counters(
+            self.gold_counter, self.found_gold_counter,
+            Counter({ngram: len(found_tokens[ngram])
+                     for ngram in found_tokens}))
+
+    def set_counters(self, gold_counter, found_gold_counter, found_counter):
+        """ Set the number of tokens of each type in the gold pairs, in the
+            found pairs that are also gold pairs, and in the found pairs,
+            and compute the weights of the types from them.
+
+            Input
+            :param gold_counter:        Counter {ngram: number of tokens}
+            :param found_gold_counter:  Counter {ngram: number of tokens}
+            :param found_counter:       Counter {ngram: number of tokens}
         """
-        self.get_gold_pairs()
-        self.get_found_pairs()
-
-        gold_found_pairs = self.found_pairs.intersection(self.gold_pairs)
-        self.gold_weights, self.gold_counter = self.get_weights(
-            self.gold_pairs)
-        ## get intersection of discovered pairs and gold pairs
-        ## and count occurences and weights for gold pairs
-        #gold_found_pairs, self.gold_counter, self.gold_weights = self.get_gold_pairs()
-
-        # count occurences and weights for found pairs
-        self.found_weights, self.found_counter = self.get_weights(
-            self.found_pairs)
-
-        # count occurences and weights for intersection of gold and
-        # found pairs
-        _, self.found_gold_counter = self.get_weights(gold_found_pairs)
+        self.gold_counter = gold_counter
+        self.found_gold_counter = found_gold_counter
+        self.found_counter = found_counter
+        self.gold_types = set(gold_counter)
+        self.found_types = set(found_counter)
+
+        # weights for gold pairs and for found pairs
+        self.gold_weights = self.get_counter_weights(self.gold_counter)
+        self.found_weights = self.get_counter_weights(self.found_counter)
@@ -2,6 +2,16 @@
    This class defines the object Measure, from which all measure inherit
    and that allows to store precision, recall and fscore.
    It also contains functions to pretty print, write into files...
+
+   The measures that can be computed incrementally also implement
+   `update`, which takes the intervals of one discovered cluster, so that
+   they can be fed while the class file is read (see Disc.iter_clusters)
+   instead of reading all the clusters first.
+
+   When several measures are computed together, the clusters are given to
+   `update_batch` in batches, along with the facts about their intervals
+   that several measures need (see tde.measures.facts), so that those facts
+   are only computed once (see tde.evaluation).
 """
 import os
 
@@ -21,6 +31,21 @@ class Measure():
     def recall(self):
         raise NotImplementedError('Should not use Measure.recall directly')
 
+    def update(self, intervals):
+        """Add the intervals of one discovered cluster to the measure"""
+        raise NotImplementedError(
+            '{} can not be computed incrementally'.format(self.metric_name))
+
+    def update_batch(self, clusters, facts):
+        """Add a batch of discovered clusters to the measure
+
+        clusters is a list of the intervals of each cluster, and facts the
+        IntervalFacts of the distinct intervals of the batch that were
+        not in a previous batch. By default, each cluster is given to
+        `update`."""
+        for intervals in clusters:
+            self.update(intervals)
+
     @property
     def fscore(self):
         if not (self.recall is not None
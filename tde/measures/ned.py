@@ -1,8 +1,16 @@
 import os
+import math
 import numpy as np
 import editdistance
 from .measures import Measure
 from itertools import combinations
+from collections import Counter
+from tde import progress
+from tde.utils import split_by_cost
+
+
+# maximal number of pairs of ngrams whose ned are memoized across clusters
+MEMO_SIZE = 2**16
 
 
 class Ned(Measure):
@@ -18,24 +26,81 @@ class Ned(Measure):
     Input
     :param disc: Discovered Object, contains the discovered phonemes
     :param output_folder: string, path to the output folder
+    :param njobs: Number of cpus to be used (same convention as joblib,
+                  -1 to use all the cpus).
+    :param budget: if given, number of pairs sampled to estimate the NED
+    :param seed: seed of the sampling and of the bootstrap
+    :param n_bootstrap: number of bootstrap samples of the estimate
+    :param confidence: level of the confidence interval of the estimate
 
     Output
     :param coverage: NED
+    :param ned_interval: confidence interval (low, high) of the NED when
+                         it is estimated, None otherwise
+
+    In a cluster, many intervals usually have the same transcription, so the
+    edit distance is only computed once for each pair of distinct ngrams of
+    the cluster, and weighted by the number of pairs of intervals having
+    these ngrams. The distances of the small clusters are also memoized
+    across clusters, in a memo of at most MEMO_SIZE pairs.
+
+    When the phones are integer coded (Disc with encoded=True), the pairs of
+    distinct ngrams of many clusters are gathered, and their edit distances
+    are computed all at once with a vectorized Levenshtein distance (see
+    `batch_ned`).
+
+    With njobs > 1, the clusters are split between njobs processes, balanced
+    by the number of pairs of distinct ngrams of each cluster, and the sums
+    of each process are added.
+
+    The exact ned is quadratic in the number of distinct ngrams of each
+    cluster. With a `budget`, the ned is instead estimated from about
+    `budget` pairs, sampled uniformly within the clusters and stratified by
+    cluster size (see `sample_ned`), and `ned_interval` gives its bootstrap
+    confidence interval. The exact ned stays the default, and should be
+    used for published results.
     """
 
-    def __init__(self, disc, output_folder=None):
+    def __init__(self, disc, output_folder=None, njobs=1, budget=None,
+                 seed=0, n_bootstrap=1000, confidence=0.95):
         self.metric_name = "ned"
         self.output_folder = output_folder
         self.disc = disc.clusters
+        self.njobs = njobs
+
+        # when the phones are encoded, ngrams are ids of the vocabulary
+        self.vocabulary = getattr(disc, 'vocabulary', None)
+        self.stripped = dict()
+
+        # ned of the pairs of distinct ngrams already computed, until the
+        # end of compute_ned, at most MEMO_SIZE pairs, see `cluster_ned`
+        self.memo = dict()
+
+        # ngram counts of the clusters added with update, when they are
+        # processed in parallel in compute_ned
+        self.pending = []
+
+        # approximate mode
+        self.budget = budget
+        self.seed = seed
+        self.n_bootstrap = n_bootstrap
+        self.confidence = confidence
 
         # measures
-        self.n_pairs = None
+        self.n_pairs = 0
+        self.ned_sum = 0.0
         self.ned = None
+        self.ned_interval = None
 
     @staticmethod
     def pairwise_ned(s1, s2):
         s1 = tuple(phn for phn in s1 if phn != "SIL")
         s2 = tuple(phn for phn in s2 if phn != "SIL")
+        return Ned.ngram_ned(s1, s2)
+
+    @staticmethod
+    def ngram_ned(s1, s2):
+        """ ned of two ngrams without silences"""
         if max(len(s1), len(s2)) > 0:
             return float(editdistance.eval(s1, s2)) / max(len(s1), len(s2))
         else:
@@ -51,19 +116,444 @@ class Ned(Measure):
                           all the intervals in this cluster.
             Output:
             :param ned:   the average edit distance of all the pairs
+
+            When the clusters are given one at a time with `update`, only
+            computes the average of the pairs added.
+
+            With a budget, the ned of the clusters is estimated by sampling
+            pairs, see `sample_ned`.
+        """
+        if self.disc is not None:
+            self.n_pairs = 0
+            self.ned_sum = 0.0
+            with progress.task('clusters', total=len(self.disc),
+                               unit='clusters') as task:
+                for class_nb in self.disc:
+                    self.update(self.disc[class_nb])
+                    task.advance()
+
+        if len(self.pending) > 0 and self.budget is not None:
+            rng = np.random.RandomState(self.seed)
+            ned_sum, n_pairs, replicates = self.sample_ned(
+                self.pending, self.budget, rng, self.n_bootstrap)
+            self.ned_sum += ned_sum
+            self.n_pairs += n_pairs
+            self.pending = []
+            if self.n_pairs > 0:
+                alpha = (1 - self.confidence) / 2
+                low, high = np.percentile(
+                    (self.ned_sum - ned_sum + replicates) / self.n_pairs,
+                    [100 * alpha, 100 * (1 - alpha)])
+                self.ned_interval = (float(low), float(high))
+
+        if len(self.pending) > 0:
+            encoded = self.vocabulary is not None
+            # the pairs of distinct ngrams, whose ned are computed
+            n_ngram_pairs = sum(len(counts) * (len(counts) - 1) // 2
+                                for counts in self.pending)
+            with progress.task('pairs', total=n_ngram_pairs,
+                               unit='pairs') as task:
+                if self.njobs == 1:
+                    sums = [self.sum_ned(self.pending, encoded)]
+                else:
+                    # joblib is only imported when several cpus are used,
+                    # the progress of its processes is not reported
+                    from joblib import Parallel, delayed, effective_n_jobs
+                    costs = [len(counts) ** 2 for counts in self.pending]
+                    sums = Parallel(n_jobs=self.njobs)(
+                        delayed(self.sum_ned)(
+                            [self.pending[ix] for ix in shard], encoded)
+                        for shard in split_by_cost(
+                            costs, effective_n_jobs(self.njobs)))
+                    task.advance(n_ngram_pairs)
+            for ned_sum, n_pairs in sums:
+                self.ned_sum += ned_sum
+                self.n_pairs += n_pairs
+            self.pending = []
+
+        # get ned value
+        if self.n_pairs == 0:
+            self.ned = np.nan
+        else:
+            self.ned = self.ned_sum / self.n_pairs
+        self.memo = dict()
+
+    def update(self, intervals):
+        """ Add the pairs of one discovered cluster to the ned sum
+
+            With njobs > 1, with a budget, or when the phones are encoded,
+            the ngrams of the cluster are only counted, and its pairs are
+            added in `compute_ned`.
+        """
+        if self.vocabulary is not None:
+            self.pending.append(self.count_encoded_ngrams(intervals))
+            return
+
+        counts = self.count_ngrams(intervals)
+        if self.njobs == 1 and self.budget is None:
+            ned_sum, n_pairs = self.cluster_ned(counts, self.memo)
+            self.ned_sum += ned_sum
+            self.n_pairs += n_pairs
+        else:
+            self.pending.append(counts)
+
+    @staticmethod
+    def count_ngrams(intervals):
+        """ Count the intervals of a cluster by ngram, without silences"""
+        return Counter(
+            tuple(phn for phn in ngram if phn != "SIL")
+            for fname, disc_on, disc_off, token_ngram, ngram in intervals)
+
+    def count_encoded_ngrams(self, intervals):
+        """ Count the intervals of a cluster by ngram, when the ngrams are
+            ids of the vocabulary. The counts are given by tuple of phone
+            codes without silences."""
+        ids = Counter(ngram for _, _, _, _, ngram in intervals)
+        counts = Counter()
+        for ngram, count in ids.items():
+            if ngram not in self.stripped:
+                sil = self.vocabulary.symbol2ix.get("SIL")
+                self.stripped[ngram] = tuple(
+                    code for code in self.vocabulary.codes(ngram)
+                    if code != sil)
+            counts[self.stripped[ngram]] += count
+        return counts
+
+    @staticmethod
+    def cluster_ned(counts, memo=None, block_size=100000):
+        """ Return the sum of the ned of all the pairs of a cluster, and its
+            number of pairs, given its ngram counts (see `count_ngrams`)
+
+            The c * (c - 1) / 2 pairs of intervals with the same ngram have a
+            ned of 0 (or 1 if the ngram is empty), and the c1 * c2 pairs of
+            two distinct ngrams all have the same ned, computed only once.
+            The ned of the pairs of ngrams are kept in the dict `memo`, if
+            given, so that they are computed once for several clusters. The
+            memo is emptied when it holds MEMO_SIZE pairs, and isn't used
+            for the clusters with more pairs of distinct ngrams than that,
+            whose pairs are unlikely to be seen again.
+
+            The clusters with more than block_size pairs of distinct ngrams
+            are computed by blocks instead, with their phones coded as
+            integers (see `large_cluster_ned`), so that the memory used
+            doesn't depend on their size.
+        """
+        n_intervals = sum(counts.values())
+        n_pairs = n_intervals * (n_intervals - 1) // 2
+
+        ned_sum = 0.0
+        for ngram, count in counts.items():
+            if len(ngram) == 0:
+                ned_sum += count * (count - 1) // 2
+
+        if len(counts) * (len(counts) - 1) // 2 > block_size:
+            ned_sum += Ned.large_cluster_ned(Ned.encode_counts(counts),
+                                             block_size)
+            return ned_sum, n_pairs
+
+        pairs = combinations(sorted(counts.items()), 2)
+        if memo is None or len(counts) * (len(counts) - 1) // 2 > MEMO_SIZE:
+            for (ngram1, count1), (ngram2, count2) in pairs:
+                ned_sum += count1 * count2 * Ned.ngram_ned(ngram1, ngram2)
+            return ned_sum, n_pairs
+
+        for (ngram1, count1), (ngram2, count2) in pairs:
+            if (ngram1, ngram2) not in memo:
+                if len(memo) >= MEMO_SIZE:
+                    memo.clear()
+                memo[ngram1, ngram2] = Ned.ngram_ned(ngram1, ngram2)
+            ned_sum += count1 * count2 * memo[ngram1, ngram2]
+        return ned_sum, n_pairs
+
+    @staticmethod
+    def encode_counts(counts):
+        """ Return the ngram counts of a cluster, with the phones of the
+            ngrams coded as integers, in the order they are seen"""
+        codes = dict()
+        return Counter({
+            tuple(codes.setdefault(phn, len(codes)) for phn in ngram): count
+            for ngram, count in counts.items()})
+
+    @staticmethod
+    def pair_blocks(n, block_size=100000):
+        """ Yield the pairs (i, j), i < j < n, in the order of
+            np.triu_indices(n, 1), by blocks of whole rows of about
+            block_size pairs, as two arrays (first, second). Only one block
+            is in memory at a time, even when n is large.
+        """
+        lengths = n - 1 - np.arange(n, dtype=np.int64)
+        ends = np.cumsum(lengths)
+        row = 0
+        while row < n - 1:
+            # the rows whose pairs end before the block is full, at least one
+            done = ends[row] - lengths[row]
+            last = max(row + 1, int(np.searchsorted(
+                ends, done + block_size, 'right')))
+            rows = np.arange(row, min(last, n - 1))
+            first = np.repeat(rows, lengths[rows])
+            starts = np.repeat(np.cumsum(lengths[rows]) - lengths[rows],
+                               lengths[rows])
+            yield first, np.arange(len(first)) - starts + first + 1
+            row = rows[-1] + 1
+
+    @staticmethod
+    def sum_ned(clusters_counts, encoded=False, batch_size=100000):
+        """ Return the sum of the ned of all the pairs of several clusters,
+            and their number of pairs, as (sum, count)
+
+            If encoded, the ngrams are tuples of phone codes, and the ned
+            of the pairs of distinct ngrams are computed by batches of
+            about batch_size pairs with `batch_ned`. Otherwise they are
+            computed cluster by cluster with `cluster_ned`. Either way, the
+            clusters with more pairs of distinct ngrams than batch_size are
+            computed alone, by blocks (see `large_cluster_ned`), so the
+            memory used doesn't depend on the size of the clusters.
+        """
+        ned_sum, n_pairs = 0.0, 0
+        if not encoded:
+            memo = dict()
+            for counts in clusters_counts:
+                cluster_sum, cluster_pairs = Ned.cluster_ned(
+                    counts, memo, batch_size)
+                ned_sum += cluster_sum
+                n_pairs += cluster_pairs
+                progress.advance(len(counts) * (len(counts) - 1) // 2)
+            return ned_sum, n_pairs
+
+        # the distinct ngrams seen, and the pairs of distinct ngrams of each
+        # cluster as indices in this list
+        ngrams, ngram2ix = [], dict()
+        pairs1, pairs2, weights = [], [], []
+        n_batch = 0
+        for counts in clusters_counts:
+            n_intervals = sum(counts.values())
+            n_pairs += n_intervals * (n_intervals - 1) // 2
+            for ngram, count in counts.items():
+                if len(ngram) == 0:
+                    ned_sum += count * (count - 1) // 2
+            if len(counts) < 2:
+                continue
+
+            if len(counts) * (len(counts) - 1) // 2 > batch_size:
+                ned_sum += Ned.large_cluster_ned(counts, batch_size)
+                continue
+
+            for ngram in counts:
+                if ngram not in ngram2ix:
+                    ngram2ix[ngram] = len(ngrams)
+                    ngrams.append(ngram)
+            ixs = np.array([ngram2ix[ngram] for ngram in counts],
+                           dtype=np.int64)
+            multiplicity = np.array(list(counts.values()), dtype=np.int64)
+            first, second = np.triu_indices(len(ixs), 1)
+            pairs1.append(ixs[first])
+            pairs2.append(ixs[second])
+            weights.append(multiplicity[first] * multiplicity[second])
+
+            n_batch += len(first)
+            if n_batch >= batch_size:
+                ned_sum += Ned._weighted_ned(ngrams, pairs1, pairs2, weights)
+                progress.advance(n_batch)
+                ngrams, ngram2ix = [], dict()
+                pairs1, pairs2, weights = [], [], []
+                n_batch = 0
+
+        if n_batch > 0:
+            ned_sum += Ned._weighted_ned(ngrams, pairs1, pairs2, weights)
+            progress.advance(n_batch)
+        return ned_sum, n_pairs
+
+    @staticmethod
+    def large_cluster_ned(counts, block_size=100000):
+        """ Return the sum of the ned of the pairs of distinct ngrams of a
+            cluster of integer coded ngrams, weighted by their counts,
+            computed by blocks of about block_size pairs (see `pair_blocks`)
+            instead of building all its pairs at once.
+        """
+        ngrams = list(counts)
+        multiplicity = np.array(list(counts.values()), dtype=np.int64)
+        padded, lengths = Ned.pad_ngrams(ngrams)
+        ned_sum = 0.0
+        for first, second in Ned.pair_blocks(len(ngrams), block_size):
+            ned_sum += float(np.dot(
+                multiplicity[first] * multiplicity[second],
+                Ned.padded_ned(padded, lengths, first, second)))
+            progress.advance(len(first))
+        return ned_sum
+
+    @staticmethod
+    def sample_ned(clusters_counts, budget, rng, n_bootstrap=1000,
+                   min_samples=50):
+        """ Estimate the sum of the ned of all the pairs of several clusters
+            from about `budget` sampled pairs
+
+            The clusters are stratified by size, in powers of two, and the
+            budget is split between the strata in proportion to their
+            number of pairs, with at least `min_samples` pairs in each
+            stratum. The pairs of a stratum are sampled uniformly,
+            by choosing a cluster with a probability proportional to its
+            number of pairs, and then two of its intervals. The strata that
+            have fewer pairs of distinct ngrams than their share of the
+            budget are computed exactly, as in `sum_ned`.
+
+            The mean ned of the pairs of each sampled stratum is resampled
+            `n_bootstrap` times (bootstrap), which gives the distribution
+            of the estimate.
+
+            Input
+            :param clusters_counts: list of the ngram counts of each
+                                    cluster, see `count_ngrams`
+            :param budget: number of pairs to sample
+            :param rng: numpy RandomState, for the sampling and bootstrap
+            :param n_bootstrap: number of bootstrap samples
+            :param min_samples: minimal number of pairs sampled in a stratum
+            Output
+            :return: (sum, count, replicates), the estimated sum of the
+                     ned of the pairs, the exact number of pairs, and the
+                     sums of the n_bootstrap bootstrap samples
         """
-        overall_ned = []
-        for class_nb in self.disc:
-            for discovered1, discovered2 in combinations(
-                    self.disc[class_nb], 2):
-                fname1, disc_on1, disc_off1, token_ngram1, ngram1 = discovered1
-                fname2, disc_on2, disc_off2, token_ngram2, ngram2 = discovered2
-                pair_ned = self.pairwise_ned(ngram1, ngram2)
-                overall_ned.append(pair_ned)
-
-        # get number of pairs and ned value
-        self.n_pairs = len(overall_ned)
-        self.ned = np.mean(overall_ned)
+        # the phones are integer coded, for batch_ned
+        codes = dict()
+
+        def _encode(ngram):
+            return tuple(codes.setdefault(phn, len(codes)) for phn in ngram)
+
+        clusters_counts = [
+            {_encode(ngram): count for ngram, count in counts.items()}
+            for counts in clusters_counts]
+
+        sizes = np.array([sum(counts.values()) for counts in clusters_counts],
+                         dtype=np.int64)
+        pairs = sizes * (sizes - 1) // 2
+        costs = np.array([len(counts) * (len(counts) - 1) // 2
+                          for counts in clusters_counts], dtype=np.int64)
+        strata = np.floor(np.log2(np.maximum(sizes, 1))).astype(np.int64)
+        n_pairs = int(pairs.sum())
+
+        ned_sum, replicates = 0.0, np.zeros(n_bootstrap)
+        for stratum in np.unique(strata):
+            members = np.flatnonzero((strata == stratum) & (pairs > 0))
+            stratum_pairs = int(pairs[members].sum())
+            if stratum_pairs == 0:
+                continue
+            # a few samples would underestimate the variance of the stratum
+            n_samples = max(min_samples, int(math.ceil(
+                budget * stratum_pairs / n_pairs)))
+            if costs[members].sum() <= n_samples:
+                exact_sum, _ = Ned.sum_ned(
+                    [clusters_counts[ix] for ix in members], encoded=True)
+                ned_sum += exact_sum
+                replicates += exact_sum
+                continue
+
+            # the sampled clusters, and the positions of their intervals
+            # in a concatenation of these clusters sorted by ngram
+            chosen = rng.choice(members, size=n_samples,
+                                p=pairs[members] / stratum_pairs)
+            unique, chosen = np.unique(chosen, return_inverse=True)
+            ngrams, ngram2ix, ngram_ixs, ends = [], dict(), [], []
+            for ix in unique:
+                for ngram in clusters_counts[ix]:
+                    if ngram not in ngram2ix:
+                        ngram2ix[ngram] = len(ngrams)
+                        ngrams.append(ngram)
+                    ngram_ixs.append(ngram2ix[ngram])
+                ends.append(list(clusters_counts[ix].values()))
+            ngram_ixs = np.array(ngram_ixs, dtype=np.int64)
+            ends = np.cumsum(np.concatenate(ends))
+            starts = np.concatenate(
+                [[0], np.cumsum(sizes[unique])])[:-1][chosen]
+
+            # two distinct intervals of each sampled cluster
+            n = sizes[unique][chosen]
+            first = rng.randint(0, n)
+            second = rng.randint(0, n - 1)
+            second += second >= first
+            values = Ned.batch_ned(
+                ngrams,
+                ngram_ixs[np.searchsorted(ends, starts + first, 'right')],
+                ngram_ixs[np.searchsorted(ends, starts + second, 'right')])
+
+            # the ned of the pairs take few distinct values, so resampling
+            # them amounts to drawing the counts of those values
+            ned_sum += stratum_pairs * values.mean()
+            distinct, counts = np.unique(values, return_counts=True)
+            resampled = rng.multinomial(
+                n_samples, counts / n_samples, size=n_bootstrap)
+            replicates += stratum_pairs * resampled.dot(distinct) / n_samples
+        return ned_sum, n_pairs, replicates
+
+    @staticmethod
+    def _weighted_ned(ngrams, pairs1, pairs2, weights):
+        """ Sum of the ned of the pairs of ngrams, weighted"""
+        return float(np.dot(np.concatenate(weights), Ned.batch_ned(
+            ngrams, np.concatenate(pairs1), np.concatenate(pairs2))))
+
+    @staticmethod
+    def batch_ned(ngrams, ix1, ix2):
+        """ Return the ned of each pair (ngrams[ix1[i]], ngrams[ix2[i]]) of
+            integer coded ngrams, as `pairwise_ned` would.
+
+            The pairs are grouped by the lengths of their ngrams, and the
+            Levenshtein distances of all the pairs of a group are computed
+            at once, one row of the dynamic programming table at a time. In
+            row i, the substitutions and deletions only depend on row i - 1,
+            and the insertions are a cumulative minimum along the row.
+        """
+        padded, lengths = Ned.pad_ngrams(ngrams)
+        return Ned.padded_ned(padded, lengths, ix1, ix2)
+
+    @staticmethod
+    def pad_ngrams(ngrams):
+        """ Return the integer coded ngrams in a matrix padded with zeros,
+            and their lengths"""
+        lengths = np.array([len(ngram) for ngram in ngrams], dtype=np.int64)
+        max_len = max(1, int(lengths.max()) if len(lengths) > 0 else 1)
+        padded = np.zeros((len(ngrams), max_len), dtype=np.int64)
+        for ix, ngram in enumerate(ngrams):
+            padded[ix, :len(ngram)] = ngram
+        return padded, lengths
+
+    @staticmethod
+    def padded_ned(padded, lengths, ix1, ix2):
+        """ `batch_ned` of ngrams given by `pad_ngrams`"""
+        max_len = padded.shape[1]
+
+        # the distance is symmetric, so the shortest ngram is put first
+        ix1 = np.array(ix1, dtype=np.int64)
+        ix2 = np.array(ix2, dtype=np.int64)
+        swap = lengths[ix1] > lengths[ix2]
+        ix1[swap], ix2[swap] = ix2[swap], ix1[swap]
+        len1, len2 = lengths[ix1], lengths[ix2]
+
+        distances = np.zeros(len(ix1), dtype=np.int64)
+        groups = len1 * (max_len + 1) + len2
+        order = np.argsort(groups, kind='stable')
+        bounds = np.flatnonzero(np.diff(groups[order])) + 1
+        for pairs in np.split(order, bounds):
+            if len(pairs) == 0:
+                continue
+            n1, n2 = int(len1[pairs[0]]), int(len2[pairs[0]])
+            if n1 == 0:
+                distances[pairs] = n2
+                continue
+            codes1 = padded[ix1[pairs], :n1]
+            codes2 = padded[ix2[pairs], :n2]
+            cols = np.arange(n2 + 1)
+            previous = np.tile(cols, (len(pairs), 1))
+            for i in range(1, n1 + 1):
+                current = np.empty_like(previous)
+                current[:, 0] = i
+                current[:, 1:] = np.minimum(
+                    previous[:, 1:] + 1,
+                    previous[:, :-1] + (codes1[:, i - 1:i] != codes2))
+                previous = np.minimum.accumulate(
+                    current - cols, axis=1) + cols
+            distances[pairs] = previous[:, n2]
+
+        max_lengths = np.maximum(len1, len2)
+        return np.where(max_lengths > 0,
+                        distances / np.maximum(max_lengths, 1), 1.0)
 
     def write_score(self):
         if self.ned is None:
@@ -72,3 +562,8 @@ class Ned(Measure):
         with open(os.path.join(self.output_folder, self.metric_name), 'w') as fout:
             fout.write("metric: {}\n".format(self.metric_name))
             fout.write("score: {}\n".format(self.ned))
+            if self.ned_interval is not None:
+                fout.write("estimated from {} sampled pairs\n".format(
+                    self.budget))
+                fout.write("{:.0%} confidence interval: {} {}\n".format(
+                    self.confidence, *self.ned_interval))
@@ -2,7 +2,8 @@ import os
 import numpy as np
 
 from .measures import Measure
-from tde.utils import overlap
+from .facts import IntervalFacts
+from tde.readers.alignment import Alignment, to_alignment
 
 
 class TokenType(Measure):
@@ -32,24 +33,22 @@ class TokenType(Measure):
         self.metric_name = "token_type"
         self.output_folder = output_folder
 
-        # get gold as interval trees
-        self.gold_phn = gold.phones
-
-        assert type(self.gold_phn) == dict, (
-            "gold_phn should be a dict "
-            "of intervaltree objects but is {} ".format(type(self.gold_phn)))
-        self.gold_wrd = gold.words
-        assert type(self.gold_wrd) == dict, (
-            "gold_phn should be a dict "
-            "of intervaltree objects but is {} ".format(type(self.gold_wrd)))
-        self.all_type = set()
-        self.n_token = 0
+        # get gold as columnar alignments
+        assert isinstance(gold.phones, (dict, Alignment)), (
+            "gold_phn should be an Alignment or a dict "
+            "of intervaltree objects but is {} ".format(type(gold.phones)))
+        assert isinstance(gold.words, (dict, Alignment)), (
+            "gold_wrd should be an Alignment or a dict "
+            "of intervaltree objects but is {} ".format(type(gold.words)))
+        self.gold_phn = to_alignment(gold.phones)
+        self.gold_wrd = to_alignment(gold.words)
+        self.word_index = gold.word_index
 
         # get gold types and count gold tokens
-        for fname in self.gold_wrd:
-            self.all_type.update(set(
-                [word for on, off, word in self.gold_wrd[fname]]))
-            self.n_token += len(self.gold_wrd[fname])
+        self.all_type = set(
+            self.gold_wrd.ix2symbol[ix]
+            for ix in np.unique(self.gold_wrd.symbol).tolist())
+        self.n_token = self.gold_wrd.n_intervals
         self.n_type = len(self.all_type)
 
         # get discovered as list of intervals
@@ -57,6 +56,7 @@ class TokenType(Measure):
 
         # measures
         self.n_discovered_words = 0
+        self.disc_seen = set()
         self.type_hit = set()
         self.token_hit = 0
         self.type_seen = set()
@@ -70,10 +70,10 @@ class TokenType(Measure):
     def precision(self):
         """Return Token and Type precision"""
         # Token precision/recall
-        if len(self.disc) == 0:
+        if self.n_discovered_words == 0:
             self.token_prec = np.nan
         else:
-            self.token_prec = self.token_hit / len(self.disc)
+            self.token_prec = self.token_hit / self.n_discovered_words
 
         # Types precision/recall
         if len(self.type_seen) == 0:
@@ -127,65 +127,63 @@ class TokenType(Measure):
 
             Input:
             :param gold_phn: the gold phone alignment
-                             stored as an interval tree
-            :type gold_phn:  Interval Tree
+            :type gold_phn:  Alignment
             :param gold_wrd: the gold word alignment
-                             stored as an interval tree
-            :type gold_wrd:  Interval Tree
+            :type gold_wrd:  Alignment
             :param disc:     a list of all the discovered
                              intervals
             :type disc:      list of tuples
             Output:
             :return:         The Token Type measure
         """
-        for fname, disc_on, disc_off, token_ngram, ngram in self.disc:
-            if fname not in self.gold_wrd:
-                raise ValueError('{}: file not found in gold'.format(fname))
+        if self.disc is not None:
+            self.update(self.disc)
+
+    def update(self, intervals):
+        """ Add the given discovered intervals to the token and type counts.
 
-            overlap_wrd = self.gold_wrd[fname].overlap(disc_on, disc_off)
-            # ngram = tuple(phn for _, _, phn in ngram)
-            # get type by getting ngram covered
-            self.type_seen.add(tuple(ngram))
+            An interval already seen (for instance in another cluster) is
+            only counted once.
+        """
+        self.update_batch([intervals], IntervalFacts(
+            intervals, self.word_index, self.disc_seen))
+
+    def update_batch(self, clusters, facts):
+        """ Add the new intervals of a batch to the token and type counts,
+            using the gold word overlapping the most with each interval
+            (see IntervalFacts.words). The transcription of the word and
+            the ngram of the interval are compared by their type ids.
+        """
+        for (fname, disc_on, disc_off, token_ngram, ngram), wrd_ix, \
+                wrd_type, ngram_type in zip(facts.intervals,
+                                            facts.words.tolist(),
+                                            facts.words_types.tolist(),
+                                            facts.ngrams_types.tolist()):
+            self.n_discovered_words += 1
+
+            # get type by getting ngram covered, ngram is an id if the
+            # phones are encoded
+            self.type_seen.add(
+                ngram if isinstance(ngram, int) else tuple(ngram))
 
-            # switch cases.
             # if interval overlaps with less than 1 word
             # don't count
-            # if overlapped word is not fully discovered, i.e.
-            # onset and offset are less than 30ms or 50% away
-            # from border phone boundaries, then don't count
-            if len(overlap_wrd) < 1:
+            if wrd_ix < 0:
                 continue
-            elif len(overlap_wrd) > 1:
-                # choose word with the most overlap
-                current_overlap = 0
-                for wrd_on, wrd_off, wrd in overlap_wrd:
-                    ov, _ = overlap((disc_on, disc_off), (wrd_on, wrd_off))
-                    if ov > current_overlap:
-                        current_overlap = ov
-                        chosen = (wrd_on, wrd_off, wrd)
-
-                overlap_wrd = chosen
-
-            else:
-                # Get word and add it to types seen (not necessarily hit)
-                overlap_wrd = overlap_wrd.pop()
-            gold_wrd_on, gold_wrd_off, gold_wrd_token = overlap_wrd
-            gold_wrd_trs = sorted(
-                [phn for phn
-                 in self.gold_phn[fname].overlap(gold_wrd_on, gold_wrd_off)])
-
-            gold_wrd_trs = tuple(
-                [phn for phn_on, phn_off, phn in gold_wrd_trs])
-
-            if ((gold_wrd_trs == ngram) and
-                not ((fname, gold_wrd_on,
-                      gold_wrd_off, gold_wrd_token) in self.token_seen)):
+
+            gold_wrd_token = (fname,
+                              float(self.gold_wrd.onset[wrd_ix]),
+                              float(self.gold_wrd.offset[wrd_ix]),
+                              self.gold_wrd.ix2symbol[
+                                  int(self.gold_wrd.symbol[wrd_ix])])
+
+            if ((wrd_type == ngram_type) and
+                    not (gold_wrd_token in self.token_seen)):
                 self.token_hit += 1
-                self.token_seen.add(
-                    (fname, gold_wrd_on, gold_wrd_off, gold_wrd_token))
+                self.token_seen.add(gold_wrd_token)
 
             # TODO CHECK HOMOPHONE CASE W/ EMMANUEL
-            if ((gold_wrd_trs == ngram) and ngram not in self.type_hit):
+            if ((wrd_type == ngram_type) and ngram not in self.type_hit):
                 self.type_hit.add(ngram)
 
     def write_score(self):
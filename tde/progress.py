@@ -0,0 +1,354 @@
+"""Progress reports, timers and profiles of the stages of an evaluation
+
+An evaluation is made of stages (reading the gold, reading the class file,
+computing each measure), recorded by :class:`Stages` with their wall time
+and peak resident memory. :class:`Progress` also reports what each stage is
+doing while it runs: the gold, the class file reader and the measures
+declare their long loops as tasks with :func:`task`, and advance them as
+they go, for instance
+
+    with progress.task('pairs', total=n_pairs) as pairs:
+        for ...:
+            pairs.advance(n)
+
+When a Progress is active (inside one of its stages), the done and total
+counts, the rate and the estimated time left of the current task are
+reported every `interval` seconds, to the standard error and to the
+callbacks of the Progress. Otherwise the tasks do nothing, so the
+instrumentation costs nothing when the package is used as a library.
+
+Each report is given to the callbacks as a :class:`ProgressEvent`. A
+callback can stop the evaluation by raising an exception, for instance when
+the estimated time left is too long.
+
+One stage can also be profiled, with cProfile or pyinstrument, and its
+profile written in a file.
+
+Example
+-------
+    def callback(event):
+        if event.eta is not None and event.eta > 3600:
+            raise RuntimeError('{} would take too long'.format(event.stage))
+
+    progress = Progress(callbacks=[callback], profile='ned',
+                        profile_output='ned.prof')
+    with progress.stage('disc'):
+        evaluation.run(disc.iter_clusters())
+    with progress.stage('ned'):
+        ned.compute_ned()
+
+"""
+
+import sys
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+
+# the Progress whose stage is running, if any
+_active = None
+
+
+ProgressEvent = namedtuple('ProgressEvent', [
+    'kind',         # 'start' or 'end' of a stage, or 'progress' of a task
+    'stage',        # name of the stage
+    'task',         # name of the task, None for the start and end events
+    'done',         # number of units of the task done
+    'total',        # total number of units of the task, None if unknown
+    'unit',         # unit of the counts, like 'clusters' or 'pairs'
+    'elapsed',      # seconds since the beginning of the stage or task
+    'rate',         # units done per second
+    'eta',          # estimated seconds left, None if unknown
+    'peak_memory'])  # peak resident memory in bytes, None if unknown
+
+
+def reset_peak_memory():
+    """ Reset the peak resident memory of the process, so that
+    `peak_memory` gives the peak since now. Only possible on Linux, return
+    False if it wasn't reset."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as fout:
+            fout.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def peak_memory():
+    """ Return the peak resident memory of the process in bytes, since the
+    last `reset_peak_memory` if it was possible, or None if unknown"""
+    try:
+        with open('/proc/self/status') as fin:
+            for line in fin:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class Stages():
+    """ Record the wall time and peak memory of the stages of an evaluation
+
+    Attributes
+    ----------
+    :param stages: OrderedDict {name: {'wall_time': seconds,
+                   'peak_memory': bytes}}, in the order the stages ended
+    :param reset_memory: if True, the peak memory of the process is reset
+                         at the beginning of each stage (see
+                         reset_peak_memory), which affects the whole
+                         process. Otherwise the peak memory of a stage is
+                         the peak since the beginning of the process.
+    """
+
+    def __init__(self, reset_memory=False):
+        self.stages = OrderedDict()
+        self.reset_memory = reset_memory
+
+    @contextmanager
+    def stage(self, name):
+        """ Context manager recording the stage `name`. The peak memory is
+        the peak during the stage if reset_memory is True and it can be
+        reset (Linux), and the peak since the beginning of the process
+        otherwise."""
+        if self.reset_memory:
+            reset_peak_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = OrderedDict([
+                ('wall_time', time.perf_counter() - start),
+                ('peak_memory', peak_memory())])
+
+
+class Task():
+    """ A loop of a stage, whose progress is reported
+
+    Attributes
+    ----------
+    :param name: name of the task
+    :param total: total number of units, None if unknown
+    :param unit: unit of the counts
+    :param done: number of units done
+    :param progress: the Progress the task reports to, None if it reports
+                     nothing
+    """
+
+    def __init__(self, name, total=None, unit='items', progress=None):
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.progress = progress
+        self.start = time.perf_counter()
+        self.next_report = (self.start + progress.interval
+                            if progress is not None else float('inf'))
+
+    def advance(self, n=1):
+        """ Count n more units done, and report the progress if the last
+        report is older than the interval of the Progress"""
+        self.done += n
+        if time.perf_counter() >= self.next_report:
+            self.progress.report(self)
+
+    def event(self, stage):
+        """ Return the ProgressEvent of the current state of the task"""
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total is not None and rate > 0:
+            eta = max(0.0, (self.total - self.done) / rate)
+        return ProgressEvent('progress', stage, self.name, self.done,
+                             self.total, self.unit, elapsed, rate, eta,
+                             peak_memory())
+
+
+@contextmanager
+def task(name, total=None, unit='items'):
+    """ Context manager declaring a task of the running stage, see the
+    module documentation. Yield the Task, which only reports its progress
+    if a Progress is active."""
+    progress = _active
+    current = Task(name, total, unit, progress)
+    if progress is None:
+        yield current
+        return
+    progress.tasks.append(current)
+    try:
+        yield current
+    finally:
+        progress.tasks.remove(current)
+
+
+def advance(n=1):
+    """ Advance the innermost task of the active Progress, if any. Used by
+    the functions that don't open the task themselves."""
+    if _active is not None and len(_active.tasks) > 0:
+        _active.tasks[-1].advance(n)
+
+
+def _format_count(count):
+    """ Format a number of units, with a suffix for the large numbers"""
+    for threshold, suffix in ((1e9, 'G'), (1e6, 'M'), (1e3, 'k')):
+        if count >= threshold:
+            return '{:.1f}{}'.format(count / threshold, suffix)
+    return '{:.0f}'.format(count)
+
+
+def _format_duration(seconds):
+    """ Format a duration in seconds, as h:mm:ss above a minute"""
+    if seconds < 60:
+        return '{:.1f}s'.format(seconds)
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+def format_event(event):
+    """ Return the line reporting a ProgressEvent, None for the start of a
+    stage, which the caller usually announces itself"""
+    memory = ('' if event.peak_memory is None else
+              ', peak {:.0f} MB'.format(event.peak_memory / 2**20))
+    if event.kind == 'start':
+        return None
+    if event.kind == 'end':
+        return '[{}] done in {}{}'.format(
+            event.stage, _format_duration(event.elapsed), memory)
+
+    if event.total is not None:
+        done = '{}/{} {}'.format(_format_count(event.done),
+                                 _format_count(event.total), event.unit)
+        if event.total > 0:
+            done += ' ({:.0%})'.format(event.done / event.total)
+    else:
+        done = '{} {}'.format(_format_count(event.done), event.unit)
+    eta = ('' if event.eta is None else
+           ', eta {}'.format(_format_duration(event.eta)))
+    # the task is often named after its unit
+    name = '' if event.task == event.unit else event.task + ': '
+    return '[{}] {}{}, {}/s{}{}'.format(
+        event.stage, name, done, _format_count(event.rate), eta, memory)
+
+
+class Progress(Stages):
+    """ Record the stages of an evaluation, and report their progress
+
+    Attributes
+    ----------
+    :param callbacks: list of functions called with each ProgressEvent
+    :param silent: if True, nothing is written, but the stages are still
+                   recorded and the callbacks called
+    :param stream: file in which the reports are written, the standard
+                   error by default
+    :param interval: minimal number of seconds between two reports of a
+                     task
+    :param profile: name of the stage to profile, None to profile nothing
+    :param profile_output: file in which the profile is written: a pstats
+                           file for cProfile, a text report for
+                           pyinstrument (or html if the name ends with
+                           .html)
+    :param profiler: 'cprofile' or 'pyinstrument'
+    :param reset_memory: if True, the peak memory is reset at the beginning
+                         of each stage, see Stages
+    :param tasks: the tasks of the running stage, innermost last
+    """
+
+    def __init__(self, callbacks=None, silent=False, stream=None,
+                 interval=5.0, profile=None, profile_output=None,
+                 profiler='cprofile', reset_memory=False):
+        super().__init__(reset_memory)
+        self.callbacks = list(callbacks or [])
+        self.silent = silent
+        self.stream = stream
+        self.interval = interval
+        self.tasks = []
+        self.current_stage = None
+
+        if profiler not in ('cprofile', 'pyinstrument'):
+            raise ValueError('{}: unknown profiler, choose cprofile or'
+                             ' pyinstrument'.format(profiler))
+        if profile is not None and profile_output is None:
+            raise ValueError('profile_output should be given to profile'
+                             ' a stage')
+        if profile is not None and profiler == 'pyinstrument':
+            # fail now rather than after the first stages
+            import pyinstrument
+        self.profile = profile
+        self.profile_output = profile_output
+        self.profiler = profiler
+
+    def add_callback(self, callback):
+        """ Call `callback` with each ProgressEvent"""
+        self.callbacks.append(callback)
+
+    def emit(self, event):
+        """ Give an event to the callbacks, and write it unless silent"""
+        for callback in self.callbacks:
+            callback(event)
+        line = format_event(event)
+        if not self.silent and line is not None:
+            stream = self.stream if self.stream is not None else sys.stderr
+            stream.write(line + '\n')
+            stream.flush()
+
+    def report(self, task):
+        """ Report the progress of a task"""
+        task.next_report = time.perf_counter() + self.interval
+        self.emit(task.event(self.current_stage))
+
+    @contextmanager
+    def stage(self, name):
+        """ Context manager recording the stage `name` (see Stages.stage),
+        during which the tasks report to this Progress. The stage is
+        profiled if it is the `profile` stage."""
+        global _active
+        previous = _active, self.current_stage, self.tasks
+        _active, self.current_stage, self.tasks = self, name, []
+        self.emit(ProgressEvent('start', name, None, 0, None, None, 0.0,
+                                0.0, None, None))
+        profiler = self.start_profiler() if name == self.profile else None
+        try:
+            with super().stage(name):
+                yield self
+        finally:
+            _active, self.current_stage, self.tasks = previous
+            if profiler is not None:
+                self.stop_profiler(profiler)
+
+        recorded = self.stages[name]
+        self.emit(ProgressEvent('end', name, None, 0, None, None,
+                                recorded['wall_time'], 0.0, None,
+                                recorded['peak_memory']))
+
+    def start_profiler(self):
+        """ Start profiling the current stage"""
+        if self.profiler == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def stop_profiler(self, profiler):
+        """ Stop profiling, and write the profile in profile_output"""
+        if self.profiler == 'pyinstrument':
+            profiler.stop()
+            with open(self.profile_output, 'w') as fout:
+                if self.profile_output.endswith('.html'):
+                    fout.write(profiler.output_html())
+                else:
+                    fout.write(profiler.output_text())
+        else:
+            profiler.disable()
+            profiler.dump_stats(self.profile_output)
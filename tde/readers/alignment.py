@@ -0,0 +1,542 @@
+#!/usr/bin/env python
+"""Columnar representation of a gold alignment (words or phones)
+
+An :class:`Alignment` stores all the intervals of an alignment in a few flat
+NumPy arrays instead of one interval tree per file:
+
+    onset, offset: float arrays of the timestamps of each interval
+    symbol: integer array, the symbol of each interval encoded with symbol2ix
+    file_offsets: integer array, the intervals of the i-th file are
+        onset[file_offsets[i]:file_offsets[i + 1]]
+
+Inside each file, the intervals are sorted by (onset, offset, symbol), so
+that the intervals overlapping a given range can be retrieved with two
+binary searches (np.searchsorted) in O(log(n)).
+
+For compatibility with the previous interval tree representation, an
+:class:`Alignment` behaves like a read only dictionnary {fname: intervals},
+where the intervals of each file support `overlap(on, off)`, iteration and
+`len`, and return (onset, offset, symbol) tuples.
+
+An alignment can be saved to and loaded from a directory containing one .npy
+file per array, which is much faster to load than the text alignment. The
+arrays can also be memory mapped read only, so that all the processes using
+the same saved alignment share one physical copy through the page cache. A
+memory mapped alignment is pickled as its path, so it is also shared with
+the worker processes it is sent to, instead of being copied.
+
+A :class:`WordIndex` gives the phone transcription of each gold word, as an
+integer type id of a :class:`NgramVocabulary`, so that comparing a
+discovered ngram to a gold word is an integer comparison.
+
+"""
+
+import os
+import numpy as np
+
+
+class Alignment():
+    """ Columnar alignment, all the intervals of all the files stored in
+    concatenated arrays.
+
+    Attributes
+    ----------
+    :param fnames: list of str, the files of the alignment, in the order
+                   they are stored in the arrays
+    :param file2ix: dict, returns the index of each file in fnames
+    :param file_offsets: int array of size len(fnames) + 1, the intervals
+                         of the file i are stored between file_offsets[i]
+                         and file_offsets[i + 1]
+    :param onset: float array, onset of each interval
+    :param offset: float array, offset of each interval
+    :param symbol: int array, index of the symbol of each interval
+    :param max_offset: float array, running maximum of the offsets inside
+                       each file, used to search overlaps when the
+                       intervals of a file overlap each other
+    :param ix2symbol: dict, returns the symbol for each index
+    :param symbol2ix: dict, returns the index of each symbol
+    :param disjoint: bool, True if no two intervals of a file overlap
+    :param path: str, the directory the alignment was loaded from, if it
+                 is memory mapped, None otherwise
+    """
+
+    def __init__(self, fnames, file_offsets, onset, offset, symbol,
+                 ix2symbol, max_offset=None, disjoint=None):
+        self.fnames = list(fnames)
+        self.file2ix = {fname: ix for ix, fname in enumerate(self.fnames)}
+        self.file_offsets = np.asarray(file_offsets, dtype=np.int64)
+        self.onset = np.asarray(onset, dtype=np.float64)
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.symbol = np.asarray(symbol, dtype=np.int32)
+        self.ix2symbol = dict(ix2symbol)
+        self.symbol2ix = {v: k for k, v in self.ix2symbol.items()}
+        self.path = None
+        self.mmap_mode = None
+
+        # running maximum of the offsets in each file: the intervals
+        # overlapping [on, off) are all in
+        # [searchsorted(max_offset, on, 'right'),
+        #  searchsorted(onset, off, 'left'))
+        if max_offset is None:
+            max_offset = self.offset.copy()
+            for fix in range(len(self.fnames)):
+                beg, end = self.file_offsets[fix], self.file_offsets[fix + 1]
+                np.maximum.accumulate(
+                    self.offset[beg:end], out=max_offset[beg:end])
+        self.max_offset = np.asarray(max_offset, dtype=np.float64)
+
+        # intervals are disjoint if each onset is after all the previous
+        # offsets of the same file
+        if disjoint is None:
+            same_file = np.ones(len(self.onset), dtype=bool)
+            same_file[self.file_offsets[:-1]] = False
+            disjoint = np.all(self.onset[1:][same_file[1:]]
+                              >= self.max_offset[:-1][same_file[1:]])
+        self.disjoint = bool(disjoint)
+
+    @classmethod
+    def from_intervals(cls, intervals):
+        """ Build a columnar alignment from intervals grouped by file
+
+        Parameters
+        ----------
+        intervals: dict {fname: iterable of (onset, offset, symbol)}, for
+                   instance a dict of interval trees. Duplicated intervals
+                   are only kept once, as in an interval tree.
+
+        Returns
+        -------
+        alignment: Alignment
+        """
+        fnames = sorted(intervals)
+        per_file = [sorted(set(
+            (float(on), float(off), symbol)
+            for on, off, symbol in intervals[fname])) for fname in fnames]
+
+        # encode the symbols in lexicographic order
+        symbols = sorted({symbol for ivs in per_file
+                          for _, _, symbol in ivs})
+        symbol2ix = {v: k for k, v in enumerate(symbols)}
+        ix2symbol = dict(enumerate(symbols))
+
+        file_offsets = np.zeros(len(fnames) + 1, dtype=np.int64)
+        file_offsets[1:] = np.cumsum([len(ivs) for ivs in per_file])
+        onset = np.array([on for ivs in per_file for on, _, _ in ivs],
+                         dtype=np.float64)
+        offset = np.array([off for ivs in per_file for _, off, _ in ivs],
+                          dtype=np.float64)
+        symbol = np.array([symbol2ix[symbol] for ivs in per_file
+                           for _, _, symbol in ivs], dtype=np.int32)
+        return cls(fnames, file_offsets, onset, offset, symbol, ix2symbol)
+
+    @classmethod
+    def from_arrays(cls, fname, onset, offset, symbol):
+        """ Build a columnar alignment from one array per column, in any
+        order. Gives the same alignment as `from_intervals`: duplicated
+        intervals are only kept once, files and symbols are sorted.
+
+        Parameters
+        ----------
+        fname: array of str, the file of each interval
+        onset: float array, the onset of each interval
+        offset: float array, the offset of each interval
+        symbol: array of str, the symbol of each interval
+        """
+        fnames, file_ids = np.unique(
+            np.asarray(fname, dtype=str), return_inverse=True)
+        symbols, symbol_ids = np.unique(
+            np.asarray(symbol, dtype=str), return_inverse=True)
+        onset = np.asarray(onset, dtype=np.float64)
+        offset = np.asarray(offset, dtype=np.float64)
+
+        # sort by (file, onset, offset, symbol), and remove duplicates
+        order = np.lexsort((symbol_ids, offset, onset, file_ids))
+        file_ids, onset = file_ids[order], onset[order]
+        offset, symbol_ids = offset[order], symbol_ids[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = ((file_ids[1:] != file_ids[:-1])
+                    | (onset[1:] != onset[:-1])
+                    | (offset[1:] != offset[:-1])
+                    | (symbol_ids[1:] != symbol_ids[:-1]))
+        file_ids, onset = file_ids[keep], onset[keep]
+        offset, symbol_ids = offset[keep], symbol_ids[keep]
+
+        file_offsets = np.zeros(len(fnames) + 1, dtype=np.int64)
+        file_offsets[1:] = np.cumsum(
+            np.bincount(file_ids, minlength=len(fnames)))
+        return cls(fnames.tolist(), file_offsets, onset, offset, symbol_ids,
+                   dict(enumerate(symbols.tolist())))
+
+    def save(self, path):
+        """ Save the alignment in the directory path, one .npy file per array
+
+        The directory is created if it doesn't exist.
+        """
+        os.makedirs(path, exist_ok=True)
+        symbols = [self.ix2symbol[ix] for ix in range(len(self.ix2symbol))]
+        arrays = {'fnames': np.array(self.fnames, dtype=str),
+                  'symbols': np.array(symbols, dtype=str),
+                  'file_offsets': self.file_offsets,
+                  'onset': self.onset,
+                  'offset': self.offset,
+                  'symbol': self.symbol,
+                  'max_offset': self.max_offset,
+                  'disjoint': np.array(self.disjoint)}
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array,
+                    allow_pickle=False)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """ Load an alignment saved with `save` from the directory path
+
+        Parameters
+        ----------
+        path: str, the directory containing the saved alignment
+        mmap_mode: None or 'r', if 'r', the interval arrays are memory
+                   mapped read only instead of being read in memory.
+        """
+        def _load(name, mmap_mode=None):
+            return np.load(os.path.join(path, name + '.npy'),
+                           mmap_mode=mmap_mode, allow_pickle=False)
+
+        alignment = cls(
+            _load('fnames').tolist(), _load('file_offsets'),
+            _load('onset', mmap_mode), _load('offset', mmap_mode),
+            _load('symbol', mmap_mode),
+            dict(enumerate(_load('symbols').tolist())),
+            max_offset=_load('max_offset', mmap_mode),
+            disjoint=_load('disjoint'))
+        if mmap_mode is not None:
+            alignment.path = path
+            alignment.mmap_mode = mmap_mode
+        return alignment
+
+    def __getstate__(self):
+        # a memory mapped alignment is pickled as its path, and mapped
+        # again when unpickled
+        if self.path is not None:
+            return {'_mmap_path': self.path, '_mmap_mode': self.mmap_mode}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if '_mmap_path' in state:
+            state = Alignment.load(
+                state['_mmap_path'], state['_mmap_mode']).__dict__
+        self.__dict__.update(state)
+
+    @property
+    def n_intervals(self):
+        """Total number of intervals in the alignment"""
+        return len(self.onset)
+
+    def span(self, fname):
+        """ Return the (start, stop) indices of the intervals of a file"""
+        fix = self.file2ix[fname]
+        return int(self.file_offsets[fix]), int(self.file_offsets[fix + 1])
+
+    def overlap(self, fname, on, off):
+        """ Return the indices of the intervals of fname overlapping
+        [on, off), with the same convention as intervaltree: an interval
+        (b, e) overlaps [on, off) if b < off and e > on.
+
+        The indices are sorted by (onset, offset, symbol).
+        """
+        if on >= off:
+            return np.zeros(0, dtype=np.int64)
+        beg, end = self.span(fname)
+        start = beg + np.searchsorted(self.max_offset[beg:end], on, 'right')
+        stop = beg + np.searchsorted(self.onset[beg:end], off, 'left')
+        indices = np.arange(start, stop, dtype=np.int64)
+        if not self.disjoint:
+            indices = indices[self.offset[start:stop] > on]
+        return indices
+
+    def overlap_ranges(self, file_ids, onsets, offsets):
+        """ Vectorized overlap search, for many ranges at once.
+
+        For each range [onsets[i], offsets[i]) in file fnames[file_ids[i]],
+        return the indices (starts[i], stops[i]) such that all the intervals
+        overlapping the range are between starts[i] and stops[i]. When the
+        alignment is disjoint, those are exactly the overlapping intervals.
+
+        Parameters
+        ----------
+        file_ids: int array, index of the file of each range in fnames
+        onsets: float array, onset of each range
+        offsets: float array, offset of each range
+
+        Returns
+        -------
+        (starts, stops): two int arrays
+        """
+        file_ids = np.asarray(file_ids, dtype=np.int64)
+        onsets = np.asarray(onsets, dtype=np.float64)
+        offsets = np.asarray(offsets, dtype=np.float64)
+        starts = np.zeros(len(file_ids), dtype=np.int64)
+        stops = np.zeros(len(file_ids), dtype=np.int64)
+
+        # group the ranges by file and search each file once
+        order = np.argsort(file_ids, kind='stable')
+        groups = np.flatnonzero(np.diff(file_ids[order])) + 1
+        for sel in np.split(order, groups):
+            if len(sel) == 0:
+                continue
+            fix = file_ids[sel[0]]
+            beg, end = self.file_offsets[fix], self.file_offsets[fix + 1]
+            starts[sel] = beg + np.searchsorted(
+                self.max_offset[beg:end], onsets[sel], 'right')
+            stops[sel] = beg + np.searchsorted(
+                self.onset[beg:end], offsets[sel], 'left')
+
+        # empty ranges don't overlap anything
+        stops = np.where(onsets < offsets, stops, starts)
+        return starts, stops
+
+    def intervals(self, indices):
+        """ Return the list of (onset, offset, symbol) tuples of the
+        intervals at the given indices"""
+        return [(on, off, self.ix2symbol[symbol]) for on, off, symbol in zip(
+            self.onset[indices].tolist(), self.offset[indices].tolist(),
+            self.symbol[indices].tolist())]
+
+    def boundaries(self):
+        """ Return the onset and offset boundaries of each file
+
+        Returns
+        -------
+        (boundaries_up, boundaries_down): two dicts {fname: set of floats},
+            containing respectively the offsets and the onsets of the
+            intervals of each file
+        """
+        boundaries_up = dict()
+        boundaries_down = dict()
+        for fname in self.fnames:
+            beg, end = self.span(fname)
+            boundaries_up[fname] = set(self.offset[beg:end].tolist())
+            boundaries_down[fname] = set(self.onset[beg:end].tolist())
+        return boundaries_up, boundaries_down
+
+    def boundary_arrays(self):
+        """ Return the onset and offset boundaries of each file, as sorted
+        arrays of distinct times
+
+        Returns
+        -------
+        (boundaries_up, boundaries_down): two dicts {fname: array},
+            containing respectively the offsets and the onsets of the
+            intervals of each file, as in `boundaries`
+        """
+        boundaries_up = dict()
+        boundaries_down = dict()
+        for fname in self.fnames:
+            beg, end = self.span(fname)
+            boundaries_up[fname] = np.unique(self.offset[beg:end])
+            boundaries_down[fname] = np.unique(self.onset[beg:end])
+        return boundaries_up, boundaries_down
+
+    # read only mapping interface {fname: FileAlignment}
+    def __getitem__(self, fname):
+        if fname not in self.file2ix:
+            raise KeyError(fname)
+        return FileAlignment(self, fname)
+
+    def __contains__(self, fname):
+        return fname in self.file2ix
+
+    def __iter__(self):
+        return iter(self.fnames)
+
+    def __len__(self):
+        return len(self.fnames)
+
+    def keys(self):
+        return list(self.fnames)
+
+    def items(self):
+        return [(fname, self[fname]) for fname in self.fnames]
+
+
+class FileAlignment():
+    """ View on the intervals of one file of an :class:`Alignment`, with
+    the same interface as the interval tree previously used for each file.
+    """
+
+    def __init__(self, alignment, fname):
+        self.alignment = alignment
+        self.fname = fname
+
+    def overlap(self, on, off):
+        """ Return the set of (onset, offset, symbol) overlapping [on, off)"""
+        return set(self.alignment.intervals(
+            self.alignment.overlap(self.fname, on, off)))
+
+    def is_empty(self):
+        return len(self) == 0
+
+    def __iter__(self):
+        beg, end = self.alignment.span(self.fname)
+        return iter(self.alignment.intervals(slice(beg, end)))
+
+    def __len__(self):
+        beg, end = self.alignment.span(self.fname)
+        return end - beg
+
+
+class NgramVocabulary():
+    """ Interned ngrams of phones: each distinct ngram, as a tuple of phone
+    codes, is given an integer id the first time it is seen.
+
+    A vocabulary can be layered over a parent one (see `child`): the ngrams
+    of the parent keep their ids, and the new ngrams are interned in the
+    child only, with the ids that follow, so that the parent never grows.
+
+    Attributes
+    ----------
+    :param ix2symbol: dict, returns the phone symbol of each phone code
+    :param symbol2ix: dict, returns the code of each phone symbol
+    :param parent: NgramVocabulary whose ngrams are looked up first, or
+                   None
+    :param offset: id of the first ngram interned in this vocabulary, the
+                   size of the parent when the child was created
+    :param codes2ix: dict, returns the id of each ngram interned here,
+                     given as a tuple of phone codes
+    :param ix2codes: list, the tuple of phone codes of each id from offset
+    """
+
+    def __init__(self, ix2symbol, parent=None):
+        self.ix2symbol = dict(ix2symbol)
+        self.symbol2ix = {v: k for k, v in self.ix2symbol.items()}
+        self.parent = parent
+        self.offset = len(parent) if parent is not None else 0
+        self.codes2ix = dict()
+        self.ix2codes = []
+
+    def __len__(self):
+        return self.offset + len(self.ix2codes)
+
+    def child(self):
+        """ Return an empty vocabulary layered over this one"""
+        return NgramVocabulary(self.ix2symbol, parent=self)
+
+    def find(self, codes):
+        """ Return the id of a tuple of phone codes, None if it was never
+        interned"""
+        if self.parent is not None:
+            ix = self.parent.find(codes)
+            # the ngrams interned in the parent after this child was made
+            # are ignored, their ids are those of this child
+            if ix is not None and ix < self.offset:
+                return ix
+        return self.codes2ix.get(codes)
+
+    def intern(self, codes):
+        """ Return the id of a tuple of phone codes, adding it if needed"""
+        codes = tuple(codes)
+        ix = self.find(codes)
+        if ix is None:
+            ix = len(self)
+            self.codes2ix[codes] = ix
+            self.ix2codes.append(codes)
+        return ix
+
+    def codes(self, ix):
+        """ Return the tuple of phone codes of an ngram id"""
+        if ix < self.offset:
+            return self.parent.codes(ix)
+        return self.ix2codes[ix - self.offset]
+
+    def symbols(self, ix):
+        """ Return the tuple of phone symbols of an ngram id"""
+        return tuple(self.ix2symbol[code] for code in self.codes(ix))
+
+    def lookup(self, ngram):
+        """ Return the id of a tuple of phone symbols, -1 if it was never
+        interned"""
+        codes = tuple(self.symbol2ix.get(phn, -1) for phn in ngram)
+        ix = self.find(codes)
+        return -1 if ix is None else ix
+
+
+class WordIndex():
+    """ Phone transcription of each gold word, with the transcriptions
+    interned as integer type ids.
+
+    The phones of a word are all the gold phones overlapping it. When the
+    gold phones are disjoint, they are a contiguous range of the phone
+    alignment, [phn_start[i], phn_stop[i]), found for all the words at once
+    with `Alignment.overlap_ranges`.
+
+    The type ids are the ids of the transcriptions in `vocabulary`. The
+    ngrams of the discovered intervals are interned in a child of it (see
+    Disc with encoded=True), so that they are directly comparable to the
+    word types, without growing the vocabulary of the gold.
+
+    Attributes
+    ----------
+    :param words: Alignment, the gold words
+    :param phones: Alignment, the gold phones
+    :param phn_start: int array, first phone of each word, when the phones
+                      are disjoint
+    :param phn_stop: int array, phone after the last phone of each word,
+                     when the phones are disjoint
+    :param word_type: int array, type id of the transcription of each word
+    :param vocabulary: NgramVocabulary, the interned transcriptions
+    """
+
+    def __init__(self, words, phones):
+        self.words = to_alignment(words)
+        self.phones = to_alignment(phones)
+        words, phones = self.words, self.phones
+
+        # file of each word in the phone alignment, -1 if not in it
+        wrd_files = np.repeat(np.arange(len(words.fnames)),
+                              np.diff(words.file_offsets))
+        file_map = np.array([phones.file2ix.get(fname, -1)
+                             for fname in words.fnames],
+                            dtype=np.int64)[wrd_files]
+        has_file = file_map >= 0
+
+        self.phn_start = np.zeros(words.n_intervals, dtype=np.int64)
+        self.phn_stop = np.zeros(words.n_intervals, dtype=np.int64)
+        if phones.disjoint:
+            self.phn_start[has_file], self.phn_stop[has_file] = (
+                phones.overlap_ranges(file_map[has_file],
+                                      words.onset[has_file],
+                                      words.offset[has_file]))
+            transcriptions = (
+                phones.symbol[start:stop].tolist()
+                for start, stop in zip(self.phn_start.tolist(),
+                                       self.phn_stop.tolist()))
+        else:
+            transcriptions = (
+                phones.symbol[phones.overlap(
+                    phones.fnames[fix], on, off)].tolist() if fix >= 0
+                else []
+                for fix, on, off in zip(file_map.tolist(),
+                                        words.onset.tolist(),
+                                        words.offset.tolist()))
+
+        self.vocabulary = NgramVocabulary(phones.ix2symbol)
+        self.word_type = np.array(
+            [self.vocabulary.intern(codes) for codes in transcriptions],
+            dtype=np.int64)
+
+    def transcription(self, wrd_ix):
+        """ Return the tuple of the phones of a word"""
+        return self.vocabulary.symbols(self.word_type[wrd_ix])
+
+    def get_type(self, ngram):
+        """ Return the type id of an ngram, -1 if it is unknown. The ngram
+        is either a tuple of phones, or already an id of the vocabulary"""
+        if isinstance(ngram, (int, np.integer)):
+            return int(ngram)
+        return self.vocabulary.lookup(ngram)
+
+
+def to_alignment(gold):
+    """ Return gold as an :class:`Alignment`, converting it if it is given
+    as a dict {fname: intervaltree}"""
+    if isinstance(gold, Alignment):
+        return gold
+    return Alignment.from_intervals(gold)
@@ -25,9 +25,43 @@ The discovered elements can be represented in 3 ways, depending on the usage:
 
 import os
 import codecs
-import intervaltree
+import numpy as np
 
-from tde.utils import check_boundary
+from tde import progress
+from tde.readers.alignment import Alignment
+from tde.readers.interval_store import (
+    IntervalStore, RECORD_DTYPE, transcribe_spans)
+from tde.utils import check_boundary, check_boundaries
+
+
+# the whitespaces that are not spaces or end of lines
+_SPACES = '\t\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+# the bytes that separate the fields
+_SEPARATOR = np.isin(np.arange(256), np.frombuffer(b' \n', np.uint8))
+
+
+def _gather(data, starts, stops):
+    """ Return the strings data[starts[i]:stops[i]] of an ascii byte array"""
+    lengths = stops - starts + 1
+    offsets = np.cumsum(lengths) - lengths
+    chars = data[np.repeat(starts - offsets, lengths)
+                 + np.arange(lengths.sum())]
+    chars[offsets + lengths - 1] = ord('\n')
+    return chars.tobytes().decode('ascii').split('\n')[:-1]
+
+
+def _parse_floats(data, starts, stops):
+    """ Parse the floats data[starts[i]:stops[i]] of an ascii byte array,
+    as python's float() does. Raise a ValueError if one is not a float."""
+    lengths = stops - starts
+    width = max(1, int(lengths.max(initial=0)))
+    # the width bytes from each start, with the bytes after stop zeroed
+    windows = np.lib.stride_tricks.sliding_window_view(
+        np.concatenate([data, np.zeros(width, np.uint8)]), width)
+    padded = windows[starts]
+    padded[np.arange(width) >= lengths[:, None]] = 0
+    return padded.view('S{}'.format(width)).ravel().astype(np.float64)
 
 
 class Disc():
@@ -41,6 +75,21 @@ class Disc():
                            intervals
     :param clusters: a dictionary where all the keys are class numbers, and the
         values are all the intervals for that class
+    :param stream: if True, the class file is not read when the object is
+        created, and `intervals` and `clusters` stay None. The clusters can
+        then be read one at a time with `iter_clusters`.
+    :param encoded: if True, the phones are integer coded: the ngram of
+        each interval is its id in `vocabulary`, and the phones of its
+        token_ngram are gold phone codes (see gold.phn2ix). Requires gold.
+    :param vocabulary: NgramVocabulary interning the ngrams when encoded,
+        a child of the vocabulary of the gold word index (so that the word
+        types keep their ids, and the gold doesn't grow), None otherwise
+    :param compact: if True, the intervals are stored in an IntervalStore,
+        a structured array pointing into the gold phones, and `clusters`
+        and `intervals` are IntervalList views on it, that give the
+        intervals as tuples when they are read. Requires gold, with
+        disjoint phones.
+    :param store: the IntervalStore of the intervals when compact
 
 
     Raises
@@ -52,7 +101,8 @@ class Disc():
         - if discovered file is not found
         - if discovered file is is wrong format
     """
-    def __init__(self, disc_path=None, gold=None):
+    def __init__(self, disc_path=None, gold=None, stream=False,
+                 encoded=False, compact=False):
 
         if not os.path.isfile(disc_path):
             raise ValueError('{}: File Not Found'.format(disc_path))
@@ -65,8 +115,19 @@ class Disc():
             print("Warning: discovered file is read"
                   " without gold, so no transcription is given")
             self.gold_phn = None
+        if encoded and not gold:
+            raise ValueError('phones can only be encoded with a gold')
+        self.vocabulary = (gold.word_index.vocabulary.child() if encoded
+                           else None)
+        if compact and not (gold and isinstance(self.gold_phn, Alignment)
+                            and self.gold_phn.disjoint):
+            raise ValueError('intervals can only be stored compactly with a'
+                             ' gold whose phones don\'t overlap')
+        self.compact = compact
+        self.store = None
         self.intervals_tree = None
-        self.read_clusters()
+        if not stream:
+            self.read_clusters()
 
     def __repr__(self):
         return '\n'.join(
@@ -94,80 +155,514 @@ class Disc():
         ValueError
             - if a line is badly formated
         """
-        classes = []
-        discovered = dict()
-        intervals = set()
-        # file is decoded line by line and ned statistics are computed in
-        # a streaming to avoid using a high amount of memory
-        with open(self.disc_path) as fin:
-            cfile = fin.readlines()
-
-            # check that last line is empty
-            assert cfile[-1] == '\n', ("discovered class file should end with"
-                                     " and empty line")
-            for lines in cfile:
-                line = lines.strip()
-
-                # check what type of line is being read, either it begins with
-                # "Class", so it's the start of a new cluster or it contains an
-                # interval, so add it to current cluster or it is empty, so the
-                # previous cluster has been read entirely
-                if line[:5] == 'Class':  # class + number + ngram if available
-                    class_number = line.strip().split(' ')[1]
-                elif len(line.split(' ')) == 3:
-                    fname, start, end = line.split(' ')
-                    disc_on, disc_off = float(start), float(end)
-
-                    # check that timestamps are correct
-                    assert disc_off > disc_on, ("timestamps are not"
-                     " correct\n {} {} {}\n".format(fname, disc_on, disc_off))
-
-                    # get the phone transcription for current interval
-                    if self.gold_phn:
-                        token_ngram, ngram = (self.get_transcription(
-                         fname, disc_on, disc_off, self.gold_phn))
-
-                        # throw away interval if outside of transcription
-                        if len(token_ngram) == 0:
-                            continue
-                    else:
-                        token_ngram, ngram = None, None
-
-                    intervals.add(
-                        (fname, disc_on, disc_off, token_ngram, ngram))
-                    classes.append(
-                        (fname, disc_on, disc_off, token_ngram, ngram))
-                elif len(line) == 0:
-                    # empty line means that the class has ended
-                    # add class to discovered dict.
-                    # if entry already exists, exit with an error
-                    assert class_number not in discovered, (
-                        "Two Classes have the same number {}"
-                        " in discovered classes".format(class_number))
-                    #assert len(classes) > 0, (
-                    #        'class {} if empty'.format(class_number))
-                    if len(classes) > 0:
-                        discovered[class_number] = classes
-
-                    # re-initialize classes
-                    classes = list()
-                else:
-                    raise ValueError('Line in discovered classes has wrong'
-                            ' format\n {}\n'.format(line))
+        if self.compact:
+            # merge the stores of each batch of clusters
+            stores = []
+            for class_number, classes in self.iter_clusters():
+                if len(stores) == 0 or classes.store is not stores[-1]:
+                    stores.append(classes.store)
+            self.store = IntervalStore.concatenate(
+                stores, self.gold_phn, self.vocabulary)
+            self.clusters = self.store.clusters()
+            self.intervals = self.store.unique()
+        else:
+            discovered = dict()
+            intervals = set()
+            for class_number, classes in self.iter_clusters():
+                intervals.update(classes)
+                discovered[class_number] = classes
 
-        self.clusters = discovered
-        self.intervals = list(intervals)
+            self.clusters = discovered
+            self.intervals = list(intervals)
 
         print("Discovered Class file read\n")
         print("{} unique intervals found".format(len(self.intervals)))
 
+    def iter_clusters(self, chunk_size=10000):
+        """ Read the discovered clusters one at a time
+
+        Generator that yields each cluster as soon as it is read, so that
+        the measures that can be computed incrementally don't need to keep
+        all the clusters in memory. The file is parsed in bulk, by blocks
+        (see `read_class_file`), and the intervals are transcribed in
+        batches of about chunk_size intervals, so only the clusters of the
+        current batch are kept in memory.
+
+        Parameters
+        ----------
+        chunk_size: int, number of intervals to read before transcribing them
+
+        Yields
+        ------
+        (class_number, intervals): the number of the class and the list of
+                                   its intervals, represented as in
+                                   `read_clusters`. Empty clusters are not
+                                   yielded.
+
+        Raises
+        ------
+        AssertionError
+            - if incorrect interval found (offset greater than onset)
+            - if two classes have the same class number
+            - if the file does not end with an empty line
+        ValueError
+            - if a line is badly formated
+        """
+        seen_classes = set()
+        for fnames, disc_ons, disc_offs, pending in self.read_class_file(
+                self.disc_path, chunk_size):
+            for cluster in self._transcribe_clusters(
+                    pending, fnames, disc_ons, disc_offs, seen_classes):
+                yield cluster
+
+    @staticmethod
+    def read_class_file(disc_path, chunk_size=10000, block_size=1 << 22):
+        """ Parse a class file in bulk
+
+        The file is read in blocks of about block_size characters, that end
+        after an empty line, and each block is parsed at once with
+        `parse_class_block`. The parsed intervals are given in batches of
+        about chunk_size intervals.
+
+        Parameters
+        ----------
+        disc_path: str, path to the class file
+        chunk_size: int, number of intervals in each batch
+        block_size: int, number of characters read at once
+
+        Yields
+        ------
+        (fnames, disc_ons, disc_offs, pending): the intervals of a batch,
+            as lists, and the clusters of the batch, as lists
+            (class_numbers, starts, stops, line_numbers): the intervals of
+            the i-th cluster are the intervals starts[i] to stops[i]
+            (excluded) of fnames, disc_ons, disc_offs, and line_numbers[i]
+            is the line of its class.
+
+        Raises
+        ------
+        AssertionError
+            - if incorrect interval found (offset greater than onset)
+            - if the file does not end with an empty line
+        ValueError
+            - if a line is badly formated
+        """
+        # the current class, and the line where it begins
+        state = (None, None)
+        line_number, carry, tail, n_chars = 1, '', '', 0
+        with open(disc_path) as fin, progress.task(
+                'class file', total=os.path.getsize(disc_path),
+                unit='bytes') as task:
+            while True:
+                data = fin.read(block_size)
+                n_chars += len(data)
+                tail = (tail + data[-2:])[-2:]
+                text = carry + data
+
+                # parse the complete clusters read, i.e. up to the last
+                # empty line, or the whole text at the end of the file
+                if len(data) > 0:
+                    cut = text.rfind('\n\n') + 2
+                    if cut < 2:
+                        carry = text
+                        continue
+                else:
+                    cut = len(text)
+                block, carry = text[:cut], text[cut:]
+                if len(data) == 0:
+                    # check that last line is empty
+                    assert n_chars == 0 or tail == '\n\n' or (
+                        n_chars == 1 and tail == '\n'), (
+                        "discovered class file should end with"
+                        " and empty line")
+
+                fnames, disc_ons, disc_offs, clusters, state = (
+                    Disc.parse_class_block(block, line_number, state))
+                line_number += block.count('\n')
+
+                # give the clusters by batches of about chunk_size intervals
+                disc_ons, disc_offs = disc_ons.tolist(), disc_offs.tolist()
+                class_numbers, starts, stops, class_lines = clusters
+                batches = np.flatnonzero(np.diff(starts // chunk_size)) + 1
+                for first, last in zip([0] + batches.tolist(),
+                                       batches.tolist() + [len(starts)]):
+                    if last == first:
+                        continue
+                    offset, end = int(starts[first]), int(stops[last - 1])
+                    yield (fnames[offset:end], disc_ons[offset:end],
+                           disc_offs[offset:end],
+                           (class_numbers[first:last],
+                            (starts[first:last] - offset).tolist(),
+                            (stops[first:last] - offset).tolist(),
+                            class_lines[first:last]))
+
+                # the file size is in bytes, the characters are close enough
+                task.advance(len(data))
+                if len(data) == 0:
+                    break
+
+    @staticmethod
+    def parse_class_block(text, line_number=1, state=(None, None)):
+        """ Parse complete lines of a class file at once
+
+        All the lines are recognized and checked as arrays, from the
+        positions of their spaces: the empty lines, the lines that begin a
+        class, and the lines that contain an interval, whose (fname,
+        onset, offset) fields are then parsed at once. If the text
+        contains anything else, or an interval is not correct, the text is
+        parsed by `parse_class_lines` instead, which reports the wrong
+        line.
+
+        Parameters
+        ----------
+        text: str, lines of the class file
+        line_number: int, number of the first line of text in the file
+        state: (class_number, line_number), the class of the intervals at
+               the beginning of text, and the line where it begins
+
+        Returns
+        -------
+        fnames: list of str, the file of each interval
+        disc_ons, disc_offs: float arrays, the onset and offset of each
+                             interval
+        clusters: (class_numbers, starts, stops, line_numbers), for each
+                  empty line, the class it ends and the line where this
+                  class begins, and the intervals read since the previous
+                  empty line, which are the intervals starts[i] to stops[i]
+                  (excluded)
+        state: (class_number, line_number), the class at the end of text
+
+        Raises
+        ------
+        AssertionError
+            - if incorrect interval found (offset greater than onset)
+        ValueError
+            - if a line is badly formated
+        """
+        if len(text) == 0:
+            return ([], np.zeros(0), np.zeros(0),
+                    ([], np.zeros(0, np.int64), np.zeros(0, np.int64), []),
+                    state)
+        if not text.endswith('\n'):
+            text += '\n'
+
+        # the lines are split on spaces only, as when reading line by line
+        if not text.isascii() or any(space in text for space in _SPACES):
+            return Disc.parse_class_lines(text, line_number, state)
+
+        # each line either begins a class, contains an interval in three
+        # fields separated by single spaces, or is empty and ends the class
+        data = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+        separators = np.flatnonzero(_SEPARATOR[data])
+        ends = separators[data[separators] == ord('\n')]
+        starts = np.concatenate([[0], ends[:-1] + 1]).astype(np.int64)
+        first_field = np.searchsorted(separators, starts)
+        n_fields = np.searchsorted(separators, ends) - first_field + 1
+        is_empty = ends == starts
+        is_class = ends - starts >= 5
+        for position, char in enumerate(b'Class'):
+            is_class &= data[np.minimum(starts + position,
+                                        len(data) - 1)] == char
+        is_interval = ~is_class & (n_fields == 3)
+        field1 = separators[first_field]
+        field2 = separators[np.minimum(first_field + 1, len(separators) - 1)]
+        is_interval &= (field1 > starts) & (field2 > field1 + 1) & (
+            ends > field2 + 1)
+        if not np.all(is_class | is_interval | is_empty):
+            return Disc.parse_class_lines(text, line_number, state)
+
+        # the floats are parsed exactly as python's float() does
+        intervals = np.flatnonzero(is_interval)
+        fnames = _gather(data, starts[intervals], field1[intervals])
+        try:
+            disc_ons = _parse_floats(
+                data, field1[intervals] + 1, field2[intervals])
+            disc_offs = _parse_floats(
+                data, field2[intervals] + 1, ends[intervals])
+        except ValueError:
+            return Disc.parse_class_lines(text, line_number, state)
+
+        # check that timestamps are correct
+        if not np.all(disc_offs > disc_ons):
+            return Disc.parse_class_lines(text, line_number, state)
+
+        # the number of each class is its second field
+        classes = np.flatnonzero(is_class)
+        first_field = first_field[classes]
+        if np.any(data[separators[first_field]] != ord(' ')):
+            return Disc.parse_class_lines(text, line_number, state)
+        class_numbers = _gather(data, separators[first_field] + 1,
+                                separators[first_field + 1])
+
+        # the intervals before the first class are in the class of the
+        # state, an empty line ends the last class begun before it, with
+        # the intervals read since the previous empty line
+        empty = np.flatnonzero(is_empty)
+        if state[0] is None and (
+                len(empty) > 0 or len(intervals) > 0) and (
+                len(classes) == 0
+                or min(empty[:1].tolist() + intervals[:1].tolist())
+                < classes[0]):
+            return Disc.parse_class_lines(text, line_number, state)
+        class_numbers = [state[0]] + class_numbers
+        class_lines = [state[1]] + (line_number + classes).tolist()
+        empty_classes = np.searchsorted(classes, empty)
+        cluster_stops = np.searchsorted(intervals, empty)
+        cluster_starts = np.concatenate(
+            [[0], cluster_stops[:-1]]).astype(np.int64)
+        clusters = (
+            np.array(class_numbers, dtype=object)[empty_classes].tolist(),
+            cluster_starts, cluster_stops,
+            np.array(class_lines, dtype=object)[empty_classes].tolist())
+
+        return (fnames, disc_ons, disc_offs, clusters,
+                (class_numbers[-1], class_lines[-1]))
+
+    @staticmethod
+    def parse_class_lines(text, line_number=1, state=(None, None)):
+        """ Parse the lines of a class file one by one
+
+        Same as `parse_class_block`, but slower, and raises an error for
+        the first wrong line, with its line number.
+        """
+        class_number, class_line = state
+        fnames, disc_ons, disc_offs = [], [], []
+        class_numbers, starts, stops, class_lines = [], [], [], []
+        start = 0
+        for line_number, line in enumerate(
+                text.split('\n')[:-1], start=line_number):
+            stripped = line.strip()
+
+            # check what type of line is being read, either it begins
+            # with "Class", so it's the start of a new cluster or it
+            # contains an interval, so add it to current cluster or it is
+            # empty, so the previous cluster has been read entirely
+            if stripped[:5] == 'Class':  # class + number + ngram
+                fields = stripped.split(' ')
+                if len(fields) < 2:
+                    raise ValueError('Line {} in discovered classes has'
+                                     ' wrong format\n {}\n'.format(
+                                         line_number, stripped))
+                class_number, class_line = fields[1], line_number
+            elif len(stripped.split(' ')) == 3:
+                fname, on, off = stripped.split(' ')
+                try:
+                    disc_on, disc_off = float(on), float(off)
+                except ValueError:
+                    raise ValueError('Line {} in discovered classes has'
+                                     ' wrong format\n {}\n'.format(
+                                         line_number, stripped))
+
+                # check that timestamps are correct
+                assert disc_off > disc_on, ("timestamps are not correct\n"
+                    " line {}: {}\n".format(line_number, stripped))
+                if class_number is None:
+                    raise ValueError('Line {} in discovered classes is not'
+                                     ' in a class\n {}\n'.format(
+                                         line_number, stripped))
+                fnames.append(fname)
+                disc_ons.append(disc_on)
+                disc_offs.append(disc_off)
+            elif len(stripped) == 0:
+                # empty line means that the class has ended
+                if class_number is not None:
+                    class_numbers.append(class_number)
+                    starts.append(start)
+                    stops.append(len(fnames))
+                    class_lines.append(class_line)
+                start = len(fnames)
+            else:
+                raise ValueError('Line {} in discovered classes has wrong'
+                                 ' format\n {}\n'.format(
+                                     line_number, stripped))
+
+        return (fnames, np.array(disc_ons, dtype=np.float64),
+                np.array(disc_offs, dtype=np.float64),
+                (class_numbers, np.array(starts, dtype=np.int64),
+                 np.array(stops, dtype=np.int64), class_lines),
+                (class_number, class_line))
+
+    def _transcribe_clusters(self, pending, fnames, disc_ons, disc_offs,
+                             seen_classes):
+        """ Transcribe the intervals of the pending clusters, and return
+        the list of non empty clusters as (class_number, intervals).
+
+        seen_classes is the set of the class numbers of the non empty
+        clusters already read, and is updated with the new ones."""
+        if self.compact:
+            return self._store_clusters(
+                pending, fnames, disc_ons, disc_offs, seen_classes)
+
+        if self.gold_phn:
+            transcriptions = self.get_transcriptions(
+                fnames, disc_ons, disc_offs, self.gold_phn, self.vocabulary)
+        else:
+            transcriptions = [(None, None)] * len(fnames)
+
+        clusters = []
+        for class_number, start, stop, line_number in zip(*pending):
+            classes = []
+            for ix in range(start, stop):
+                token_ngram, ngram = transcriptions[ix]
+
+                # throw away interval if outside of transcription
+                if self.gold_phn and len(token_ngram) == 0:
+                    continue
+                classes.append(
+                    (fnames[ix], disc_ons[ix], disc_offs[ix],
+                     token_ngram, ngram))
+
+            # if entry already exists, exit with an error
+            assert class_number not in seen_classes, (
+                "Two Classes have the same number {}"
+                " in discovered classes, line {}".format(
+                    class_number, line_number))
+            #assert len(classes) > 0, (
+            #        'class {} if empty'.format(class_number))
+            if len(classes) > 0:
+                seen_classes.add(class_number)
+                clusters.append((class_number, classes))
+        return clusters
+
+    def _store_clusters(self, pending, fnames, disc_ons, disc_offs,
+                        seen_classes):
+        """ Same as `_transcribe_clusters`, but the intervals are stored in
+        an IntervalStore, and the clusters are given as IntervalList"""
+        file_ids, phn_starts, phn_stops = self.get_phone_spans(
+            fnames, disc_ons, disc_offs, self.gold_phn)
+
+        # throw away interval if outside of transcription
+        keep = phn_stops > phn_starts
+        indices, cluster_ids, class_numbers = [], [], []
+        for class_number, start, stop, line_number in zip(*pending):
+            cluster = [ix for ix in range(start, stop) if keep[ix]]
+
+            # if entry already exists, exit with an error
+            assert class_number not in seen_classes, (
+                "Two Classes have the same number {}"
+                " in discovered classes, line {}".format(
+                    class_number, line_number))
+            if len(cluster) > 0:
+                seen_classes.add(class_number)
+                indices.extend(cluster)
+                cluster_ids.extend([len(class_numbers)] * len(cluster))
+                class_numbers.append(class_number)
+
+        indices = np.array(indices, dtype=np.int64)
+        records = np.zeros(len(indices), dtype=RECORD_DTYPE)
+        records['file_id'] = file_ids[indices]
+        records['onset'] = np.asarray(disc_ons, dtype=np.float64)[indices]
+        records['offset'] = np.asarray(disc_offs, dtype=np.float64)[indices]
+        records['phn_start'] = phn_starts[indices]
+        records['phn_stop'] = phn_stops[indices]
+        records['cluster_id'] = cluster_ids
+
+        store = IntervalStore(records, self.gold_phn, class_numbers,
+                              self.vocabulary)
+        return [(class_number, store.cluster(cluster_id))
+                for cluster_id, class_number in enumerate(class_numbers)]
+
     def read_intervals_tree(self):
         """ Read discovered intervals as interval tree"""
+        import intervaltree
         self.intervals_tree = dict()
         for fname in self.intervals:
             self.intervals_tree[fname] = intervaltree.IntervalTree.from_tuples(
                 self.intervals[fname])
 
+    @staticmethod
+    def get_transcriptions(fnames, disc_ons, disc_offs, gold_phn,
+                           vocabulary=None):
+        """ Given a list of intervals, get their phone transcriptions
+
+        Batch version of `get_transcription`, which gives exactly the same
+        transcriptions, from the phone ranges given by `get_phone_spans`.
+
+        Parameters
+        ----------
+        fnames: list of str, name of the speaker of each interval
+        disc_ons: list of float, onset of each interval
+        disc_offs: list of float, offset of each interval
+        gold_phn: Alignment, contains the gold phones
+        vocabulary: NgramVocabulary, if given the phones are encoded with
+                    gold_phn.symbol2ix and the ngrams are interned in it
+
+        Returns
+        -------
+        transcriptions: list of (token_ngram, ngram), the transcription of
+                        each interval, as returned by `get_transcription`,
+                        or encoded if vocabulary is given
+        """
+        # the covered phones are a contiguous range of the gold only if the
+        # gold phones don't overlap, otherwise transcribe one by one.
+        if not isinstance(gold_phn, Alignment) or not gold_phn.disjoint:
+            transcriptions = [
+                Disc.get_transcription(fname, disc_on, disc_off, gold_phn)
+                for fname, disc_on, disc_off
+                in zip(fnames, disc_ons, disc_offs)]
+            if vocabulary is None:
+                return transcriptions
+            return [(tuple((on, off, vocabulary.symbol2ix[phn])
+                           for on, off, phn in token_ngram),
+                     vocabulary.intern(
+                         vocabulary.symbol2ix[phn] for phn in ngram))
+                    for token_ngram, ngram in transcriptions]
+
+        file_ids, phn_starts, phn_stops = Disc.get_phone_spans(
+            fnames, disc_ons, disc_offs, gold_phn)
+
+        return transcribe_spans(gold_phn, phn_starts, phn_stops, vocabulary)
+
+    @staticmethod
+    def get_phone_spans(fnames, disc_ons, disc_offs, gold_phn):
+        """ Given a list of intervals, get the range of the gold phones of
+        their transcription
+
+        The phones of the transcription of the i-th interval are the phones
+        phn_starts[i] to phn_stops[i] (excluded) of gold_phn, as given by
+        `get_transcriptions`. The intervals are grouped by file, the covered
+        phones of all the intervals are searched at once in the columnar
+        gold with np.searchsorted, and the 30ms / 50% rule is applied to
+        the first and last covered phones as array operations.
+
+        Parameters
+        ----------
+        fnames: list of str, name of the speaker of each interval
+        disc_ons: list of float, onset of each interval
+        disc_offs: list of float, offset of each interval
+        gold_phn: Alignment, contains the gold phones, which must be
+                  disjoint
+
+        Returns
+        -------
+        (file_ids, phn_starts, phn_stops): int arrays, the index of the
+            file of each interval in gold_phn.fnames, and the range of
+            the phones of its transcription. The transcription is empty
+            if phn_stops[i] <= phn_starts[i].
+        """
+        file_ids = np.array([gold_phn.file2ix[fname] for fname in fnames],
+                            dtype=np.int64)
+        disc_ons = np.asarray(disc_ons, dtype=np.float64)
+        disc_offs = np.asarray(disc_offs, dtype=np.float64)
+        starts, stops = gold_phn.overlap_ranges(file_ids, disc_ons, disc_offs)
+        n_covered = stops - starts
+
+        # Check if first and last phones are discovered
+        first = np.minimum(starts, max(gold_phn.n_intervals - 1, 0))
+        last = np.maximum(stops - 1, 0)
+        keep_first = check_boundaries(
+            gold_phn.onset[first], gold_phn.offset[first],
+            disc_ons, disc_offs)
+        keep_last = check_boundaries(
+            gold_phn.onset[last], gold_phn.offset[last],
+            disc_ons, disc_offs)
+
+        # the kept phones are [phn_starts, phn_stops), the last phone is
+        # only checked separately if it is not also the first phone.
+        phn_starts = starts + (~keep_first)
+        phn_stops = stops - (~keep_last & (n_covered > 1))
+        return file_ids, phn_starts, phn_stops
+
     @staticmethod
     def get_transcription(fname, disc_on, disc_off, gold_phn):
         """ Given an interval, get its phone transcription
@@ -177,7 +672,7 @@ class Disc():
         fname: str, name of the speaker on the interval
         disc_on: float, onset of the interval
         disc_off: float, offset of the interval
-        gold_phn: intervaltree, contains the gold phones
+        gold_phn: Alignment or dict of intervaltree, contains the gold phones
 
         Returns
         -------
@@ -1,60 +1,94 @@
 #!/usr/bin/env python
 """Gold object contains a vad, a word alignment and a phone alignmenet
 
-Each alignement can be represented either as an interval tree or a dictionnary,
-depending on the usage (interval tree is fast for interval retrieval/ overal
-detection)
+Each alignement can be represented either as a columnar alignment (the
+default, see :mod:`tde.readers.alignment`), an interval tree or a
+dictionnary, depending on the usage (columnar alignment and interval tree are
+fast for interval retrieval/ overlap detection)
 
 """
 
 import os
-import pandas as pd
-import intervaltree
+import shutil
+import hashlib
+import tempfile
+import numpy as np
 
 from collections import defaultdict
+from tde import progress
+from tde.readers.alignment import Alignment, WordIndex
+
+
+# version of the binary cache format, to change when the content of the
+# cached alignments changes
+CACHE_VERSION = 2
 
 
 class Gold():
-    def __init__(self, vad_path=None, wrd_path=None, phn_path=None):
+    def __init__(self, vad_path=None, wrd_path=None, phn_path=None,
+                 cache_dir=None, mmap=False):
         """Object representing the gold.
 
         Contains the VAD,the word alignement and the phone alignment. The
-        alignments can be stored as interval trees or as dictionnaries. The
-        interval tree of the silences can also be stored.
+        alignments are stored as columnar alignments, but can also be read as
+        interval trees or as dictionnaries. The interval tree of the silences
+        can also be stored.
 
         Attributes
         ----------
         :param vad_path: string, path to the vad
         :param_wrd_path: string, path to the word alignment
         :param phn_path: string, path to the phone alignment
+        :param cache_dir: string, if given, the parsed alignments are saved
+                in binary format in this directory the first time they are
+                read, and loaded from there afterwards, as long as the
+                checksum of the text alignment doesn't change
+        :param mmap: bool, if True, the alignments are memory mapped read
+                only from the cache instead of being loaded in memory, so
+                that all the processes using the same cache share one copy
+                of the gold. Requires cache_dir.
         :param boundaries: tuples of two dicts, each dict contains the
                         database filename as key, and for each file,
                         contains the onset boundaries and offset boundaries
-        :param phones: a dict {fname: intervaltree} which returns the interval tree
-                of the gold phones for each file
-        :param words: a dict {fname: intervaltree} which returns the interval tree
-                of the gold words for each file
+        :param phones: an Alignment, which behaves as a dict {fname: intervals}
+                and stores the gold phones of each file
+        :param words: an Alignment, which behaves as a dict {fname: intervals}
+                and stores the gold words of each file
+        :param word_index: a WordIndex, which gives the phone transcription
+                of each gold word as an integer type id
         """
         # paths
         self.vad_path = vad_path
         self.wrd_path = wrd_path
         self.phn_path = phn_path
+        self.cache_dir = cache_dir
+        if mmap and cache_dir is None:
+            raise ValueError('gold can only be memory mapped from the cache,'
+                             ' cache_dir should be given')
+        self.mmap_mode = 'r' if mmap else None
 
         # golds
-        self.boundaries = None
+        self._boundaries = None
+        self._boundary_arrays = None
+        self._word_index = None
         self.phones = None
         self.words = None
 
         # read alignments
-        self.words, _, self.ix2wrd, self.wrd2ix, self.boundaries = (
-            self.read_gold_intervalTree(self.wrd_path, "word"))
-
-        if "SIL" in self.wrd2ix:
-            print("WARNING: Word alignement contains silences, those will be counted as word by the evaluation.\n"
-                  "You should keep them in the phone alignment but remove them from the word alignment.")
-
-        self.phones, _, self.ix2phn, self.phn2ix, _ = (
-            self.read_gold_intervalTree(self.phn_path, "phone"))
+        with progress.task('alignments', total=2, unit='alignments') as task:
+            self.words = self.load_gold_alignment(self.wrd_path, "word")
+            self.ix2wrd, self.wrd2ix = (self.words.ix2symbol,
+                                        self.words.symbol2ix)
+            task.advance()
+
+            if "SIL" in self.wrd2ix:
+                print("WARNING: Word alignement contains silences, those will be counted as word by the evaluation.\n"
+                      "You should keep them in the phone alignment but remove them from the word alignment.")
+
+            self.phones = self.load_gold_alignment(self.phn_path, "phone")
+            self.ix2phn, self.phn2ix = (self.phones.ix2symbol,
+                                        self.phones.symbol2ix)
+            task.advance()
         # self.boundaries = self.get_boundaries()
 
     def read_gold_dict(self, gold_path):
@@ -70,6 +104,7 @@ class Gold():
             raise ValueError('{}: File Not Found'.format(gold_path))
 
         # Read phone alignment using pandas
+        import pandas as pd
         df = pd.read_table(
             gold_path, sep=' ', header=None, encoding='utf8',
             names=['file', 'start', 'end', 'symbol'])
@@ -184,6 +219,7 @@ class Gold():
                 boundaries_down[fname].add(float(on))
 
             # for each filename, create an interval tree
+            import intervaltree
             for fname in intervals:
                 gold[fname] = intervaltree.IntervalTree.from_tuples(
                     intervals[fname])
@@ -200,6 +236,216 @@ class Gold():
         return (gold, transcription, ix2symbols,
                 symbol2ix, (boundaries_up, boundaries_down))
 
+    @property
+    def boundaries(self):
+        """tuple of two dicts {fname: set}, the offsets and onsets of the
+        gold words of each file. Only built when first used, so that the
+        processes that don't need them don't hold a copy."""
+        if self._boundaries is None:
+            boundaries_up, boundaries_down = self.words.boundaries()
+            self._boundaries = (defaultdict(set, boundaries_up),
+                                defaultdict(set, boundaries_down))
+        return self._boundaries
+
+    @boundaries.setter
+    def boundaries(self, boundaries):
+        self._boundaries = boundaries
+        self._boundary_arrays = None
+
+    @property
+    def boundary_arrays(self):
+        """tuple of two dicts {fname: array}, the offsets and onsets of the
+        gold words of each file, as `boundaries`, but in sorted arrays of
+        distinct times. Only built when first used."""
+        if self._boundary_arrays is None:
+            if self._boundaries is None and isinstance(self.words, Alignment):
+                # built directly from the columns of the alignment
+                self._boundary_arrays = self.words.boundary_arrays()
+            else:
+                self._boundary_arrays = tuple(
+                    {fname: np.array(sorted(times), dtype=np.float64)
+                     for fname, times in boundaries.items()}
+                    for boundaries in self.boundaries)
+        return self._boundary_arrays
+
+    @property
+    def word_index(self):
+        """WordIndex of the transcriptions of the gold words, only built
+        when first used."""
+        if self._word_index is None:
+            self._word_index = WordIndex(self.words, self.phones)
+        return self._word_index
+
+    def load_gold_alignment(self, gold_path, symbol_type=None):
+        """Read the gold alignment as a columnar :class:`Alignment`, using
+        the binary cache when possible.
+
+        If `cache_dir` is set, the alignment is loaded from the cache if it
+        contains an alignment read from a file with the same checksum.
+        Otherwise it is read with `read_gold_alignment` and saved in the
+        cache. If `mmap` was set, the alignment is then memory mapped from
+        the cache.
+
+        Parameters
+        ----------
+        - gold : the path to the gold alignment
+        - symbol_type: string, "word" or "phone", see read_gold_alignment
+        Returns
+        -------
+        - alignment: an Alignment containing the gold intervals of each file
+        """
+        if not os.path.isfile(gold_path):
+            raise ValueError('{}: File Not Found'.format(gold_path))
+        if self.cache_dir is None:
+            return self.read_gold_alignment(gold_path, symbol_type)
+
+        cache_path = self.get_cache_path(gold_path, symbol_type)
+        if os.path.isdir(cache_path):
+            try:
+                return Alignment.load(cache_path, self.mmap_mode)
+            except (OSError, ValueError):
+                # unreadable cache, read the text alignment again
+                shutil.rmtree(cache_path, ignore_errors=True)
+
+        alignment = self.read_gold_alignment(gold_path, symbol_type)
+
+        # write the cache in a temporary directory first, so that
+        # concurrent evaluations never read a partially written cache
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=self.cache_dir)
+        alignment.save(tmp_path)
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            # another process wrote the same cache in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        if self.mmap_mode is not None:
+            return Alignment.load(cache_path, self.mmap_mode)
+        return alignment
+
+    def get_cache_path(self, gold_path, symbol_type=None):
+        """Return the directory where the alignment read from gold_path is
+        cached. The name of the directory contains the checksum of the
+        alignment file, so a modified alignment is never read from an old
+        cache."""
+        sha1 = hashlib.sha1()
+        with open(gold_path, 'rb') as fin:
+            for block in iter(lambda: fin.read(1 << 20), b''):
+                sha1.update(block)
+
+        return os.path.join(self.cache_dir, '{}.{}.v{}.{}'.format(
+            os.path.basename(gold_path), symbol_type, CACHE_VERSION,
+            sha1.hexdigest()))
+
+    def read_gold_alignment(self, gold_path, symbol_type=None):
+        """Read the gold alignment as a columnar :class:`Alignment`.
+
+        Contains exactly the same intervals as the interval trees built by
+        `read_gold_intervalTree`, but stored in flat arrays, which avoids
+        creating one Python object per interval. The file is parsed in bulk
+        with the pandas C parser, and the columns are validated, sorted and
+        deduplicated as arrays. If a line is wrongly formated, the file is
+        read again line by line with `read_gold_lines` to report it.
+
+        Parameters
+        ----------
+        - gold : the path to the gold alignment
+        - symbol_type: string, "word" or "phone",
+                       if "word", don't  keep the silences if some are found
+                       if "phone", keep them and raise warning if none are found
+        Returns
+        -------
+        - alignment: an Alignment containing the gold intervals of each file,
+                     the onset and offset boundaries of each file are
+                     given by alignment.boundaries()
+
+        Raises
+        ------
+        ValueError
+            - If the alignement is not well formated
+        UserWarning
+            - If the phone alignement does not contain silences
+        AssertionError
+            - If an interval contains an offset lower than the onset
+        """
+        if not os.path.isfile(gold_path):
+            raise ValueError('{}: File Not Found'.format(gold_path))
+
+        # parse the whole file at once with the pandas C parser, the floats
+        # are parsed exactly as python's float() does. pandas is only
+        # imported here, since the cached alignments don't need it.
+        import pandas as pd
+        try:
+            gold = pd.read_csv(
+                gold_path, sep=' ', header=None, index_col=False,
+                names=['fname', 'onset', 'offset', 'symbol'],
+                dtype={'fname': str, 'onset': np.float64,
+                       'offset': np.float64, 'symbol': str},
+                na_filter=False, skip_blank_lines=False, quoting=3,
+                float_precision='round_trip', engine='c')
+        except pd.errors.EmptyDataError:
+            return Alignment.from_intervals(dict())
+        except (ValueError, pd.errors.ParserError):
+            gold = None
+
+        # if a line is wrongly formated or has incorrect timestamps, parse
+        # the file line by line to report the error with the line number
+        if (gold is None or gold.isnull().values.any()
+                or np.any(gold['symbol'].values == '')
+                or not np.all(gold['offset'].values > gold['onset'].values)):
+            return self.read_gold_lines(gold_path, symbol_type)
+
+        # If word alignement, don't keep silences, else, keep them.
+        if symbol_type == "word":
+            gold = gold[gold['symbol'].values != "SIL"]
+
+        return Alignment.from_arrays(
+            gold['fname'].values, gold['onset'].values,
+            gold['offset'].values, gold['symbol'].values)
+
+    @staticmethod
+    def read_gold_lines(gold_path, symbol_type=None):
+        """ Read the gold alignment line by line, see `read_gold_alignment`.
+
+        Slower than the bulk parser of `read_gold_alignment`, but raises an
+        error for the first wrongly formated line, with its line number.
+        """
+        intervals = defaultdict(list)
+
+        # keep flag to check that phone alignement contains silences
+        sil_flag = True
+        with open(gold_path, 'r') as fin:
+            for line_number, line in enumerate(fin, start=1):
+                try:
+                    fname, on, off, symbol = line.strip('\n').split(' ')
+                    on, off = float(on), float(off)
+                except ValueError:
+                    raise ValueError(
+                        'format of alignement should be:\n'
+                        '\tfilename onset offset symbol\n'
+                        'but alignment contains wrongly formated line {}:\n'
+                        '{}'.format(line_number, line))
+
+                # check timestamps are in correct order
+                assert off > on, ("timestamps are not"
+                        " correct\n line {}: {}".format(line_number, line))
+
+                # If word alignement, don't keep silences, else, keep them.
+                if symbol_type == "word" and symbol == "SIL":
+                    continue
+                elif symbol_type == "phone" and symbol == "SIL":
+                    sil_flag = True
+                intervals[fname].append((on, off, symbol))
+
+        # raise warning if phone alignment doesn't contain silences
+        if symbol_type == "phone" and not sil_flag:
+            raise UserWarning("phone alignment does not contain"
+                    " silences, which are necessary for correct"
+                    " evaluation.")
+
+        return Alignment.from_intervals(intervals)
+
     def get_intervals(fname, on, off, gold, transcription):
         """ Given a filename and an interval, retrieve the list of
         covered intervals, and their transcription.
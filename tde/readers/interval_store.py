@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""Compact storage of the discovered intervals
+
+An :class:`IntervalStore` stores all the discovered intervals in one NumPy
+structured array, with one record per interval:
+
+    file_id: index of the file of the interval in gold_phn.fnames
+    onset, offset: timestamps of the interval
+    phn_start, phn_stop: the phones of the transcription of the interval
+        are the phones phn_start to phn_stop (excluded) of the gold phone
+        alignment
+    cluster_id: index of the cluster of the interval in class_numbers
+
+so the transcriptions point into the gold phone arrays instead of being
+copied in tuples for each interval.
+
+For the measures that need the intervals as tuples (fname, disc_on,
+disc_off, token_ngram, ngram), an :class:`IntervalList` is a read only
+sequence view on some records of a store, that builds the tuples when
+they are accessed.
+
+"""
+
+import numpy as np
+
+
+RECORD_DTYPE = np.dtype([('file_id', np.int32),
+                         ('onset', np.float64),
+                         ('offset', np.float64),
+                         ('phn_start', np.int64),
+                         ('phn_stop', np.int64),
+                         ('cluster_id', np.int32)])
+
+
+def transcribe_spans(gold_phn, phn_starts, phn_stops, vocabulary=None):
+    """ Build the (token_ngram, ngram) transcription of phone ranges
+
+    Parameters
+    ----------
+    gold_phn: Alignment, the gold phones
+    phn_starts, phn_stops: int arrays, the phones of the i-th transcription
+                           are [phn_starts[i], phn_stops[i]) in gold_phn
+    vocabulary: NgramVocabulary, if given the phones are encoded with
+                gold_phn.symbol2ix and the ngrams are interned in it
+
+    Returns
+    -------
+    transcriptions: list of (token_ngram, ngram), as returned by
+                    Disc.get_transcription
+    """
+    ix2symbol = gold_phn.ix2symbol
+    transcriptions = []
+    for phn_start, phn_stop in zip(np.asarray(phn_starts).tolist(),
+                                   np.asarray(phn_stops).tolist()):
+        if phn_stop <= phn_start:
+            transcriptions.append((tuple(), tuple()))
+            continue
+        codes = gold_phn.symbol[phn_start:phn_stop].tolist()
+        if vocabulary is None:
+            ngram = tuple(ix2symbol[phn] for phn in codes)
+        else:
+            ngram = codes
+        token_ngram = tuple(zip(
+            gold_phn.onset[phn_start:phn_stop].tolist(),
+            gold_phn.offset[phn_start:phn_stop].tolist(),
+            ngram))
+        if vocabulary is not None:
+            ngram = vocabulary.intern(codes)
+        transcriptions.append((token_ngram, ngram))
+    return transcriptions
+
+
+class IntervalStore():
+    """ Discovered intervals stored as a structured array
+
+    Attributes
+    ----------
+    :param records: structured array of RECORD_DTYPE, one record per
+                    interval, sorted by cluster_id
+    :param gold_phn: Alignment, the gold phones the records point into
+    :param class_numbers: list, the class number of each cluster_id
+    :param vocabulary: NgramVocabulary or None, if given the ngrams of the
+                       tuples are encoded, see Disc with encoded=True
+    """
+
+    def __init__(self, records, gold_phn, class_numbers, vocabulary=None):
+        self.records = np.asarray(records, dtype=RECORD_DTYPE)
+        self.gold_phn = gold_phn
+        self.class_numbers = list(class_numbers)
+        self.vocabulary = vocabulary
+
+        # the records of the cluster i are between cluster_offsets[i] and
+        # cluster_offsets[i + 1]
+        self.cluster_offsets = np.searchsorted(
+            self.records['cluster_id'],
+            np.arange(len(self.class_numbers) + 1), 'left')
+
+    @classmethod
+    def concatenate(cls, stores, gold_phn, vocabulary=None):
+        """ Merge stores sharing the same gold in a single store"""
+        records, class_numbers = [], []
+        for store in stores:
+            shifted = store.records.copy()
+            shifted['cluster_id'] += len(class_numbers)
+            records.append(shifted)
+            class_numbers.extend(store.class_numbers)
+        return cls(np.concatenate(records + [np.zeros(0, RECORD_DTYPE)]),
+                   gold_phn, class_numbers, vocabulary)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def nbytes(self):
+        """Size of the records, in bytes"""
+        return self.records.nbytes
+
+    def intervals(self, indices):
+        """ Return the list of the tuples (fname, disc_on, disc_off,
+        token_ngram, ngram) of the records at the given indices"""
+        records = self.records[indices]
+        fnames = self.gold_phn.fnames
+        transcriptions = transcribe_spans(
+            self.gold_phn, records['phn_start'], records['phn_stop'],
+            self.vocabulary)
+        return [(fnames[file_id], disc_on, disc_off, token_ngram, ngram)
+                for file_id, disc_on, disc_off, (token_ngram, ngram)
+                in zip(records['file_id'].tolist(),
+                       records['onset'].tolist(),
+                       records['offset'].tolist(),
+                       transcriptions)]
+
+    def cluster(self, cluster_id):
+        """ Return the intervals of a cluster as an IntervalList"""
+        return IntervalList(self, np.arange(
+            self.cluster_offsets[cluster_id],
+            self.cluster_offsets[cluster_id + 1]))
+
+    def clusters(self):
+        """ Return a dict {class_number: IntervalList} of the clusters"""
+        return {class_number: self.cluster(cluster_id)
+                for cluster_id, class_number in enumerate(self.class_numbers)}
+
+    def unique(self):
+        """ Return the distinct intervals, as an IntervalList. Two intervals
+        are the same if they have the same file, onset and offset."""
+        keys = np.zeros(len(self.records), dtype=[
+            ('file_id', np.int32), ('onset', np.float64),
+            ('offset', np.float64)])
+        for field in keys.dtype.names:
+            keys[field] = self.records[field]
+        _, first = np.unique(keys, return_index=True)
+        return IntervalList(self, np.sort(first))
+
+
+class IntervalList():
+    """ Read only sequence of some intervals of an :class:`IntervalStore`
+
+    The intervals are given as (fname, disc_on, disc_off, token_ngram,
+    ngram) tuples, that are built each time they are accessed.
+    """
+
+    def __init__(self, store, indices, chunk_size=10000):
+        self.store = store
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return IntervalList(self.store, self.indices[item],
+                                self.chunk_size)
+        return self.store.intervals([self.indices[item]])[0]
+
+    def __iter__(self):
+        for start in range(0, len(self.indices), self.chunk_size):
+            for interval in self.store.intervals(
+                    self.indices[start:start + self.chunk_size]):
+                yield interval
+
+    def __repr__(self):
+        return 'IntervalList({} intervals)'.format(len(self))
@@ -0,0 +1,155 @@
+"""Structured results of an evaluation
+
+:class:`Results` gathers in one document everything about the evaluation
+of a class file:
+
+    corpus, class_file, class_file_sha1: what was evaluated
+    scores: the scores of the measures, see tde.evaluation.get_scores
+    counts: the numbers the scores are computed from (distinct intervals,
+        clusters, pairs, boundaries...), see tde.evaluation.get_counts
+    stages: the wall time (in seconds) and the peak resident memory (in
+        bytes) of each stage of the evaluation (gold, disc, and each
+        measure), recorded by :class:`tde.progress.Stages`
+
+and writes it in JSON, or as a one row table in csv or parquet, so that
+results can be gathered and compared without parsing the text files of
+`Measure.write_score`.
+
+Example
+-------
+    stages = Stages()
+    with stages.stage('gold'):
+        gold = Gold(wrd_path=wrd_path, phn_path=phn_path)
+    ...
+    results = Results.from_measures(selected, 'mandarin', disc_path,
+                                    stages=stages)
+    results.write_json('results.json')
+
+"""
+
+import os
+import csv
+import json
+import math
+import hashlib
+from collections import OrderedDict
+
+import tde
+from tde.evaluation import get_scores, get_counts
+# Stages was defined here before progress reports were added
+from tde.progress import Stages
+
+
+def file_sha1(path, block_size=1 << 20):
+    """ Return the sha1 of the content of a file"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as fin:
+        for block in iter(lambda: fin.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _to_json(value):
+    """ nan is not valid JSON, it is written as null"""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class Results():
+    """ Results of the evaluation of a class file
+
+    Attributes
+    ----------
+    :param corpus: name of the corpus of the gold
+    :param class_file: path to the evaluated class file
+    :param class_file_sha1: sha1 of the content of the class file, None if
+                            it can't be read
+    :param scores: OrderedDict {column: float} of the scores
+    :param counts: OrderedDict {column: int} of the counts
+    :param stages: OrderedDict {stage: {'wall_time', 'peak_memory'}}
+    """
+
+    def __init__(self, corpus=None, class_file=None, scores=None,
+                 counts=None, stages=None):
+        self.corpus = corpus
+        self.class_file = class_file
+        self.class_file_sha1 = None
+        if class_file is not None and os.path.isfile(class_file):
+            self.class_file_sha1 = file_sha1(class_file)
+        self.scores = OrderedDict(scores or {})
+        self.counts = OrderedDict(counts or {})
+        self.stages = OrderedDict(stages or {})
+
+    @classmethod
+    def from_measures(cls, selected, corpus=None, class_file=None,
+                      n_clusters=None, n_intervals=None, stages=None):
+        """ Results of computed measures, see tde.evaluation.select_measures
+
+            Input
+            :param selected: dict {name: Measure} of the computed measures
+            :param corpus, class_file: what was evaluated
+            :param n_clusters, n_intervals: number of clusters and of
+                                            distinct intervals read
+            :param stages: Stages of the evaluation
+        """
+        return cls(corpus, class_file, get_scores(selected),
+                   get_counts(selected, n_clusters, n_intervals),
+                   stages.stages if stages is not None else None)
+
+    def to_dict(self):
+        """ Return the results as a JSON serializable nested dict"""
+        return OrderedDict([
+            ('tde_version', tde.__version__),
+            ('corpus', self.corpus),
+            ('class_file', self.class_file),
+            ('class_file_sha1', self.class_file_sha1),
+            ('scores', OrderedDict(
+                (name, _to_json(score))
+                for name, score in self.scores.items())),
+            ('counts', self.counts),
+            ('stages', self.stages)])
+
+    def to_row(self):
+        """ Return the results as a flat OrderedDict, with the columns of
+        the scores and of the counts, and for each stage the columns
+        `<stage>_wall_time` and `<stage>_peak_memory`"""
+        row = OrderedDict([
+            ('tde_version', tde.__version__),
+            ('corpus', self.corpus),
+            ('class_file', self.class_file),
+            ('class_file_sha1', self.class_file_sha1)])
+        row.update(self.scores)
+        row.update(self.counts)
+        for name, stage in self.stages.items():
+            for key, value in stage.items():
+                row['{}_{}'.format(name.replace('/', '_'), key)] = value
+        return row
+
+    def write_json(self, path):
+        """ Write the results in a JSON document"""
+        with open(path, 'w') as fout:
+            json.dump(self.to_dict(), fout, indent=2)
+            fout.write('\n')
+
+    def write_csv(self, path):
+        """ Write the results as a one row csv table, see `to_row`"""
+        row = self.to_row()
+        with open(path, 'w', newline='') as fout:
+            writer = csv.DictWriter(fout, list(row))
+            writer.writeheader()
+            writer.writerow(row)
+
+    def write_parquet(self, path):
+        """ Write the results as a one row parquet table, see `to_row`.
+        Requires pandas, and pyarrow or fastparquet."""
+        import pandas as pd
+        pd.DataFrame([self.to_row()]).to_parquet(path, index=False)
+
+    def write(self, output_folder, formats=('json',)):
+        """ Write the results in `output_folder`, as results.json,
+        results.csv and/or results.parquet depending on `formats`"""
+        writers = {'json': self.write_json, 'csv': self.write_csv,
+                   'parquet': self.write_parquet}
+        for fmt in formats:
+            writers[fmt](os.path.join(output_folder, 'results.' + fmt))
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+"""Evaluation server that keeps the gold of the corpora in memory
+
+Each call of `tde.eval` imports the package and reads the gold before
+evaluating the class file. The evaluation server reads the gold of the
+corpora once, when it starts, and then evaluates the class files it
+receives, so the time of each request is only the time of the evaluation of
+its class file. The requests are handled at the same time by a pool of
+worker processes, forked after the gold is read so that they share it.
+
+The server speaks HTTP, on a localhost port or on a Unix socket:
+
+    GET /corpora
+        return the list of the corpora loaded
+    POST /evaluate
+        evaluate a class file, given as a JSON object with the keys
+            corpus: name of the corpus
+            class_file: path to the class file, readable by the server
+            classes: or the content of the class file
+            measures: optional list of the measures to compute (see
+                tde.evaluation.MEASURES), all of them by default
+        and return the scores as a JSON object (see
+        tde.evaluation.get_scores), with null for the undefined scores.
+
+A request that can't be evaluated is answered with the status 400 and a JSON
+object {"error": message}.
+
+The server has no authentication, and reads any class file whose path it is
+sent, with the permissions of the user running it. It therefore only
+listens on a loopback address by default: listening on another address,
+with `--allow-remote`, gives every host that can reach it read access to
+the files of that user. A Unix socket can be restricted with the
+permissions of its folder.
+
+Example
+-------
+    $ tde-server --corpus mandarin --port 8765
+
+    scores = request_scores('mandarin', class_file='epoch1.class',
+                            port=8765)
+
+"""
+
+import os
+import sys
+import stat
+import json
+import math
+import socket
+import argparse
+import ipaddress
+import tempfile
+import http.client
+import socketserver
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tde.corpora import CORPORA, corpus_paths
+from tde.readers.gold_reader import Gold
+from tde.measures import MEASURES
+from tde.batch import evaluate
+
+
+# the gold of each corpus, in the worker processes
+_golds = dict()
+
+
+def load_golds(corpora, cache_dir=None):
+    """ Read the gold of the given corpora
+
+        The corpora whose gold alignments are not shipped are skipped, with
+        a warning.
+
+        Input
+        :param corpora: list of names in CORPORA
+        :param cache_dir: directory of the cached gold alignments, see Gold
+        Output
+        :return: dict {corpus: Gold}
+    """
+    golds = dict()
+    for corpus in corpora:
+        wrd_path, phn_path = corpus_paths(corpus)
+        if not (os.path.isfile(wrd_path) and os.path.isfile(phn_path)):
+            print('{}: gold alignments not found, skipping'.format(corpus),
+                  file=sys.stderr)
+            continue
+        golds[corpus] = Gold(wrd_path=wrd_path, phn_path=phn_path,
+                             cache_dir=cache_dir)
+        # built before forking, so that the workers share it
+        assert golds[corpus].word_index is not None
+    return golds
+
+
+def _init_worker(golds):
+    global _golds
+    _golds = golds
+
+
+def _evaluate_request(request):
+    """ Evaluate the class file of a request in a worker. Return (status,
+    response)."""
+    try:
+        gold = _golds[request['corpus']]
+        if 'class_file' in request:
+            scores = evaluate(gold, request['class_file'],
+                              request.get('measures'))
+        else:
+            # the class file is given in the request
+            fd, disc_path = tempfile.mkstemp(suffix='.class')
+            try:
+                with os.fdopen(fd, 'w') as fout:
+                    fout.write(request['classes'])
+                scores = evaluate(gold, disc_path, request.get('measures'))
+            finally:
+                os.remove(disc_path)
+    except (OSError, KeyError, ValueError, TypeError, AssertionError) as err:
+        return 400, {'error': '{}: {}'.format(type(err).__name__, err)}
+
+    # nan is not valid JSON
+    return 200, {name: None if math.isnan(score) else score
+                 for name, score in scores.items()}
+
+
+class EvaluationHandler(BaseHTTPRequestHandler):
+    """ Handle the requests of the server, see the module documentation"""
+
+    def address_string(self):
+        # the client of a Unix socket has no address
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return 'unix'
+
+    def send_json(self, status, response):
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/corpora':
+            self.send_json(200, sorted(self.server.corpora))
+        else:
+            self.send_json(404, {'error': '{}: not found'.format(self.path)})
+
+    def do_POST(self):
+        if self.path != '/evaluate':
+            self.send_json(404, {'error': '{}: not found'.format(self.path)})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            self.check_request(request)
+        except (ValueError, TypeError) as err:
+            self.send_json(400, {'error': '{}: {}'.format(
+                type(err).__name__, err)})
+            return
+        self.send_json(*self.server.pool.apply(_evaluate_request, (request,)))
+
+    def check_request(self, request):
+        """ Check the fields of an evaluation request"""
+        if not isinstance(request, dict):
+            raise ValueError('the request should be a JSON object')
+        if request.get('corpus') not in self.server.corpora:
+            raise ValueError('{}: corpus not loaded, choose one of {}'.format(
+                request.get('corpus'), ', '.join(sorted(
+                    self.server.corpora))))
+        if ('class_file' in request) == ('classes' in request):
+            raise ValueError('give either class_file or classes')
+        for field in ('class_file', 'classes'):
+            if field in request and not isinstance(request[field], str):
+                raise TypeError('{} should be a string'.format(field))
+        measures = request.get('measures')
+        if measures is not None and not (
+                isinstance(measures, list)
+                and all(isinstance(name, str) for name in measures)):
+            raise TypeError('measures should be a list of strings')
+        for name in measures or []:
+            if name not in MEASURES:
+                raise ValueError('{}: unknown measure, choose in {}'.format(
+                    name, ', '.join(MEASURES)))
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    """ HTTP server on a Unix socket, with a thread per request"""
+    daemon_threads = True
+
+
+def is_loopback(host):
+    """ Return True if `host` is localhost or a loopback address"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def make_server(golds, njobs=1, host='127.0.0.1', port=8765,
+                socket_path=None, allow_remote=False):
+    """ Create the evaluation server, and its pool of workers
+
+        Input
+        :param golds: dict {corpus: Gold}, see `load_golds`
+        :param njobs: number of requests evaluated at the same time
+        :param host, port: address of the server
+        :param socket_path: if given, the server listens on this Unix
+                            socket instead of host and port. A stale
+                            socket at this path is replaced.
+        :param allow_remote: if True, host can be another address than a
+                             loopback one (see the module documentation)
+        Output
+        :return: the server, to run with serve_forever. Its pool of workers
+                 should be terminated when it is closed.
+
+        Raises
+        ------
+        ValueError
+            - if socket_path exists and is not a socket
+            - if host is not a loopback address and allow_remote is False
+    """
+    if socket_path is not None:
+        if os.path.lexists(socket_path):
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise ValueError('{}: exists and is not a socket'.format(
+                    socket_path))
+            os.remove(socket_path)
+    elif not allow_remote and not is_loopback(host):
+        raise ValueError('{}: not a loopback address, the server would'
+                         ' give access to the files of this user to other'
+                         ' hosts (see allow_remote)'.format(host))
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    pool = context.Pool(njobs, initializer=_init_worker, initargs=(golds,))
+
+    if socket_path is not None:
+        server = UnixHTTPServer(socket_path, EvaluationHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), EvaluationHandler)
+    server.corpora = set(golds)
+    server.pool = pool
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """ HTTP connection to a Unix socket"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request_scores(corpus, class_file=None, classes=None, measures=None,
+                   host='127.0.0.1', port=8765, socket_path=None,
+                   timeout=None):
+    """ Ask an evaluation server for the scores of a class file
+
+        Input
+        :param corpus: name of the corpus
+        :param class_file: path to the class file, readable by the server
+        :param classes: or the content of the class file
+        :param measures: list of the measures to compute, all of them if
+                         None
+        :param host, port, socket_path: address of the server, see
+                                        `make_server`
+        :param timeout: timeout of the request, in seconds
+        Output
+        :return: dict of the scores, see tde.evaluation.get_scores
+
+        Raises
+        ------
+        ValueError
+            - if the server couldn't evaluate the class file
+    """
+    request = {'corpus': corpus}
+    if class_file is not None:
+        request['class_file'] = os.path.abspath(class_file)
+    if classes is not None:
+        request['classes'] = classes
+    if measures:
+        request['measures'] = list(measures)
+
+    result = _request('POST', '/evaluate', request, host, port,
+                      socket_path, timeout)
+    return {name: float('nan') if score is None else score
+            for name, score in result.items()}
+
+
+def request_corpora(host='127.0.0.1', port=8765, socket_path=None,
+                    timeout=None):
+    """ Return the list of the corpora loaded by an evaluation server, see
+    `request_scores`"""
+    return _request('GET', '/corpora', None, host, port, socket_path,
+                    timeout)
+
+
+def _request(method, path, request, host, port, socket_path, timeout):
+    """ Send a request to an evaluation server and return its JSON
+    response, raise a ValueError if the request failed"""
+    if socket_path is not None:
+        connection = _UnixHTTPConnection(socket_path, timeout=timeout)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        if request is None:
+            connection.request(method, path)
+        else:
+            connection.request(method, path, json.dumps(request),
+                               {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        result = json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise ValueError(result['error'])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='tde-server',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='Serve spoken term discovery evaluations',
+        epilog="""Example usage:
+
+    $ tde-server --corpus mandarin --njobs 4 --port 8765
+
+    reads the mandarin gold, and evaluates the class files posted to
+    http://127.0.0.1:8765/evaluate, 4 at a time.
+    """)
+    parser.add_argument('--corpus', '-c', nargs='*', default=list(CORPORA),
+                        choices=CORPORA,
+                        help="corpora to load (default: all the corpora)")
+    parser.add_argument('--njobs', '-n', default=1, type=int,
+                        help="number of class files evaluated at the same"
+                        " time")
+    parser.add_argument('--host', default='127.0.0.1', type=str,
+                        help="address of the server, a loopback address"
+                        " unless --allow-remote is given (default:"
+                        " 127.0.0.1)")
+    parser.add_argument('--allow-remote', action='store_true',
+                        help="allow --host to be another address than a"
+                        " loopback one. The server has no authentication"
+                        " and reads the class files at the paths it is"
+                        " sent: only use it on a trusted network")
+    parser.add_argument('--port', '-p', default=8765, type=int,
+                        help="port of the server (default: 8765)")
+    parser.add_argument('--socket', type=str, default=None,
+                        help="listen on this Unix socket instead of a port")
+    parser.add_argument('--cache-dir', type=str,
+                        default=os.environ.get(
+                            'TDE_CACHE_DIR', os.path.join(
+                                os.path.expanduser('~'), '.cache', 'tde')),
+                        help="directory in which the parsed gold alignments"
+                        " are cached (default: $TDE_CACHE_DIR or"
+                        " ~/.cache/tde)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always parse the gold alignments from text")
+    args = parser.parse_args()
+
+    if not args.allow_remote and args.socket is None \
+       and not is_loopback(args.host):
+        parser.error('--host {} is not a loopback address, see'
+                     ' --allow-remote'.format(args.host))
+
+    print('Reading gold')
+    golds = load_golds(
+        args.corpus, cache_dir=None if args.no_cache else args.cache_dir)
+    if len(golds) == 0:
+        parser.error('no corpus could be loaded')
+
+    try:
+        server = make_server(golds, args.njobs, args.host, args.port,
+                             args.socket, args.allow_remote)
+    except ValueError as error:
+        parser.error(str(error))
+    print('Serving {} on {}'.format(
+        ', '.join(sorted(golds)),
+        args.socket or 'http://{}:{}'.format(args.host, args.port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.terminate()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,10 @@
                    at least either 50% of the phone duration
                    or 30ms of the phone duration.
 
+   check_boundaries: vectorized version of check_boundary, that checks
+                   arrays of phones and intervals at once and
+                   gives exactly the same result.
+
    overlap:        return the percentage of overlap and the
                    duration (in seconds) of the overlap
                    between two intervals.
@@ -12,7 +16,12 @@
                    second interval (i.e. if the first completely
                    overlaps the second one, even if the first is bigger,
                    ov=1.0)
+
+   split_by_cost:  split tasks of known costs in a given number of
+                   shards of about the same total cost, to balance the
+                   work of parallel processes.
 """
+import heapq
 import numpy as np 
 
 def check_boundary(gold_times, disc_times):
@@ -44,8 +53,76 @@ def check_boundary(gold_times, disc_times):
           (gold_dur < 0.060 and ov < 0.5)):
         return False
 
+def _round_threshold(value, ndigits, rounding):
+    """ Return the smallest float x such that rounding(x, ndigits) >= value.
+
+        As rounding is non decreasing, comparing x to this threshold is
+        exactly the same as comparing rounding(x, ndigits) to value.
+    """
+    threshold = value - 0.5 * 10 ** (-ndigits)
+    while rounding(threshold, ndigits) < value:
+        threshold = float(np.nextafter(threshold, np.inf))
+    while rounding(float(np.nextafter(threshold, -np.inf)), ndigits) >= value:
+        threshold = float(np.nextafter(threshold, -np.inf))
+    return threshold
+
+
+# check_boundary rounds the phone duration with python's round, and the
+# overlap time with numpy's round (np.min returns a numpy float)
+_MIN_LONG_PHONE = _round_threshold(0.060, 3, round)
+_MIN_OVERLAP_TIME = _round_threshold(
+    0.030, 3, lambda x, ndigits: round(np.float64(x), ndigits))
+
+
+def check_boundaries(gold_on, gold_off, disc_on, disc_off):
+    """ Vectorized version of check_boundary: for each gold phone and
+        discovered interval, check if the phone is discovered.
+
+        Input
+        :param gold_on:  array of the onsets of the gold phones
+        :param gold_off: array of the offsets of the gold phones
+        :param disc_on:  array of the onsets of the discovered intervals
+        :param disc_off: array of the offsets of the discovered intervals
+
+        Output
+        :return:         array of bool, True if phone is considered
+                         discovered, False otherwise
+    """
+    gold_dur = gold_off - gold_on
+    ov_time = np.minimum(disc_off, gold_off) - np.maximum(disc_on, gold_on)
+    ov = ov_time / gold_dur
+
+    # same rule as check_boundary: 30ms for phones over 60 ms, 50% of
+    # the phone duration otherwise
+    return np.where(gold_dur >= _MIN_LONG_PHONE,
+                    ov_time >= _MIN_OVERLAP_TIME,
+                    ov >= 0.5)
+
+
 def overlap(disc, gold):
     ov = (np.min([disc[1], gold[1]]) - np.max([disc[0], gold[0]])) \
         / (gold[1] - gold[0])
     time = round(np.min([disc[1], gold[1]]) - np.max([disc[0], gold[0]]), 3)
     return ov, time
+
+
+def split_by_cost(costs, n_shards):
+    """ Split tasks between n_shards, so that the total cost of each shard
+        is about the same: the tasks are assigned by decreasing cost to the
+        least loaded shard (longest processing time first).
+
+        Input
+        :param costs:    list of the (estimated) cost of each task
+        :param n_shards: int, number of shards
+        Output
+        :return:         list of at most n_shards non empty lists, the
+                         indices of the tasks of each shard
+    """
+    n_shards = max(1, min(n_shards, len(costs)))
+    shards = [[] for _ in range(n_shards)]
+    loads = [(0, shard) for shard in range(n_shards)]
+    for task in sorted(range(len(costs)), key=lambda task: -costs[task]):
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(task)
+        heapq.heappush(loads, (load + costs[task], shard))
+    return [shard for shard in shards if len(shard) > 0]
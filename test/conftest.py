@@ -1,18 +1,14 @@
 import pytest
-import pkg_resources
 
+from tde.corpora import share_path
 from tde.readers.gold_reader import Gold
 from tde.readers.disc_reader import Disc
 
 
 @pytest.fixture(scope='session')
 def gold():
-    wrd_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/buckeye.wrd')
-    phn_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/buckeye.phn')
+    wrd_path = share_path('buckeye.wrd')
+    phn_path = share_path('buckeye.phn')
 
     return Gold(wrd_path=wrd_path,
                 phn_path=phn_path)
@@ -20,15 +16,9 @@ def gold():
 
 @pytest.fixture(scope='session')
 def gold_vad():
-    wrd_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/buckeye.wrd')
-    phn_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/buckeye.phn')
-    vad_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/buckeye.vad')
+    wrd_path = share_path('buckeye.wrd')
+    phn_path = share_path('buckeye.phn')
+    vad_path = share_path('buckeye.vad')
 
     return Gold(wrd_path=wrd_path,
                 phn_path=phn_path,
@@ -36,37 +26,27 @@ def gold_vad():
 
 @pytest.fixture(scope='session')
 def mandarin_gold():
-    wrd_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/mandarin.wrd')
-    phn_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/mandarin.phn')
+    wrd_path = share_path('mandarin.wrd')
+    phn_path = share_path('mandarin.phn')
 
     return Gold(wrd_path=wrd_path,
                 phn_path=phn_path)
 
 @pytest.fixture(scope='session')
 def kamper_disc(mandarin_gold):
-    pairs_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/kamper_mandarin.class')
+    pairs_path = share_path('kamper_mandarin.class')
     discovered = Disc(pairs_path, mandarin_gold)
     return discovered 
 
 @pytest.fixture(scope='session')
 def ZR17_disc(mandarin_gold):
-    pairs_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/ZR17_mandarin.class')
+    pairs_path = share_path('ZR17_mandarin.class')
     discovered = Disc(pairs_path, mandarin_gold)
     return discovered 
 
 @pytest.fixture(scope='session')
 def gold_disc(gold):
-    pairs_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/gold.class')
+    pairs_path = share_path('gold.class')
     discovered = Disc(pairs_path, gold)
     # discovered.read_clusters()
     # discovered.intervals2txt(gold.phones)
@@ -75,9 +55,7 @@ def gold_disc(gold):
 
 @pytest.fixture(scope='session')
 def gold_disc_pairs(gold):
-    pairs_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/gold_pairs.class')
+    pairs_path = share_path('gold_pairs.class')
     discovered = Disc(pairs_path, gold)
     # discovered.read_clusters()
     # discovered.intervals2txt(gold.phones)
@@ -86,9 +64,7 @@ def gold_disc_pairs(gold):
 
 @pytest.fixture(scope='session')
 def disc(gold):
-    pairs_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/test_pairs')
+    pairs_path = share_path('test_pairs')
     discovered = Disc(pairs_path, gold)
     # discovered.read_clusters()
     # discovered.intervals2txt(gold.phones)
@@ -97,9 +73,7 @@ def disc(gold):
 
 @pytest.fixture(scope='session')
 def disc_bigIntervals(gold):
-    pairs_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/bigger_interval.class')
+    pairs_path = share_path('bigger_interval.class')
     discovered = Disc(pairs_path, gold)
     # discovered.read_clusters()
     # discovered.intervals2txt(gold.phones)
@@ -108,9 +82,7 @@ def disc_bigIntervals(gold):
 
 @pytest.fixture(scope='session')
 def disc_goldIntervals(gold):
-    pairs_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/gold.class')
+    pairs_path = share_path('gold.class')
     discovered = Disc(pairs_path, gold)
     # discovered.read_clusters()
     # discovered.intervals2txt(gold.phones)
@@ -119,9 +91,7 @@ def disc_goldIntervals(gold):
 
 @pytest.fixture(scope='session')
 def disc_clusters(gold):
-    pairs_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/group_clusters.class')
+    pairs_path = share_path('group_clusters.class')
     discovered = Disc(pairs_path, gold)
     # discovered.read_clusters()
     # discovered.intervals2txt(gold.phones)
@@ -130,9 +100,7 @@ def disc_clusters(gold):
 
 @pytest.fixture(scope='session')
 def disc_pairs(gold):
-    pairs_path = pkg_resources.resource_filename(
-            pkg_resources.Requirement.parse('tde'),
-            'tde/share/group_pairs.class')
+    pairs_path = share_path('group_pairs.class')
     discovered = Disc(pairs_path, gold)
     # discovered.read_clusters()
     # discovered.intervals2txt(gold.phones)
@@ -0,0 +1,40 @@
+import csv
+
+from tde.measures.ned import Ned
+from tde.measures.grouping import Grouping
+from tde.batch import evaluate_many, write_table
+
+
+def test_evaluate_many(mandarin_gold, kamper_disc, ZR17_disc, tmp_path):
+    """ class files evaluated in a batch, in one or several processes,
+    should have the same scores as class files evaluated separately"""
+    disc_paths = [kamper_disc.disc_path, ZR17_disc.disc_path,
+                  str(tmp_path / 'missing.class')]
+    rows = evaluate_many(mandarin_gold, disc_paths, ['grouping', 'ned'])
+    assert [row['class_file'] for row in rows] == disc_paths
+    assert 'File Not Found' in rows[2]['error']
+
+    for disc, row in zip([kamper_disc, ZR17_disc], rows):
+        assert row['error'] == ''
+        grouping = Grouping(disc)
+        grouping.compute_grouping()
+        assert row['grouping_precision'] == grouping.precision
+        ned = Ned(disc)
+        ned.compute_ned()
+        assert abs(row['ned'] - ned.ned) < 1e-12
+
+    parallel_rows = evaluate_many(
+        mandarin_gold, disc_paths, ['grouping', 'ned'], njobs=2)
+    # nan scores are compared by their repr, without the timings
+    def _scores(rows):
+        return repr([[(column, value) for column, value in row.items()
+                      if not column.endswith(('_wall_time', '_peak_memory'))]
+                     for row in rows])
+    assert _scores(parallel_rows) == _scores(rows)
+
+    output = str(tmp_path / 'scores.csv')
+    write_table(rows, output)
+    with open(output) as fin:
+        table = list(csv.DictReader(fin))
+    assert list(table[0]) == list(rows[0])
+    assert float(table[0]['ned']) == rows[0]['ned']
@@ -0,0 +1,25 @@
+import os
+import sys
+import json
+import subprocess
+
+
+BENCHMARKS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'benchmarks')
+
+
+def test_benchmark_repeat(tmp_path):
+    """ the benchmark should run several times on the same corpus, with
+    its gold cache rebuilt at each run"""
+    output = str(tmp_path / 'results.json')
+    subprocess.run(
+        [sys.executable, os.path.join(BENCHMARKS, 'run.py'),
+         '--scales', 'small', '--repeat', '2', '--measures', 'boundary',
+         '--output', output],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    with open(output) as fin:
+        results = json.load(fin)
+    assert [result['scale'] for result in results] == ['small']
+    assert list(results[0]['stages']) == [
+        'gold', 'gold_cached', 'disc', 'boundary']
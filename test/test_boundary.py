@@ -51,3 +51,39 @@ def test_ZR17Disc_subpart(mandarin_gold, ZR17_disc):
 
     assert bound.n_discovered_boundary == 12, ("should have found "
             "13 boundaries in those pairs")
+
+
+def test_tolerance(mandarin_gold, ZR17_disc):
+    """ the boundaries found with a tolerance should be the same as when
+    each boundary is compared with all the gold boundaries of its file"""
+    bound = Boundary(mandarin_gold, ZR17_disc)
+    gold_up, gold_down = mandarin_gold.boundaries
+    disc_down, disc_up = bound.disc_down, bound.disc_up
+
+    for tolerance in (0, 0.02, 0.2):
+        bound.compute_boundary(tolerance)
+
+        def close(time, times):
+            return any(abs(time - other) <= tolerance + 1e-9
+                       for other in times)
+
+        correct = {(fname, time) for fname in disc_down
+                   for time in disc_down[fname]
+                   if close(time, gold_down[fname])}
+        correct.update((fname, time) for fname in disc_up
+                       for time in disc_up[fname]
+                       if close(time, gold_up[fname]))
+        found = {(fname, time) for fname in disc_down
+                 for time in gold_down[fname]
+                 if close(time, disc_down[fname])}
+        found.update((fname, time) for fname in disc_up
+                     for time in gold_up[fname]
+                     if close(time, disc_up[fname]))
+
+        assert bound.n_discovered_boundary == len(correct)
+        assert bound.n_gold_found == len(found)
+        assert bound.n_all_disc_boundary == 30
+        if tolerance == 0:
+            assert len(correct) == len(found) == 12
+    # a discovered boundary can be close to several gold boundaries
+    assert len(correct) < len(found)
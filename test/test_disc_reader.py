@@ -1,3 +1,9 @@
+import pytest
+
+from tde.readers.disc_reader import Disc
+from tde.batch import evaluate_results
+
+
 def test_unique_intervals():
     pass
 
@@ -54,3 +60,127 @@ def test_tiny_interval(disc, gold):
     assert len(ngram) == 0, (
         'Discovered transcription should be empty, but '
         'found {} as transcription'.format(ngram))
+
+
+def test_batch_transcription(mandarin_gold, kamper_disc):
+    """ batch transcription should give the same result as transcribing
+    each interval separately"""
+    fnames, disc_ons, disc_offs = [], [], []
+    for fname, disc_on, disc_off, _, _ in kamper_disc.intervals:
+        # also check intervals whose edges cut through the phones
+        for delta in (0, 0.015, -0.03):
+            fnames.append(fname)
+            disc_ons.append(round(disc_on + delta, 4))
+            disc_offs.append(round(disc_off - delta, 4))
+
+    batch = kamper_disc.get_transcriptions(
+        fnames, disc_ons, disc_offs, mandarin_gold.phones)
+    for i, (fname, disc_on, disc_off) in enumerate(
+            zip(fnames, disc_ons, disc_offs)):
+        assert batch[i] == kamper_disc.get_transcription(
+            fname, disc_on, disc_off, mandarin_gold.phones), (
+                "batch and single transcriptions differ for {} {} {}".format(
+                    fname, disc_on, disc_off))
+
+
+def test_iter_clusters(mandarin_gold, kamper_disc):
+    """ reading the clusters one at a time should give the same clusters as
+    reading the whole file"""
+    stream_disc = Disc(kamper_disc.disc_path, mandarin_gold, stream=True)
+    assert stream_disc.clusters is None and stream_disc.intervals is None, (
+        "class file should not be read when streaming")
+
+    # use small batches to check the clusters are given in order across
+    # batches
+    clusters = list(stream_disc.iter_clusters(chunk_size=100))
+    assert [class_nb for class_nb, _ in clusters] == list(
+        kamper_disc.clusters), "clusters are not read in the same order"
+    for class_nb, intervals in clusters:
+        assert intervals == kamper_disc.clusters[class_nb], (
+            "cluster {} differs when read in streaming".format(class_nb))
+
+
+def test_iter_clusters_same_class(tmp_path):
+    class_file = tmp_path / "same_class.class"
+    class_file.write_text(
+        "Class 0\ns0101a 32.255 32.554\n\nClass 0\ns0101a 44.6 44.9\n\n")
+    disc = Disc(str(class_file), stream=True)
+    with pytest.raises(AssertionError) as err:
+        list(disc.iter_clusters())
+    assert 'same number' in str(err.value)
+
+
+def test_parse_class_block(kamper_disc, tmp_path):
+    """ the bulk parser should read the same clusters as the line by line
+    parser, and report the wrong lines"""
+    with open(kamper_disc.disc_path) as fin:
+        text = fin.read()
+    bulk = Disc.parse_class_block(text)
+    lines = Disc.parse_class_lines(text)
+    assert bulk[0] == lines[0]
+    assert bulk[1].tolist() == lines[1].tolist()
+    assert bulk[2].tolist() == lines[2].tolist()
+    assert bulk[3][0] == lines[3][0] and bulk[3][3] == lines[3][3]
+    assert bulk[3][1].tolist() == lines[3][1].tolist()
+    assert bulk[3][2].tolist() == lines[3][2].tolist()
+    assert bulk[4] == lines[4]
+
+    class_file = tmp_path / "wrong.class"
+    class_file.write_text(
+        "Class 0\ns0101a 32.255 32.554\n\nClass 1\ns0101a 44.9 44.6\n\n")
+    with pytest.raises(AssertionError) as err:
+        list(Disc(str(class_file), stream=True).iter_clusters())
+    assert 'line 5' in str(err.value)
+
+    class_file.write_text(
+        "Class 0\ns0101a 32.255 32.554\n\nClass 1\ns0101a 44.6\n\n")
+    with pytest.raises(ValueError) as err:
+        list(Disc(str(class_file), stream=True).iter_clusters())
+    assert 'Line 5' in str(err.value)
+
+
+def test_encoded_transcription(mandarin_gold, kamper_disc):
+    """ encoded ngrams should decode to the phones of the transcription"""
+    encoded = Disc(kamper_disc.disc_path, mandarin_gold, encoded=True)
+    vocabulary = encoded.vocabulary
+    assert len(encoded.intervals) == len(kamper_disc.intervals)
+    for class_nb in kamper_disc.clusters:
+        for interval, coded in zip(kamper_disc.clusters[class_nb],
+                                   encoded.clusters[class_nb]):
+            assert vocabulary.symbols(coded[4]) == interval[4]
+            assert tuple((on, off, vocabulary.ix2symbol[phn])
+                         for on, off, phn in coded[3]) == interval[3]
+
+
+def test_encoded_vocabulary(mandarin_gold, kamper_disc):
+    """ the ngrams of an evaluation should be interned in its own
+    vocabulary, the gold words keeping their type ids"""
+    vocabulary = mandarin_gold.word_index.vocabulary
+    size = len(vocabulary)
+    results = evaluate_results(mandarin_gold, kamper_disc.disc_path)
+    assert len(vocabulary) == size
+    assert results.scores == evaluate_results(
+        mandarin_gold, kamper_disc.disc_path).scores
+
+    encoded = Disc(kamper_disc.disc_path, mandarin_gold, encoded=True)
+    assert len(vocabulary) == size
+    assert len(encoded.vocabulary) > size
+    word_type = mandarin_gold.word_index.word_type[0]
+    assert encoded.vocabulary.intern(vocabulary.codes(word_type)) == \
+        word_type
+
+
+def test_compact(mandarin_gold, kamper_disc):
+    """ compact intervals should give the same tuples as the intervals"""
+    compact = Disc(kamper_disc.disc_path, mandarin_gold, compact=True)
+    assert len(compact.store) == sum(
+        len(cluster) for cluster in kamper_disc.clusters.values())
+    assert set(compact.intervals) == set(kamper_disc.intervals)
+    assert len(compact.intervals) == len(kamper_disc.intervals)
+    assert compact.clusters.keys() == kamper_disc.clusters.keys()
+    for class_nb in kamper_disc.clusters:
+        assert list(compact.clusters[class_nb]) == (
+            kamper_disc.clusters[class_nb])
+    cluster = compact.clusters[class_nb]
+    assert cluster[-1] == kamper_disc.clusters[class_nb][-1]
+    assert list(cluster[1:]) == kamper_disc.clusters[class_nb][1:]
@@ -0,0 +1,71 @@
+from tde.readers.disc_reader import Disc
+from tde.measures.ned import Ned
+from tde.measures.boundary import Boundary
+from tde.measures.grouping import Grouping
+from tde.measures.coverage import Coverage
+from tde.measures.token_type import TokenType
+from tde.evaluation import Evaluation
+
+
+def test_single_pass(mandarin_gold, kamper_disc):
+    """ measures fed in a single pass should be the same as measures
+    computed separately"""
+    stream_disc = Disc(kamper_disc.disc_path, mandarin_gold, stream=True)
+    boundary = Boundary(mandarin_gold, stream_disc)
+    grouping = Grouping(stream_disc)
+    token_type = TokenType(mandarin_gold, stream_disc)
+    coverage = Coverage(mandarin_gold, stream_disc)
+    ned = Ned(stream_disc)
+    evaluation = Evaluation(
+        mandarin_gold, [boundary, grouping, token_type, coverage, ned],
+        batch_size=1000)
+    evaluation.run(stream_disc.iter_clusters())
+    assert evaluation.n_intervals == len(kamper_disc.intervals)
+
+    boundary.compute_boundary()
+    ref = Boundary(mandarin_gold, kamper_disc)
+    ref.compute_boundary()
+    assert (boundary.precision, boundary.recall) == (
+        ref.precision, ref.recall)
+
+    grouping.compute_grouping()
+    ref = Grouping(kamper_disc)
+    ref.compute_grouping()
+    assert (grouping.precision, grouping.recall) == (
+        ref.precision, ref.recall)
+
+    token_type.compute_token_type()
+    ref = TokenType(mandarin_gold, kamper_disc)
+    ref.compute_token_type()
+    assert (token_type.precision, token_type.recall) == (
+        ref.precision, ref.recall)
+
+    coverage.compute_coverage()
+    ref = Coverage(mandarin_gold, kamper_disc)
+    ref.compute_coverage()
+    assert coverage.coverage == ref.coverage
+
+    ned.compute_ned()
+    ref = Ned(kamper_disc)
+    ref.compute_ned()
+    assert ned.n_pairs == ref.n_pairs
+    assert abs(ned.ned - ref.ned) < 1e-12
+
+
+def test_dominating_clusters(mandarin_gold, kamper_disc):
+    """ the clusters with most of the pairs should be reported"""
+    clusters = sorted(kamper_disc.clusters.items())
+    # a cluster much larger than the others
+    clusters.append(('large', [
+        interval for _, intervals in clusters for interval in intervals]))
+    evaluation = Evaluation(mandarin_gold, [], n_largest=3)
+    evaluation.run(clusters)
+
+    sizes = [len(intervals) for _, intervals in clusters]
+    assert evaluation.n_pairs == sum(size * (size - 1) // 2
+                                     for size in sizes)
+    dominating = evaluation.dominating_clusters(0.5)
+    assert [(class_number, size) for class_number, size, _ in dominating] == [
+        ('large', sizes[-1])]
+    assert dominating[0][2] > 0.5
+    assert len(evaluation.dominating_clusters(0)) == 3
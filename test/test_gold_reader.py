@@ -1,4 +1,9 @@
+import os
+import pickle
 import pytest
+import numpy as np
+
+from tde.readers.gold_reader import Gold
 
 
 def test_bad_file(gold_vad):
@@ -67,3 +72,148 @@ def test_silences_tree():
     # TODO: compare overlaps between vad/phn/word and silence: should be
     # None...
     pass
+
+
+def test_alignment_same_as_tree(mandarin_gold):
+    """ columnar alignment should contain the same intervals as the
+    interval trees, and return the same overlaps"""
+    phn_tree, _, _, _, _ = (
+        mandarin_gold.read_gold_intervalTree(mandarin_gold.phn_path, "phone"))
+    wrd_tree, _, _, _, _ = (
+        mandarin_gold.read_gold_intervalTree(mandarin_gold.wrd_path, "word"))
+
+    for tree, alignment in ((phn_tree, mandarin_gold.phones),
+                            (wrd_tree, mandarin_gold.words)):
+        assert set(tree) == set(alignment), (
+            "columnar alignment and interval tree contain different files")
+        for fname in tree:
+            assert set(tuple(iv) for iv in tree[fname]) == set(
+                alignment[fname]), (
+                    "different intervals for {}".format(fname))
+            # query ranges that start and stop inside, on and between
+            # the intervals
+            for on, off, _ in list(alignment[fname])[::50]:
+                for query in ((on, off), (on + 0.001, off + 0.5),
+                              (on - 0.02, on + 0.01), (off, off + 0.001)):
+                    assert set(tuple(iv) for iv in tree[fname].overlap(
+                        *query)) == alignment[fname].overlap(*query), (
+                            "different overlap for {} {}".format(
+                                fname, query))
+
+
+def test_alignment_boundaries(mandarin_gold):
+    _, _, _, _, wrd_boundaries = (
+        mandarin_gold.read_gold_intervalTree(mandarin_gold.wrd_path, "word"))
+    assert mandarin_gold.boundaries[0] == wrd_boundaries[0]
+    assert mandarin_gold.boundaries[1] == wrd_boundaries[1]
+
+
+def test_gold_cache(tmp_path):
+    """ gold read from the binary cache should be the same as gold read
+    from text, and the cache should not be used once the text changes"""
+    wrd_path = str(tmp_path / 'test.wrd')
+    phn_path = str(tmp_path / 'test.phn')
+    with open(wrd_path, 'w') as fout:
+        fout.write('s0101a 32.217 32.554 okay\n'
+                   's0101a 32.554 32.7 SIL\n'
+                   's0102a 1.0 1.3 um\n')
+    with open(phn_path, 'w') as fout:
+        fout.write('s0101a 32.217 32.255 ow\n'
+                   's0101a 32.255 32.395 k\n'
+                   's0101a 32.395 32.554 ey\n'
+                   's0101a 32.554 32.7 SIL\n'
+                   's0102a 1.0 1.2 ah\n'
+                   's0102a 1.2 1.3 m\n')
+    cache_dir = str(tmp_path / 'cache')
+
+    text_gold = Gold(wrd_path=wrd_path, phn_path=phn_path)
+    Gold(wrd_path=wrd_path, phn_path=phn_path, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2, "gold should have been cached"
+
+    cached_gold = Gold(wrd_path=wrd_path, phn_path=phn_path,
+                       cache_dir=cache_dir)
+    for fname in text_gold.phones:
+        assert list(cached_gold.phones[fname]) == list(
+            text_gold.phones[fname])
+    for fname in text_gold.words:
+        assert list(cached_gold.words[fname]) == list(
+            text_gold.words[fname])
+    assert cached_gold.boundaries == text_gold.boundaries
+
+    # modify the word alignment: it should be read again from text
+    with open(wrd_path, 'a') as fout:
+        fout.write('s0101a 50.0 50.5 spam\n')
+    new_gold = Gold(wrd_path=wrd_path, phn_path=phn_path,
+                    cache_dir=cache_dir)
+    assert 'spam' in new_gold.wrd2ix, "modified alignment was not read"
+    assert len(os.listdir(cache_dir)) == 3
+
+
+def test_gold_mmap(mandarin_gold, tmp_path):
+    """ memory mapped gold should be the same as gold read from text, and
+    be pickled as its path"""
+    cache_dir = str(tmp_path / 'cache')
+    with pytest.raises(ValueError):
+        Gold(wrd_path=mandarin_gold.wrd_path, phn_path=mandarin_gold.phn_path,
+             mmap=True)
+
+    mmap_gold = Gold(wrd_path=mandarin_gold.wrd_path,
+                     phn_path=mandarin_gold.phn_path,
+                     cache_dir=cache_dir, mmap=True)
+    for alignment, text_alignment in (
+            (mmap_gold.phones, mandarin_gold.phones),
+            (mmap_gold.words, mandarin_gold.words)):
+        assert isinstance(alignment.onset.base, np.memmap), (
+            "alignment should be memory mapped")
+        assert alignment.fnames == text_alignment.fnames
+        assert alignment.ix2symbol == text_alignment.ix2symbol
+        for name in ('file_offsets', 'onset', 'offset', 'symbol',
+                     'max_offset'):
+            assert np.array_equal(getattr(alignment, name),
+                                  getattr(text_alignment, name))
+
+        unpickled = pickle.loads(pickle.dumps(alignment))
+        assert unpickled.path == alignment.path
+        assert isinstance(unpickled.onset.base, np.memmap)
+    assert mmap_gold.boundaries == mandarin_gold.boundaries
+
+
+def test_word_index(mandarin_gold):
+    """ the interned transcription of each word should be the phones
+    overlapping it"""
+    words, phones = mandarin_gold.words, mandarin_gold.phones
+    index = mandarin_gold.word_index
+    for wrd_ix in range(0, words.n_intervals, 97):
+        fname = words.fnames[np.searchsorted(
+            words.file_offsets, wrd_ix, 'right') - 1]
+        trs = tuple(phn for _, _, phn in phones.intervals(phones.overlap(
+            fname, words.onset[wrd_ix], words.offset[wrd_ix])))
+        assert index.transcription(wrd_ix) == trs
+        assert index.get_type(trs) == index.word_type[wrd_ix]
+    assert index.get_type(('not', 'a', 'word')) == -1
+
+
+def test_bulk_read(mandarin_gold, tmp_path):
+    """ the bulk parser should read the same alignment as the line by line
+    parser, and report the wrongly formated lines"""
+    for path, symbol_type in [(mandarin_gold.phn_path, 'phone'),
+                              (mandarin_gold.wrd_path, 'word')]:
+        bulk = mandarin_gold.read_gold_alignment(path, symbol_type)
+        lines = Gold.read_gold_lines(path, symbol_type)
+        assert bulk.fnames == lines.fnames
+        assert bulk.ix2symbol == lines.ix2symbol
+        for array in ['file_offsets', 'onset', 'offset', 'symbol']:
+            assert np.array_equal(getattr(bulk, array), getattr(lines, array))
+
+    bad_path = str(tmp_path / 'bad.phn')
+    with open(bad_path, 'w') as fout:
+        fout.write('s01 0.0 0.5 a\ns01 0.5 1.0\n')
+    with pytest.raises(ValueError) as err:
+        mandarin_gold.read_gold_alignment(bad_path, 'phone')
+    assert 'line 2' in str(err.value)
+
+    with open(bad_path, 'w') as fout:
+        fout.write('s01 0.0 0.5 a\ns01 0.5 1.0 b\ns01 1.0 1.0 c\n')
+    with pytest.raises(AssertionError) as err:
+        mandarin_gold.read_gold_alignment(bad_path, 'phone')
+    assert 'line 3' in str(err.value)
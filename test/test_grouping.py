@@ -1,6 +1,32 @@
+from types import SimpleNamespace
+from itertools import combinations
+from collections import defaultdict
+
+from tde.utils import overlap
 from tde.measures.grouping import Grouping
 
 
+def gold_pairs(intervals):
+    """ all the pairs of intervals with the same ngram that don't overlap,
+    built one by one as a reference, ordered by filename and onset"""
+    same = defaultdict(set)
+    for interval in intervals:
+        same[interval[4]].add(interval)
+    return {tuple(sorted((f1, f2), key=lambda f: (f[0], f[1])))
+            for ngram in same
+            for f1, f2 in combinations(same[ngram], 2)
+            if not (f1[0] == f2[0]
+                    and overlap((f1[1], f1[2]), (f2[1], f2[2]))[0] > 0)}
+
+
+def found_pairs(clusters):
+    """ all the pairs of intervals of the same cluster, built one by one as
+    a reference, ordered by filename and onset"""
+    return {tuple(sorted((f1, f2), key=lambda f: (f[0], f[1])))
+            for intervals in clusters.values()
+            for f1, f2 in combinations(intervals, 2)}
+
+
 def test_same_pairs_and_class(disc_clusters, disc_pairs):
     """ results should be the same if given in pairs or in clusters"""
     group_clusters = Grouping(disc_clusters)
@@ -44,3 +70,67 @@ def test_weights(disc_clusters):
         "'cassoulet' has 2 tokens out of 6 in pairs in good_pairs")
     assert weights_overlap['tambour'] == 2/4, (
         "'tambour' has 2 tokens out of 4 in overlap_pairs")
+
+
+def test_counts_same_as_pairs(kamper_disc):
+    """ counting the tokens of each group should give the same counters as
+    building all the pairs"""
+    clusters = {class_nb: kamper_disc.clusters[class_nb]
+                for class_nb in list(kamper_disc.clusters)[:300]}
+    disc = SimpleNamespace(
+        clusters=clusters,
+        intervals=list({interval for class_nb in clusters
+                        for interval in clusters[class_nb]}))
+
+    group = Grouping(disc)
+    group.compute_grouping()
+
+    gold, found = gold_pairs(disc.intervals), found_pairs(clusters)
+    gold_weights, gold_counter = Grouping.get_weights(gold)
+    found_weights, found_counter = Grouping.get_weights(found)
+    _, found_gold_counter = Grouping.get_weights(found.intersection(gold))
+
+    assert group.gold_types == {f1[4] for f1, f2 in gold}
+    assert group.found_types == {
+        ngram for intervals in clusters.values() if len(intervals) > 1
+        for _, _, _, _, ngram in intervals}
+    assert group.gold_counter == gold_counter
+    assert group.found_counter == found_counter
+    assert group.found_gold_counter == found_gold_counter
+    assert group.gold_weights == gold_weights
+    assert group.found_weights == found_weights
+
+
+def test_overlapping_pairs():
+    """ intervals of the same file only form a gold pair if they don't
+    overlap"""
+    ngram = ('t', 'a')
+    overlapping = [('s01', 1.0, 2.0, ((1.0, 2.0, 'ta'),), ngram),
+                   ('s01', 1.5, 2.5, ((1.5, 2.5, 'ta'),), ngram),
+                   ('s01', 1.8, 2.2, ((1.8, 2.2, 'ta'),), ngram)]
+    assert Grouping.get_paired(overlapping) == []
+
+    disjoint = overlapping + [('s01', 2.4, 3.0, ((2.4, 3.0, 'ta'),), ngram)]
+    assert Grouping.get_paired(disjoint) == [
+        disjoint[0], disjoint[2], disjoint[3]]
+
+    other_file = overlapping + [('s02', 1.0, 2.0, ((1.0, 2.0, 'ta'),), ngram)]
+    assert Grouping.get_paired(other_file) == other_file
+
+
+def test_njobs(kamper_disc):
+    """ splitting the types between several processes should give exactly
+    the same scores"""
+    disc = SimpleNamespace(
+        clusters=dict(list(kamper_disc.clusters.items())[:300]))
+    disc.intervals = list({interval for cluster in disc.clusters.values()
+                           for interval in cluster})
+    serial = Grouping(disc, njobs=1)
+    serial.compute_grouping()
+    parallel = Grouping(disc, njobs=2)
+    parallel.compute_grouping()
+
+    assert parallel.gold_counter == serial.gold_counter
+    assert parallel.found_gold_counter == serial.found_gold_counter
+    assert parallel.precision == serial.precision
+    assert parallel.recall == serial.recall
@@ -0,0 +1,50 @@
+import sys
+import subprocess
+
+from tde.corpora import share_path
+
+
+# the dependencies that the command line should not import when they are
+# not needed
+HEAVY = ('pandas', 'joblib', 'intervaltree', 'pkg_resources', 'editdistance')
+
+
+def _imported(code):
+    """ Run python code in a new interpreter, and return the heavy modules
+    it imported"""
+    code += ('\nimport sys\nprint("imported:", '
+             '*[m for m in {} if m in sys.modules])')
+    result = subprocess.run(
+        [sys.executable, '-c', code.format(HEAVY)],
+        stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    return result.stdout.splitlines()[-1].split()[1:]
+
+
+def test_help_imports():
+    """ the help of tde.eval should not import numpy nor any dependency"""
+    code = '\n'.join([
+        'import sys',
+        'sys.argv = ["tde", "--help"]',
+        'from tde.eval import main',
+        'try:',
+        '    main()',
+        'except SystemExit:',
+        '    pass',
+        'assert "numpy" not in sys.modules'])
+    assert _imported(code) == []
+
+
+def test_single_measure_imports(tmp_path):
+    """ evaluating only the coverage, with a cached gold, should not import
+    the dependencies of the other measures nor the text parsers"""
+    code = '\n'.join([
+        'import sys',
+        'sys.argv = ["tde", {!r}, "mandarin", {!r}, "-m", "coverage",',
+        '            "--cache-dir", {!r}]',
+        'from tde.eval import main',
+        'main()']).format(
+            share_path('kamper_mandarin.class'), str(tmp_path),
+            str(tmp_path / 'cache'))
+    # the first evaluation parses the gold and fills the cache
+    _imported(code)
+    assert _imported(code) == []
@@ -0,0 +1,61 @@
+from tde.readers.disc_reader import Disc
+from tde.measures.ned import Ned
+from tde.measures.boundary import Boundary
+from tde.measures.grouping import Grouping
+from tde.measures.coverage import Coverage
+from tde.measures.token_type import TokenType
+from tde.incremental import IncrementalEvaluation
+
+
+def _measures(gold, disc):
+    return {'boundary': Boundary(gold, disc),
+            'grouping': Grouping(disc),
+            'token/type': TokenType(gold, disc),
+            'coverage': Coverage(gold, disc),
+            'ned': Ned(disc)}
+
+
+def _check_scores(gold, disc_path, measures):
+    disc = Disc(disc_path, gold)
+    ref = _measures(gold, disc)
+    ref['boundary'].compute_boundary()
+    ref['grouping'].compute_grouping()
+    ref['token/type'].compute_token_type()
+    ref['coverage'].compute_coverage()
+    ref['ned'].compute_ned()
+
+    for name in ('boundary', 'grouping', 'token/type'):
+        assert (measures[name].precision, measures[name].recall) == (
+            ref[name].precision, ref[name].recall)
+    assert measures['coverage'].coverage == ref['coverage'].coverage
+    assert measures['ned'].n_pairs == ref['ned'].n_pairs
+    assert abs(measures['ned'].ned - ref['ned'].ned) < 1e-12
+
+
+def test_incremental(mandarin_gold, kamper_disc, tmp_path):
+    """ measures computed from the state of a previous evaluation should be
+    the same as measures computed on the whole class file"""
+    state_path = str(tmp_path / 'eval.state')
+    disc = Disc(kamper_disc.disc_path, mandarin_gold, stream=True)
+    measures = _measures(mandarin_gold, disc)
+    evaluation = IncrementalEvaluation(mandarin_gold, measures, state_path)
+    evaluation.run(kamper_disc.disc_path)
+    _check_scores(mandarin_gold, kamper_disc.disc_path, measures)
+
+    # remove one cluster in three, and move a cluster to a new class
+    # number while cutting its first copy
+    with open(kamper_disc.disc_path) as fin:
+        classes = fin.read().strip('\n').split('\n\n')
+    modified = [lines for ix, lines in enumerate(classes) if ix % 3 != 0]
+    modified.append('Class 1000000\n' + classes[1].split('\n', 1)[1])
+    modified[0] = '\n'.join(modified[0].split('\n')[:-1])
+    modified_path = str(tmp_path / 'modified.class')
+    with open(modified_path, 'w') as fout:
+        fout.write('\n\n'.join(modified) + '\n\n')
+
+    measures = _measures(mandarin_gold, disc)
+    evaluation = IncrementalEvaluation(mandarin_gold, measures, state_path)
+    evaluation.run(modified_path)
+    assert evaluation.n_evaluated == 1
+    assert evaluation.n_removed == len(classes[::3])
+    _check_scores(mandarin_gold, modified_path, measures)
@@ -1,3 +1,10 @@
+import numpy as np
+from types import SimpleNamespace
+from itertools import combinations
+from collections import Counter
+
+from tde.readers.disc_reader import Disc
+from tde.measures import ned as ned_module
 from tde.measures.ned import Ned
 
 
@@ -5,3 +12,144 @@ def test_gold_pairs(gold, gold_disc_pairs):
     n = Ned(gold_disc_pairs)
     n.compute_ned()
     assert n.ned == 0, "gold pairs should have a ned of 0"
+
+
+def test_ned_update(mandarin_gold, kamper_disc):
+    """ ned computed cluster by cluster should be the same as ned computed
+    on all the clusters"""
+    n = Ned(kamper_disc)
+    n.compute_ned()
+
+    stream_disc = Disc(kamper_disc.disc_path, mandarin_gold, stream=True)
+    n_stream = Ned(stream_disc)
+    for class_nb, intervals in stream_disc.iter_clusters():
+        n_stream.update(intervals)
+    n_stream.compute_ned()
+
+    assert n_stream.n_pairs == n.n_pairs
+    assert n_stream.ned == n.ned
+
+
+def test_ned_multiplicity():
+    """ ned computed on distinct ngrams weighted by their count should be
+    the same as ned computed on all the pairs"""
+    ngrams = [('a', 'b'), ('a', 'b'), ('a', 'SIL', 'b'), ('b', 'c', 'd'),
+              ('SIL',), ('SIL',), ('a', 'b'), ('b',)]
+    cluster = [('s01', float(ix), ix + 0.5, None, ngram)
+               for ix, ngram in enumerate(ngrams)]
+    pairs = [Ned.pairwise_ned(ngram1, ngram2)
+             for ngram1, ngram2 in combinations(ngrams, 2)]
+
+    n = Ned(SimpleNamespace(clusters={'1': cluster}))
+    n.compute_ned()
+    assert n.n_pairs == len(pairs)
+    assert abs(n.ned - sum(pairs) / len(pairs)) < 1e-12
+
+
+def test_ned_njobs(kamper_disc):
+    """ ned computed in several processes should be the same as ned computed
+    in one process"""
+    n = Ned(kamper_disc)
+    n.compute_ned()
+    n_parallel = Ned(kamper_disc, njobs=2)
+    n_parallel.compute_ned()
+
+    assert n_parallel.n_pairs == n.n_pairs
+    assert abs(n_parallel.ned - n.ned) < 1e-12
+
+
+def test_batch_ned():
+    """ vectorized ned of integer coded ngrams should be the same as
+    pairwise_ned"""
+    rng = np.random.RandomState(0)
+    ngrams = [tuple(rng.randint(0, 4, size=rng.randint(0, 7)).tolist())
+              for _ in range(60)]
+    ix1, ix2 = np.triu_indices(len(ngrams), 1)
+    expected = [Ned.pairwise_ned(ngrams[i], ngrams[j])
+                for i, j in zip(ix1, ix2)]
+    assert Ned.batch_ned(ngrams, ix1, ix2).tolist() == expected
+
+
+def test_ned_large_cluster():
+    """ a cluster with more pairs than a batch should be computed by blocks,
+    with the same sum as cluster_ned"""
+    rng = np.random.RandomState(1)
+    counts = Counter(tuple(rng.randint(0, 5, size=rng.randint(0, 6)).tolist())
+                     for _ in range(300))
+    small = Counter({(1, 2): 3, (2,): 1})
+    expected = [Ned.cluster_ned(small), Ned.cluster_ned(counts)]
+
+    for batch_size in (1, 7, 100, 10 ** 6):
+        ned_sum, n_pairs = Ned.sum_ned([small, counts, small], encoded=True,
+                                       batch_size=batch_size)
+        assert n_pairs == expected[0][1] * 2 + expected[1][1]
+        assert abs(ned_sum - expected[0][0] * 2 - expected[1][0]) < 1e-6
+
+    # the same cluster, with phone symbols
+    symbols = Counter({tuple('abcde'[code] for code in ngram): count
+                       for ngram, count in counts.items()})
+    for block_size in (1, 100, 10 ** 6):
+        ned_sum, n_pairs = Ned.cluster_ned(symbols, dict(), block_size)
+        assert n_pairs == expected[1][1]
+        assert abs(ned_sum - expected[1][0]) < 1e-6
+
+    for n in (0, 1, 2, 30):
+        blocks = list(Ned.pair_blocks(n, 10))
+        first, second = np.triu_indices(n, 1)
+        assert np.concatenate(
+            [[]] + [block[0] for block in blocks]).tolist() == first.tolist()
+        assert np.concatenate(
+            [[]] + [block[1] for block in blocks]).tolist() == second.tolist()
+
+
+def test_ned_memo(monkeypatch):
+    """ the memo of the ned should stay below its size, and not be used for
+    large clusters, without changing the sums"""
+    monkeypatch.setattr(ned_module, 'MEMO_SIZE', 20)
+    rng = np.random.RandomState(2)
+    clusters = [Counter(tuple(rng.randint(0, 4, size=rng.randint(1, 4)))
+                        for _ in range(size)) for size in (5, 8, 40, 5)]
+    memo = dict()
+    for counts in clusters:
+        n_memo = len(memo)
+        assert Ned.cluster_ned(counts, memo) == Ned.cluster_ned(counts)
+        assert len(memo) <= 20
+        if len(counts) * (len(counts) - 1) // 2 > 20:
+            assert len(memo) == n_memo
+
+
+def test_ned_encoded(mandarin_gold, kamper_disc):
+    """ ned should be the same with integer coded phones"""
+    n = Ned(kamper_disc)
+    n.compute_ned()
+    n_encoded = Ned(Disc(kamper_disc.disc_path, mandarin_gold, encoded=True))
+    n_encoded.compute_ned()
+
+    assert n_encoded.n_pairs == n.n_pairs
+    assert abs(n_encoded.ned - n.ned) < 1e-12
+
+
+def test_ned_approximate(mandarin_gold, kamper_disc):
+    """ the estimated ned should be exact when the budget covers all the
+    pairs, and its confidence interval should contain the exact ned"""
+    n = Ned(kamper_disc)
+    n.compute_ned()
+
+    n_exact = Ned(kamper_disc, budget=10 ** 9)
+    n_exact.compute_ned()
+    assert n_exact.n_pairs == n.n_pairs
+    assert abs(n_exact.ned - n.ned) < 1e-12
+    assert abs(n_exact.ned_interval[0] - n.ned) < 1e-12
+    assert abs(n_exact.ned_interval[1] - n.ned) < 1e-12
+
+    stream_disc = Disc(kamper_disc.disc_path, mandarin_gold, stream=True,
+                       encoded=True)
+    n_sampled = Ned(stream_disc, budget=2000, seed=3)
+    for class_nb, intervals in stream_disc.iter_clusters():
+        n_sampled.update(intervals)
+    n_sampled.compute_ned()
+    assert n_sampled.n_pairs == n.n_pairs
+    low, high = n_sampled.ned_interval
+    assert low < n_sampled.ned < high
+    assert low <= n.ned <= high
+    assert high - low < 0.05
@@ -0,0 +1,90 @@
+import io
+import pstats
+
+import pytest
+
+from tde import progress
+from tde.progress import Progress
+from tde.batch import evaluate_results
+
+
+def test_progress_events(mandarin_gold, kamper_disc):
+    """ the callbacks should receive the progress of the tasks and the end
+    of each stage, without changing the scores"""
+    events = []
+    stream = io.StringIO()
+    reporter = Progress(callbacks=[events.append], stream=stream,
+                        interval=0)
+    results = evaluate_results(mandarin_gold, kamper_disc.disc_path,
+                               ['grouping', 'ned'], progress=reporter)
+    reference = evaluate_results(mandarin_gold, kamper_disc.disc_path,
+                                 ['grouping', 'ned'])
+    assert results.scores == reference.scores
+
+    assert [event.stage for event in events if event.kind == 'end'] == [
+        'disc', 'grouping', 'ned']
+    assert list(reporter.stages) == ['disc', 'grouping', 'ned']
+    tasks = {(event.stage, event.task): event for event in events
+             if event.kind == 'progress'}
+    assert ('disc', 'class file') in tasks
+    assert ('grouping', 'clusters') in tasks
+    assert ('ned', 'pairs') in tasks
+
+    # the last report of a task is done when all its units are done
+    for event in tasks.values():
+        assert event.done == event.total
+        assert event.eta == 0
+    assert '[ned] ' in stream.getvalue()
+
+
+def test_progress_inactive():
+    """ outside of a stage, the tasks report nothing"""
+    with progress.task('pairs', total=10) as task:
+        task.advance(10)
+        progress.advance(1)
+    assert task.progress is None
+    assert task.done == 10
+
+
+def test_progress_silent_abort():
+    """ a silent Progress writes nothing, and a callback can stop the
+    evaluation"""
+    def abort(event):
+        if event.kind == 'progress' and event.done > 5:
+            raise RuntimeError('too long')
+
+    stream = io.StringIO()
+    reporter = Progress(callbacks=[abort], silent=True, stream=stream,
+                        interval=0)
+    with pytest.raises(RuntimeError):
+        with reporter.stage('ned'):
+            with progress.task('pairs', total=10) as task:
+                for _ in range(10):
+                    task.advance()
+    assert stream.getvalue() == ''
+    assert progress._active is None
+
+
+def test_progress_profile(mandarin_gold, kamper_disc, tmp_path):
+    """ the profile of the chosen stage should be written"""
+    profile_output = str(tmp_path / 'grouping.prof')
+    reporter = Progress(silent=True, profile='grouping',
+                        profile_output=profile_output)
+    evaluate_results(mandarin_gold, kamper_disc.disc_path, ['grouping'],
+                     progress=reporter)
+    stats = pstats.Stats(profile_output)
+    assert any(function == 'compute_grouping'
+               for _, _, function in stats.stats)
+
+
+def test_progress_reset_memory(monkeypatch):
+    """ the peak memory of the process is only reset when asked"""
+    resets = []
+    monkeypatch.setattr(progress, 'reset_peak_memory',
+                        lambda: resets.append(True))
+    with Progress(silent=True).stage('disc'):
+        pass
+    assert resets == []
+    with Progress(silent=True, reset_memory=True).stage('disc'):
+        pass
+    assert resets == [True]
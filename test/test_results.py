@@ -0,0 +1,50 @@
+import csv
+import json
+import hashlib
+
+from tde.readers.disc_reader import Disc
+from tde.evaluation import Evaluation, select_measures, compute_measures
+from tde.results import Results, Stages
+
+
+def test_results(mandarin_gold, kamper_disc, tmp_path):
+    """ the results document should contain the scores, the counts and the
+    stages of the evaluation, in json and csv"""
+    stages = Stages()
+    disc = Disc(kamper_disc.disc_path, mandarin_gold, stream=True)
+    selected = select_measures(mandarin_gold, disc, ['ned', 'grouping'])
+    with stages.stage('disc'):
+        evaluation = Evaluation(mandarin_gold, selected.values())
+        evaluation.run(disc.iter_clusters())
+    with stages.stage('measures'):
+        compute_measures(selected)
+    results = Results.from_measures(
+        selected, 'mandarin', kamper_disc.disc_path, evaluation.n_clusters,
+        evaluation.n_intervals, stages)
+
+    results.write(str(tmp_path), ['json', 'csv'])
+    with open(str(tmp_path / 'results.json')) as fin:
+        document = json.load(fin)
+    with open(kamper_disc.disc_path, 'rb') as fin:
+        assert document['class_file_sha1'] == hashlib.sha1(
+            fin.read()).hexdigest()
+    assert document['corpus'] == 'mandarin'
+    assert document['scores']['ned'] == selected['ned'].ned
+    assert document['counts']['ned_n_pairs'] == selected['ned'].n_pairs
+    assert document['counts']['n_intervals'] == len(kamper_disc.intervals)
+    assert document['counts']['n_clusters'] == len(kamper_disc.clusters)
+    assert list(document['stages']) == ['disc', 'measures']
+    assert document['stages']['disc']['wall_time'] > 0
+
+    with open(str(tmp_path / 'results.csv')) as fin:
+        table = list(csv.DictReader(fin))
+    assert len(table) == 1
+    assert float(table[0]['grouping_precision']) == (
+        selected['grouping'].precision)
+    assert 'measures_peak_memory' in table[0]
+
+
+def test_results_nan():
+    """ undefined scores are written as null in json"""
+    results = Results(scores={'ned': float('nan')})
+    assert results.to_dict()['scores']['ned'] is None
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from tde.measures.ned import Ned
+from tde.server import make_server, request_scores, request_corpora
+from tde.server import _init_worker, _evaluate_request, _request
+
+
+@pytest.fixture(params=['tcp', 'unix'])
+def server(request, mandarin_gold, tmp_path):
+    """ evaluation server of the mandarin gold, on a free localhost port
+    or on a Unix socket"""
+    socket_path = str(tmp_path / 'tde.sock') if request.param == 'unix' \
+        else None
+    server = make_server({'mandarin': mandarin_gold}, njobs=2, port=0,
+                         socket_path=socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    if socket_path is not None:
+        address = {'socket_path': socket_path}
+    else:
+        address = {'port': server.server_address[1]}
+    yield server, address
+    server.shutdown()
+    server.server_close()
+    server.pool.terminate()
+
+
+def test_server(server, kamper_disc):
+    """ scores given by the server should be the same as scores computed
+    directly, for a class file given by path or by content"""
+    server, address = server
+    assert request_corpora(**address) == ['mandarin']
+    ned = Ned(kamper_disc)
+    ned.compute_ned()
+
+    scores = request_scores('mandarin', class_file=kamper_disc.disc_path,
+                            measures=['ned', 'coverage'], **address)
+    assert sorted(scores) == ['coverage', 'ned']
+    assert abs(scores['ned'] - ned.ned) < 1e-12
+
+    with open(kamper_disc.disc_path) as fin:
+        classes = fin.read()
+    assert request_scores('mandarin', classes=classes,
+                          measures=['ned', 'coverage'], **address) == scores
+
+    with pytest.raises(ValueError, match='corpus not loaded'):
+        request_scores('english', classes=classes, **address)
+    with pytest.raises(ValueError, match='File Not Found'):
+        request_scores('mandarin', class_file='missing.class', **address)
+
+
+def test_server_address(mandarin_gold, tmp_path):
+    """ the server should not replace a file that is not a socket, nor
+    listen on another address than a loopback one unless allowed"""
+    path = tmp_path / 'tde.sock'
+    path.write_text('not a socket')
+    with pytest.raises(ValueError, match='not a socket'):
+        make_server({'mandarin': mandarin_gold}, socket_path=str(path))
+    assert path.read_text() == 'not a socket'
+
+    with pytest.raises(ValueError, match='not a loopback address'):
+        make_server({'mandarin': mandarin_gold}, host='0.0.0.0', port=0)
+
+
+def test_server_gold_unchanged(server, mandarin_gold, kamper_disc,
+                               ZR17_disc):
+    """ the requests should not grow the gold kept by the workers"""
+    server, address = server
+    vocabulary = mandarin_gold.word_index.vocabulary
+    size = len(vocabulary)
+    # the evaluation of the workers, in this process to see their gold
+    _init_worker({'mandarin': mandarin_gold})
+    for disc_path in (kamper_disc.disc_path, ZR17_disc.disc_path,
+                      kamper_disc.disc_path):
+        status, scores = _evaluate_request(
+            {'corpus': 'mandarin', 'class_file': disc_path})
+        assert status == 200
+        assert sorted(request_scores('mandarin', class_file=disc_path,
+                                     **address)) == sorted(scores)
+        assert len(vocabulary) == size
+
+
+@pytest.mark.parametrize('fields', [
+    {'classes': 123}, {'class_file': ['epoch1.class']},
+    {'classes': '', 'measures': 5}, {'classes': '', 'measures': [5]}])
+def test_server_wrong_types(server, mandarin_gold, fields):
+    """ a request with fields of the wrong type should be answered with an
+    error"""
+    server, address = server
+    request = dict(corpus='mandarin', **fields)
+    with pytest.raises(ValueError, match='TypeError'):
+        _request('POST', '/evaluate', request, '127.0.0.1',
+                 address.get('port'), address.get('socket_path'), None)
+
+    # and in the worker, if the request wasn't checked
+    _init_worker({'mandarin': mandarin_gold})
+    status, response = _evaluate_request(request)
+    assert status == 400
+    assert 'error' in response